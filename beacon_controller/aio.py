@@ -0,0 +1,237 @@
+"""
+Serves the beacon API with aiohttp instead of connexion when `server: aiohttp`
+is set in config.yaml. The routes and their parameters are read from the same
+swagger.yaml as the connexion server, and the responses are built from the
+same swagger_server models by the same controller functions, only the backend
+queries and the citation lookups of /statements/{statement_id} are awaited
+rather than run in a thread. Whatever may still block, like the first load of
+the summaries, the prefix map or the biolink model that the controller
+functions rely on, runs in the event loop's default executor. Requires the
+aiohttp package.
+"""
+import os
+import json
+import yaml
+import asyncio
+import logging
+
+import aiohttp
+from aiohttp import web
+
+import swagger_server
+from swagger_server.models.beacon_statement_citation import BeaconStatementCitation
+
+import beacon_controller.database as db
+from beacon_controller import utils, summaries, metrics
+from beacon_controller.backends import backend
+from beacon_controller.backends.backend import in_thread
+from beacon_controller.result_cache import cache, concepts_key, statements_key, exact_matches_key, CONCEPTS, STATEMENTS, EXACT_MATCHES
+from beacon_controller.controllers import metadata_controller, concepts_controller, statements_controller
+from beacon_controller.controllers.statements_controller import EUTILS_URL, EUTILS_TIMEOUT
+from beacon_controller.warmup import warmup
+
+logger = logging.getLogger(__file__)
+
+SPECIFICATION = os.path.join(os.path.dirname(swagger_server.__file__), 'swagger', 'swagger.yaml')
+
+# Separators of the swagger 2.0 collection formats, "multi" instead repeats the
+# parameter once per item
+SEPARATORS = {
+    'csv': ',',
+    'ssv': ' ',
+    'tsv': '\t',
+    'pipes': '|',
+}
+
+
+async def get_concept_categories():
+    s = await in_thread(metadata_controller.snapshot)
+    return s.categories
+
+
+async def get_knowledge_map():
+    s = await in_thread(metadata_controller.snapshot)
+    return s.knowledge_map
+
+
+async def get_predicates():
+    s = await in_thread(metadata_controller.snapshot)
+    return s.predicates
+
+
+async def get_namespaces():
+    s = await in_thread(metadata_controller.snapshot)
+    if s.namespaces_missing:
+        summaries.generate_in_background(metadata_controller.generate_namespace_summary)
+    return s.namespaces
+
+
+async def get_concept_details(concept_id):
+    results = await backend().async_concept_details(concept_id)
+    return await in_thread(concepts_controller.concept_details, results)
+
+
+async def get_concepts(keywords=None, categories=None, offset=None, size=None):
+    key = concepts_key(keywords, categories, offset, size)
+    rows = await cache.async_cached(CONCEPTS, key, lambda: backend().async_concepts(keywords, categories, offset, size))
+    return await in_thread(concepts_controller.concepts, rows)
+
+
+async def get_exact_matches_to_concept_list(c):
+    c = await in_thread(lambda: [utils.fix_curie(curie) for curie in c])
+
+    results = await cache.async_cached(EXACT_MATCHES, exact_matches_key(c), lambda: backend().async_exact_matches(c))
+    return await in_thread(concepts_controller.exact_matches, c, results)
+
+
+async def get_statements(s=None, s_keywords=None, s_categories=None, edge_label=None, relation=None, t=None, t_keywords=None, t_categories=None, offset=None, size=None):
+    parameters = (s, s_keywords, s_categories, edge_label, relation, t, t_keywords, t_categories, offset, size)
+    results = await cache.async_cached(STATEMENTS, statements_key(*parameters), lambda: backend().async_statements(*parameters))
+    return await in_thread(statements_controller.statements, results)
+
+
+async def get_statement_details(statement_id, keywords=None, offset=None, size=None):
+    results = await backend().async_statement_details(statement_id)
+
+    for result in results:
+        publications = statements_controller.publications(result['relation'])
+        async with aiohttp.ClientSession() as session:
+            citations = await asyncio.gather(*[build_evidence(session, p) for p in publications])
+        return await in_thread(statements_controller.statement_details, statement_id, result, citations)
+
+
+async def build_evidence(session, publication_id):
+    """
+    Like statements_controller.build_evidence, but looks up all of a
+    statement's publications at the same time
+    """
+    curie = statements_controller.publication_curie(publication_id)
+
+    if curie is None:
+        return BeaconStatementCitation(
+            id=publication_id
+        )
+
+    prefix, local_id = curie
+
+    try:
+        params = dict(db=prefix, id=local_id, retmode='json')
+        timeout = aiohttp.ClientTimeout(total=EUTILS_TIMEOUT)
+        async with session.get(EUTILS_URL, params=params, timeout=timeout) as response:
+            if response.status == 200:
+                d = await response.json(content_type=None)
+                summary = d.get('result', {}).get(local_id, {})
+            else:
+                summary = {}
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+        summary = {}
+
+    return statements_controller.citation(prefix, local_id, summary)
+
+
+def cast(kind:str, value:str, name:str):
+    if kind == 'integer':
+        try:
+            return int(value)
+        except ValueError:
+            raise web.HTTPBadRequest(text=f'Parameter {name} must be an integer, got {value!r}')
+    return value
+
+
+def parameter(request:web.Request, definition:dict):
+    """
+    Reads a parameter of the request as described by its swagger definition
+    """
+    name = definition['name']
+
+    if definition['in'] == 'path':
+        values = [request.match_info[name]]
+    else:
+        values = request.query.getall(name, [])
+
+    if values == []:
+        if definition.get('required', False):
+            raise web.HTTPBadRequest(text=f'Missing required parameter {name}')
+        return None
+
+    if definition.get('type') == 'array':
+        collection_format = definition.get('collectionFormat', 'csv')
+        if collection_format != 'multi':
+            values = [item for value in values for item in value.split(SEPARATORS[collection_format])]
+        kind = definition.get('items', {}).get('type')
+        return [cast(kind, value, name) for value in values]
+    else:
+        return cast(definition.get('type'), values[-1], name)
+
+
+def respond(request:web.Request, serialized:metadata_controller.SerializedResponse) -> web.Response:
+    """
+    The aiohttp counterpart of metadata_controller.respond
+    """
+    gzipped = metadata_controller.accepts_gzip(request.headers.get('Accept-Encoding', ''))
+    etag = serialized.etag + '-gzip' if gzipped else serialized.etag
+
+    if metadata_controller.etag_matches(etag, request.headers.get('If-None-Match', '')):
+        response = web.Response(status=304)
+    elif gzipped:
+        response = web.Response(body=serialized.gzipped, content_type='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = web.Response(body=serialized.body, content_type='application/json')
+
+    response.headers['ETag'] = f'"{etag}"'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def handler(operation, definitions:list):
+    async def handle(request:web.Request) -> web.Response:
+        kwargs = {d['name']: parameter(request, d) for d in definitions}
+        result = await operation(**kwargs)
+
+        if isinstance(result, metadata_controller.SerializedResponse):
+            return respond(request, result)
+
+        body = json.dumps(result, cls=metadata_controller.JSONEncoder)
+        return web.Response(text=body, content_type='application/json')
+
+    return handle
+
+
+async def ready(request:web.Request) -> web.Response:
+    status = warmup.status()
+    status['database'] = db.stats()
+    status['result_cache'] = cache.stats()
+    return web.json_response(status, status=200 if status['ready'] else 503)
+
+
+async def metrics_endpoint(request:web.Request) -> web.Response:
+    return web.Response(body=metrics.render().encode(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+def application(base_path:str) -> web.Application:
+    """
+    Builds an aiohttp application with a route for every operation of
+    swagger.yaml, under the given base path
+    """
+    with open(SPECIFICATION) as f:
+        specification = yaml.safe_load(f)
+
+    operations = globals()
+    app = web.Application()
+
+    for path, methods in specification['paths'].items():
+        for method, definition in methods.items():
+            operation = operations[definition['operationId']]
+            route = base_path.rstrip('/') + path
+            app.router.add_route(method.upper(), route, handler(operation, definition.get('parameters', [])))
+
+    app.router.add_get(base_path + 'ready', ready)
+    app.router.add_get(base_path + 'metrics', metrics_endpoint)
+
+    return app
+
+
+def serve(base_path:str, port:int):
+    logger.info(f'Serving {base_path} with aiohttp on port {port}')
+    web.run_app(application(base_path), port=port)
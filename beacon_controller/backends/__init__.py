@@ -0,0 +1,90 @@
+"""
+The backend that the beacon reads its knowledge graph from, chosen by
+`backend` in config.yaml: "neo4j" (the default), "memory", which loads the
+KGX files listed under `kgx` into RAM, "sqlite", which reads the SQLite file
+at `sqlite.path` built from those files by `tkg-beacon load-sqlite`, or
+"snapshot", which maps the snapshot at `snapshot.path` built from them by
+`tkg-beacon build-snapshot`. The snapshot backend is only imported when it
+is used, since it needs NumPy (the `snapshot` extra).
+"""
+import os
+import threading
+
+from beacon_controller import config
+
+from .backend import Backend, parse_statement_id
+from .neo4j_backend import Neo4jBackend
+from .memory_backend import MemoryBackend
+from .sqlite_backend import SQLiteBackend
+
+NEO4J = 'neo4j'
+MEMORY = 'memory'
+SQLITE = 'sqlite'
+SNAPSHOT = 'snapshot'
+
+BACKENDS = [NEO4J, MEMORY, SQLITE, SNAPSHOT]
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def data_path(path:str) -> str:
+    """
+    Paths in config.yaml are relative to the beacon's data directory
+    """
+    from beacon_controller.summaries import directory
+    return os.path.join(directory, path)
+
+
+def kgx_paths(key:str) -> list:
+    """
+    The KGX node or edge files of config.yaml
+    """
+    return [data_path(path) for path in (config.get('kgx') or {}).get(key) or []]
+
+
+def sqlite_config() -> dict:
+    return config.get('sqlite') or {}
+
+
+def sqlite_path() -> str:
+    return data_path(sqlite_config().get('path', 'beacon.sqlite'))
+
+
+def snapshot_path() -> str:
+    return data_path((config.get('snapshot') or {}).get('path', 'snapshot'))
+
+
+def create_backend(name:str) -> Backend:
+    if name == NEO4J:
+        return Neo4jBackend()
+    elif name == MEMORY:
+        return MemoryBackend.load(kgx_paths('nodes'), kgx_paths('edges'))
+    elif name == SQLITE:
+        return SQLiteBackend(sqlite_path(), mmap_size=sqlite_config().get('mmap_size', 2**30))
+    elif name == SNAPSHOT:
+        from .snapshot_backend import SnapshotBackend
+        return SnapshotBackend(snapshot_path())
+    else:
+        raise ValueError('Unknown backend {}, expected one of {}'.format(name, ', '.join(BACKENDS)))
+
+
+def backend_name() -> str:
+    return config.get('backend', NEO4J)
+
+
+def backend() -> Backend:
+    """
+    The configured backend, created (and for the memory backend, loaded) by
+    the first call
+    """
+    global _backend
+
+    current = _backend
+    if current is not None:
+        return current
+
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend(backend_name())
+        return _backend
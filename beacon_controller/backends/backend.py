@@ -0,0 +1,128 @@
+import asyncio
+import functools
+
+from abc import ABC, abstractmethod
+
+
+class Backend(ABC):
+    """
+    Where the knowledge graph is read from. Each method finds the records that
+    one operation of the beacon responds with, leaving it to the controllers to
+    build the response. Records can be read like dictionaries, with the keys
+    listed by each method.
+
+    Every backend must implement the six abstract methods. The async_ methods
+    are used by the aiohttp server. By default they call their synchronous
+    counterpart in the event loop's default executor, so that a slow query
+    does not hold up the other requests.
+    """
+    @abstractmethod
+    def concepts(self, keywords=None, categories=None, offset=None, size=None):
+        """
+        (id, name, category, description) tuples of the concepts whose name or
+        synonyms contain any of the keywords, within any of the categories
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def concept_details(self, concept_id):
+        """
+        At most one record, with keys id, uri, iri, name, category, symbol,
+        description, synonyms, clique, xrefs and node (every property of the
+        concept), of the concept with the given id, ignoring case
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def exact_matches(self, c):
+        """
+        A record, with keys input_id, match_id, xrefs and clique, for each
+        concept that has one of the CURIEs `c` as its id, xref or clique
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def statements(self, s=None, s_keywords=None, s_categories=None, edge_label=None, relation=None, t=None, t_keywords=None, t_categories=None, offset=None, size=None):
+        """
+        A record, with keys subject, object (dictionaries of the properties of
+        the concepts), edge_type, edge_label, relation, negated and
+        statement_id, for each matching statement
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def statement_details(self, statement_id):
+        """
+        At most one record, with keys subject, relation and object, of the
+        statement with the given id. The relation can be read like a
+        dictionary of the statement's properties, and has a `type`.
+        """
+        raise NotImplementedError()
+
+    @abstractmethod
+    def summary_source(self):
+        """
+        Where `tkg-beacon summarize` reads the graph from, see summaries.py
+        """
+        raise NotImplementedError()
+
+    async def async_concepts(self, *args, **kwargs):
+        return await in_thread(lambda: list(self.concepts(*args, **kwargs)))
+
+    async def async_concept_details(self, *args, **kwargs):
+        return await in_thread(lambda: list(self.concept_details(*args, **kwargs)))
+
+    async def async_exact_matches(self, *args, **kwargs):
+        return await in_thread(lambda: list(self.exact_matches(*args, **kwargs)))
+
+    async def async_statements(self, *args, **kwargs):
+        return await in_thread(lambda: list(self.statements(*args, **kwargs)))
+
+    async def async_statement_details(self, *args, **kwargs):
+        return await in_thread(lambda: list(self.statement_details(*args, **kwargs)))
+
+
+async def in_thread(function, *args):
+    """
+    Awaits a function that may block, run in the event loop's default executor
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *args))
+
+
+class Properties(dict):
+    """
+    The properties of a node or an edge, missing properties read as None like
+    they do in Cypher
+    """
+    def __missing__(self, key):
+        return None
+
+
+class Relation(Properties):
+    """
+    The properties of an edge, with its edge label as its type like a Neo4j
+    relationship
+    """
+    @property
+    def type(self):
+        return self['edge_label']
+
+
+def parse_statement_id(statement_id:str) -> tuple:
+    """
+    A statement is identified either by the id of its edge, e.g. SEMMED:123,
+    which is returned as a 1-tuple, or by subject, edge label and object, e.g.
+    HGNC:1:interacts_with:HGNC:2, which is returned as a 3-tuple.
+    """
+    statement_components = statement_id.split(':')
+
+    if len(statement_components) == 2:
+        return (statement_id,)
+    elif len(statement_components) == 5:
+        s_prefix, s_num, edge_label, o_prefix, o_num = statement_components
+        subject_id = '{}:{}'.format(s_prefix, s_num)
+        object_id = '{}:{}'.format(o_prefix, o_num)
+        return subject_id, edge_label, object_id
+    else:
+        raise Exception('{} must either be a curie, or curie:edge_label:curie'.format(statement_id))
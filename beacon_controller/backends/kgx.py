@@ -0,0 +1,99 @@
+"""
+Reads nodes and edges from files in the KGX formats: tab separated node and
+edge files, in which multivalued properties are separated by pipes, or JSON
+files holding a list of nodes and/or a list of edges.
+
+    {"nodes": [{"id": "HGNC:1", "name": "A1BG", "category": ["gene"]}, ...],
+     "edges": [{"subject": "HGNC:1", "edge_label": "interacts_with", "object": ...}, ...]}
+"""
+import csv
+import json
+import logging
+
+logger = logging.getLogger(__file__)
+
+# Properties that hold lists, and in TSV files are separated by this character
+LIST_PROPERTIES = {'category', 'synonym', 'xrefs', 'clique', 'same_as', 'publications', 'qualifiers', 'provided_by', 'evidence'}
+LIST_SEPARATOR = '|'
+
+BOOLEAN_PROPERTIES = {'negated'}
+
+
+def value(key:str, v):
+    if key in LIST_PROPERTIES and isinstance(v, str):
+        return [x for x in v.split(LIST_SEPARATOR) if x != '']
+    if key in BOOLEAN_PROPERTIES and isinstance(v, str):
+        return v.lower() == 'true'
+    return v
+
+
+def iter_tsv(path:str):
+    csv.field_size_limit(2**31 - 1)
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+        for row in reader:
+            yield {key: value(key, v) for key, v in row.items() if key is not None and v not in ('', None)}
+
+
+def read_json(path:str) -> tuple:
+    """
+    Returns the nodes and the edges of a KGX JSON file
+    """
+    with open(path) as f:
+        d = json.load(f)
+
+    if isinstance(d, list):
+        # A bare list holds either nodes or edges
+        if any('subject' in item for item in d[:1]):
+            d = {'edges': d}
+        else:
+            d = {'nodes': d}
+
+    nodes = [{key: value(key, v) for key, v in node.items()} for node in d.get('nodes', [])]
+    edges = [{key: value(key, v) for key, v in edge.items()} for edge in d.get('edges', [])]
+    return nodes, edges
+
+
+def normalize_edge(edge:dict) -> dict:
+    # Later versions of KGX call the edge label the predicate
+    if 'edge_label' not in edge and 'predicate' in edge:
+        edge['edge_label'] = edge['predicate']
+    return edge
+
+
+def iter_nodes(node_paths:list=(), edge_paths:list=()):
+    """
+    Yields the nodes of the node files, and of any JSON file, one at a time
+    """
+    for path in list(node_paths) + list(edge_paths):
+        if path.endswith('.json'):
+            yield from read_json(path)[0]
+        elif path in node_paths:
+            yield from iter_tsv(path)
+        else:
+            continue
+        logger.info('Read the nodes of {}'.format(path))
+
+
+def iter_edges(node_paths:list=(), edge_paths:list=()):
+    """
+    Yields the edges of the edge files, and of any JSON file, one at a time
+    """
+    for path in list(node_paths) + list(edge_paths):
+        if path.endswith('.json'):
+            edges = read_json(path)[1]
+        elif path in edge_paths:
+            edges = iter_tsv(path)
+        else:
+            continue
+        for edge in edges:
+            yield normalize_edge(edge)
+        logger.info('Read the edges of {}'.format(path))
+
+
+def load(node_paths:list=(), edge_paths:list=()) -> tuple:
+    """
+    Reads all the given files, and returns lists of their nodes and edges.
+    JSON files may hold both nodes and edges whichever list they are in.
+    """
+    return list(iter_nodes(node_paths, edge_paths)), list(iter_edges(node_paths, edge_paths))
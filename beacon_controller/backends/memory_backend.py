@@ -0,0 +1,263 @@
+import re
+import logging
+
+from collections import defaultdict
+from functools import lru_cache
+
+from beacon_controller import utils
+
+from .backend import Backend, Properties, Relation, parse_statement_id
+from . import kgx
+
+logger = logging.getLogger(__file__)
+
+TOKEN = re.compile(r'[^\W_]+')
+
+
+def tokens(text) -> list:
+    """
+    The lowercase runs of letters and digits in the text. Any substring of a
+    text is made of runs that are each a substring of one of the text's runs,
+    which is how keywords are looked up.
+    """
+    return TOKEN.findall(text.lower()) if isinstance(text, str) else []
+
+
+class MemoryBackend(Backend):
+    """
+    Holds the whole knowledge graph in memory, indexed by node id (ignoring
+    case), by the words of node names and synonyms, by category, by xref and
+    clique, by the edges going out of and into each node, and by edge label.
+    Only suitable for graphs that comfortably fit in RAM.
+
+    Usage:
+
+        MemoryBackend.load(['nodes.tsv'], ['edges.tsv'])
+    """
+    def __init__(self, nodes:list, edges:list):
+        self.nodes = {}
+        self.order = {}
+        self.edges = []
+        self.ids = defaultdict(list)
+        self.words = defaultdict(set)
+        self.categories = defaultdict(set)
+        self.matches = defaultdict(set)
+        self.outgoing = defaultdict(list)
+        self.incoming = defaultdict(list)
+        self.edge_labels = defaultdict(list)
+        self.edge_ids = {}
+
+        for node in nodes:
+            self.add_node(Properties(node))
+        for edge in edges:
+            self.add_edge(Relation(edge))
+
+        self.vocabulary = sorted(self.words)
+        self.words_containing = lru_cache(maxsize=4096)(self._words_containing)
+
+        logger.info('Indexed {} nodes and {} edges'.format(len(self.nodes), len(self.edges)))
+
+    @classmethod
+    def load(cls, node_paths:list, edge_paths:list):
+        return cls(*kgx.load(node_paths, edge_paths))
+
+    def add_node(self, node:Properties):
+        i = node['id']
+        if i not in self.nodes:
+            self.order[i] = len(self.order)
+            self.ids[i.lower()].append(i)
+        self.nodes[i] = node
+
+        for text in [node['name']] + utils.listify(node['synonym']):
+            for word in tokens(text):
+                self.words[word].add(i)
+
+        for category in utils.listify(node['category']):
+            self.categories[category.lower()].add(i)
+
+        for match in utils.listify(node['xrefs']) + utils.listify(node['clique']):
+            self.matches[match].add(i)
+
+    def add_edge(self, edge:Relation):
+        if edge['edge_label'] is None or edge['subject'] is None or edge['object'] is None:
+            logger.warning('Skipping edge without subject, object or edge label: {}'.format(dict(edge)))
+            return
+
+        index = len(self.edges)
+        self.edges.append(edge)
+        self.outgoing[edge['subject']].append(index)
+        self.incoming[edge['object']].append(index)
+        self.edge_labels[edge['edge_label']].append(index)
+
+        if edge['id'] is not None:
+            self.edge_ids[edge['id']] = index
+
+    def _words_containing(self, part:str) -> frozenset:
+        ids = set()
+        for word in self.vocabulary:
+            if part in word:
+                ids.update(self.words[word])
+        return frozenset(ids)
+
+    def keyword_matches(self, keyword:str) -> set:
+        """
+        Ids of the nodes whose name or synonyms contain the keyword, ignoring
+        case
+        """
+        keyword = keyword.lower()
+        parts = tokens(keyword)
+
+        if parts == []:
+            candidates = set(self.nodes)
+        else:
+            candidates = set.intersection(*[set(self.words_containing(part)) for part in parts])
+
+        return {
+            i for i in candidates
+            if any(keyword in text.lower() for text in [self.nodes[i]['name']] + utils.listify(self.nodes[i]['synonym']) if isinstance(text, str))
+        }
+
+    def select(self, ids=None, keywords=None, categories=None):
+        """
+        Ids of the nodes that have any of the ids, any of the keywords and any
+        of the categories, or None if no constraint is given
+        """
+        selected = None
+
+        if ids is not None:
+            selected = {i for curie in ids for i in self.ids.get(curie.lower(), [])}
+
+        if keywords is not None:
+            matches = set().union(*[self.keyword_matches(keyword) for keyword in keywords])
+            selected = matches if selected is None else selected & matches
+
+        if categories is not None:
+            matches = set().union(*[self.categories.get(category.lower(), set()) for category in categories])
+            selected = matches if selected is None else selected & matches
+
+        return selected
+
+    def concepts(self, keywords=None, categories=None, offset=None, size=None):
+        if size is None:
+            size = 100
+
+        selected = self.select(categories=categories)
+
+        if keywords is not None:
+            # Concepts that match the most keywords first
+            counts = defaultdict(int)
+            for keyword in keywords:
+                for i in self.keyword_matches(keyword):
+                    counts[i] += 1
+            found = counts.keys() if selected is None else counts.keys() & selected
+            ids = sorted(found, key=lambda i: (-counts[i], self.order[i]))
+        elif selected is not None:
+            ids = sorted(selected, key=self.order.get)
+        else:
+            ids = self.nodes
+
+        for i in page(ids, offset, size):
+            node = self.nodes[i]
+            yield node['id'], node['name'], node['category'], node['description']
+
+    def concept_details(self, concept_id):
+        for i in self.ids.get(concept_id.lower(), [])[:1]:
+            node = self.nodes[i]
+            yield dict(
+                id=node['id'],
+                uri=node['uri'],
+                iri=node['iri'],
+                name=node['name'],
+                category=node['category'],
+                symbol=node['symbol'],
+                description=node['description'],
+                synonyms=node['synonym'],
+                clique=node['clique'],
+                xrefs=node['xrefs'],
+                node=node
+            )
+
+    def exact_matches(self, c):
+        for input_id in c:
+            ids = set(self.matches.get(input_id, set()))
+            if input_id in self.nodes:
+                ids.add(input_id)
+            for i in sorted(ids):
+                node = self.nodes[i]
+                yield dict(input_id=input_id, match_id=i, xrefs=node['xrefs'], clique=node['clique'])
+
+    def statements(self, s=None, s_keywords=None, s_categories=None, edge_label=None, relation=None, t=None, t_keywords=None, t_categories=None, offset=None, size=None):
+        if size is None:
+            size = 100
+
+        subjects = self.select(s, s_keywords, s_categories)
+        objects = self.select(t, t_keywords, t_categories)
+
+        if subjects is not None:
+            candidates = sorted({index for i in subjects for index in self.outgoing.get(i, [])})
+        elif objects is not None:
+            candidates = sorted({index for i in objects for index in self.incoming.get(i, [])})
+        elif edge_label is not None:
+            candidates = self.edge_labels.get(edge_label, [])
+        else:
+            candidates = range(len(self.edges))
+
+        def matches(edge):
+            return (
+                (subjects is None or edge['subject'] in subjects) and
+                (objects is None or edge['object'] in objects) and
+                (edge_label is None or edge['edge_label'] == edge_label) and
+                (relation is None or edge['relation'] == relation) and
+                edge['subject'] in self.nodes and
+                edge['object'] in self.nodes
+            )
+
+        edges = (self.edges[index] for index in candidates)
+
+        for edge in page((edge for edge in edges if matches(edge)), offset, size):
+            yield dict(
+                subject=self.nodes[edge['subject']],
+                object=self.nodes[edge['object']],
+                edge_type=edge['edge_label'],
+                edge_label=edge['edge_label'],
+                relation=edge['relation'],
+                negated=edge['negated'],
+                statement_id=edge['id']
+            )
+
+    def statement_details(self, statement_id):
+        ids = parse_statement_id(statement_id)
+
+        if len(ids) == 1:
+            index = self.edge_ids.get(statement_id)
+            found = [] if index is None else [(self.edges[index]['subject'], self.edges[index], self.edges[index]['object'])]
+        else:
+            subject_id, edge_label, object_id = ids
+            found = [
+                (subject_id, self.edges[index], object_id)
+                for index in self.outgoing.get(subject_id, []) + self.incoming.get(subject_id, [])
+                if {self.edges[index]['subject'], self.edges[index]['object']} == {subject_id, object_id}
+                and self.edges[index]['edge_label'].lower() == edge_label.lower()
+            ]
+
+        for subject_id, edge, object_id in found[:1]:
+            if subject_id in self.nodes and object_id in self.nodes:
+                yield dict(subject=self.nodes[subject_id], relation=edge, object=self.nodes[object_id])
+
+    def summary_source(self):
+        from beacon_controller.summaries import MemorySource
+        return MemorySource(list(self.nodes.values()), self.edges)
+
+
+def page(items, offset=None, size=None):
+    """
+    Skips `offset` items and yields at most `size` of the rest, like SKIP and
+    LIMIT in Cypher
+    """
+    start = offset if isinstance(offset, int) and offset >= 0 else 0
+    for n, item in enumerate(items):
+        if n < start:
+            continue
+        if isinstance(size, int) and size >= 1 and n >= start + size:
+            return
+        yield item
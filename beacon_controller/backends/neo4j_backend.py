@@ -0,0 +1,279 @@
+import beacon_controller.database as db
+from beacon_controller.database import Node
+from beacon_controller import config
+
+from .backend import Backend, parse_statement_id
+
+
+class Neo4jBackend(Backend):
+    """
+    Reads the knowledge graph from the Neo4j database of config.yaml
+    """
+    def concepts(self, keywords=None, categories=None, offset=None, size=None):
+        # Inflating every node into a neomodel Node is expensive, so it is only
+        # done if nodes are to be validated against the model
+        validate = config.get('validate_nodes', False)
+
+        q, parameters = concepts_query(keywords, categories, offset, size, validate)
+
+        if validate:
+            nodes = db.stream(q, Node, endpoint='concepts', **parameters)
+            return ((node.curie, node.name, node.category, node.description) for node in nodes)
+        else:
+            return db.stream(q, endpoint='concepts', **parameters)
+
+    def concept_details(self, concept_id):
+        q, parameters = concept_details_query(concept_id)
+        return db.stream(q, endpoint='concept_details', **parameters)
+
+    def exact_matches(self, c):
+        q, parameters = exact_matches_query(c)
+        return db.stream(q, endpoint='exactmatches', **parameters)
+
+    def statements(self, *args, **kwargs):
+        q, parameters = statements_query(*args, **kwargs)
+        return db.stream(q, endpoint='statements', **parameters)
+
+    def statement_details(self, statement_id):
+        q, parameters = statement_details_query(statement_id)
+        return db.stream(q, endpoint='statement_details', **parameters)
+
+    def summary_source(self):
+        from beacon_controller.summaries import Neo4jSource
+        return Neo4jSource()
+
+    async def async_concepts(self, keywords=None, categories=None, offset=None, size=None):
+        validate = config.get('validate_nodes', False)
+
+        q, parameters = concepts_query(keywords, categories, offset, size, validate)
+
+        if validate:
+            nodes = await db.async_query(q, Node, endpoint='concepts', **parameters)
+            return [(node.curie, node.name, node.category, node.description) for node in nodes]
+        else:
+            return await db.async_query(q, endpoint='concepts', **parameters)
+
+    async def async_concept_details(self, concept_id):
+        q, parameters = concept_details_query(concept_id)
+        return await db.async_query(q, endpoint='concept_details', **parameters)
+
+    async def async_exact_matches(self, c):
+        q, parameters = exact_matches_query(c)
+        return await db.async_query(q, endpoint='exactmatches', **parameters)
+
+    async def async_statements(self, *args, **kwargs):
+        q, parameters = statements_query(*args, **kwargs)
+        return await db.async_query(q, endpoint='statements', **parameters)
+
+    async def async_statement_details(self, statement_id):
+        q, parameters = statement_details_query(statement_id)
+        return await db.async_query(q, endpoint='statement_details', **parameters)
+
+
+def concepts_query(keywords=None, categories=None, offset=None, size=None, validate=False) -> tuple:
+    """
+    The Cypher query of `get_concepts` and its parameters. If `validate` then whole
+    nodes are returned, to be inflated into neomodel Nodes, rather than just
+    the properties that make up a BeaconConcept.
+    """
+    if size is None:
+        size = 100;
+
+    conjuncts = []
+    unwinds = []
+    data = {}
+
+    if keywords is not None:
+        unwinds.append("[x IN $keywords | toLower(x)] AS keyword")
+        disjuncts = [
+            "toLower(n.name) CONTAINS keyword",
+            "ANY(syn IN n.synonym WHERE toLower(syn) CONTAINS keyword)"
+        ]
+        conjuncts.append(" OR ".join(disjuncts))
+        data['keywords'] = keywords
+
+    if categories is not None:
+        unwinds.append("[x IN $categories | toLower(x)] AS category")
+        conjuncts.append("ANY(label IN $categories WHERE label IN labels(n))")
+        data['categories'] = categories
+
+    q = "MATCH (n)"
+
+    if unwinds != []:
+        q = "UNWIND " + ' UNWIND '.join(unwinds) + " " + q
+
+    if conjuncts != []:
+        q = q + " WHERE (" + ') AND ('.join(conjuncts) + ")"
+
+    if validate:
+        q += " RETURN n"
+    else:
+        q += " RETURN n.id AS id, n.name AS name, n.category AS category, n.description AS description"
+
+    if isinstance(offset, int) and offset >= 0:
+        q += f' SKIP {offset}'
+    if isinstance(size, int) and size >= 1:
+        q += f' LIMIT {size}'
+
+    return q, dict(keywords=keywords, categories=categories, limit=size)
+
+
+def concept_details_query(concept_id) -> tuple:
+    """
+    The Cypher query of `get_concept_details` and its parameters
+    """
+    q = """
+    MATCH (n) WHERE toLower(n.id) = toLower($conceptId)
+    RETURN
+        n.id AS id,
+        n.uri AS uri,
+        n.iri AS iri,
+        n.name AS name,
+        n.category AS category,
+        n.symbol AS symbol,
+        n.description AS description,
+        n.synonym AS synonyms,
+        n.clique AS clique,
+        n.xrefs AS xrefs,
+        n AS node
+    LIMIT 1
+    """
+
+    return q, dict(conceptId=concept_id)
+
+
+def exact_matches_query(c) -> tuple:
+    """
+    The Cypher query of `get_exact_matches_to_concept_list` and its parameters, for
+    CURIEs that have already been fixed with `utils.fix_curie`
+    """
+    q = """
+    UNWIND $id_list AS input_id
+    MATCH (n) WHERE
+        n.id = input_id OR
+        input_id IN n.xrefs OR
+        input_id IN n.clique
+    RETURN
+        input_id AS input_id,
+        n.id AS match_id,
+        n.xrefs AS xrefs,
+        n.clique AS clique;
+    """
+
+    return q, dict(id_list=c)
+
+
+def statements_query(s=None, s_keywords=None, s_categories=None, edge_label=None, relation=None, t=None, t_keywords=None, t_categories=None, offset=None, size=None) -> tuple:
+    """
+    The Cypher query of `get_statements` and its parameters
+    """
+    if size is None:
+        size = 100
+
+    conjuncts = []
+    unwinds = []
+    data = {}
+
+    if s is not None:
+        unwinds.append("[x IN $sources | toLower(x)] AS s")
+        conjuncts.append("toLower(n.id) = s")
+        data['sources'] = s
+
+    if t is not None:
+        unwinds.append("[x IN $targets | toLower(x)] AS t")
+        conjuncts.append("toLower(m.id) = t")
+        data['targets'] = t
+
+    if s_keywords is not None:
+        unwinds.append("[x IN $s_keywords | toLower(x)] AS s_keyword")
+        disjuncts = [
+            "toLower(n.name) CONTAINS s_keyword",
+            "ANY(syn IN n.synonym WHERE toLower(syn) CONTAINS s_keyword)"
+        ]
+        conjuncts.append(" OR ".join(disjuncts))
+        # conjuncts.append("toLower(n.name) CONTAINS s_keyword OR ANY(synonym IN n.synonym WHERE toLower(synonym) CONTAINS s_keyword)")
+        data['s_keywords'] = s_keywords
+
+    if t_keywords is not None:
+        unwinds.append("[x IN $t_keywords | toLower(x)] AS t_keyword")
+        disjuncts = [
+            "toLower(m.name) CONTAINS t_keyword",
+            "ANY(syn IN m.synonym WHERE toLower(syn) CONTAINS t_keyword)"
+        ]
+        conjuncts.append(" OR ".join(disjuncts))
+        # conjuncts.append("ANY(keyword in $t_keywords WHERE keyword CONTAINS toLower(m.name))")
+        # conjuncts.append("toLower(m.name) CONTAINS t_keyword OR ANY(synonym IN m.synonym WHERE toLower(synonym) CONTAINS t_keyword)")
+        data['t_keywords'] = t_keywords
+
+    if edge_label is not None:
+        conjuncts.append("type(r) = $edge_label")
+        data['edge_label'] = edge_label
+
+    if relation is not None:
+        conjuncts.append("r.relation = $relation")
+        data['relation'] = relation
+
+    if s_categories is not None:
+        unwinds.append("[x IN $s_categories | toLower(x)] AS s_category")
+        conjuncts.append("s_category IN labels(n)")
+        data['s_categories'] = s_categories
+
+    if t_categories is not None:
+        unwinds.append("[x IN $t_categories | toLower(x)] AS t_category")
+        conjuncts.append("t_category IN labels(m)")
+        data['t_categories'] = t_categories
+
+    q = "MATCH (n)-[r]->(m)"
+
+    if unwinds != []:
+        q = "UNWIND " + ' UNWIND '.join(unwinds) + " " + q
+
+    if conjuncts != []:
+        q = q + " WHERE (" + ') AND ('.join(conjuncts) + ")"
+
+    q += """
+    RETURN
+        n AS subject,
+        m AS object,
+        type(r) AS edge_type,
+        r.edge_label AS edge_label,
+        r.relation AS relation,
+        r.negated AS negated,
+        r.id AS statement_id
+    """
+
+    if isinstance(offset, int) and offset >= 0:
+        q += f' SKIP {offset}'
+    if isinstance(size, int) and size >= 1:
+        q += f' LIMIT {size}'
+
+    return q, data
+
+
+def statement_details_query(statement_id) -> tuple:
+    """
+    The query of `get_statement_details` and its parameters
+    """
+    ids = parse_statement_id(statement_id)
+
+    if len(ids) == 1:
+        q = """
+        MATCH (s)-[r {id: $statement_id}]-(o)
+        RETURN s AS subject, r AS relation, o AS object
+        LIMIT 1;
+        """
+        return q, dict(statement_id=statement_id)
+    else:
+        subject_id, edge_label, object_id = ids
+        q = """
+        MATCH (s {id: $subject_id})-[r]-(o {id: $object_id})
+        WHERE
+            TOLOWER(type(r)) = TOLOWER($edge_label) OR
+            TOLOWER(r.edge_label) = TOLOWER($edge_label)
+        RETURN
+            s AS subject,
+            r AS relation,
+            o AS object
+        LIMIT 1;
+        """
+        return q, dict(subject_id=subject_id, object_id=object_id, edge_label=edge_label)
@@ -0,0 +1,215 @@
+"""
+The columnar node table of a snapshot (see snapshot_backend.py), which filters
+concepts a column at a time instead of a node at a time. Categories and CURIE
+prefixes are dictionary encoded, so that filtering on them comes down to a
+NumPy boolean mask over every node, and keyword substring matching then only
+runs over the text of the nodes that the mask lets through.
+
+    category_bits.npy               a bitmap of the categories of each node, a column per 64 categories
+    prefix_codes.npy                the prefix of each node's id
+    text.bin, text_offsets.npy      the lowercase name and synonyms of each node, and where each starts
+"""
+import os
+import re
+import mmap
+
+from array import array
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError('Snapshots need NumPy, which is installed by: pip install translator-knowledge-graph-beacon[snapshot]') from e
+
+from beacon_controller import utils
+
+# Separates the name and synonyms of a node in text.bin, so that a keyword
+# can only match within one of them
+TEXT_SEPARATOR = b'\x00'
+
+BITS = 64
+
+# Above this share of the nodes, copying the text of the nodes that a mask
+# lets through costs more than matching over all the text and then masking
+GATHER_RATIO = 0.25
+
+EMPTY = np.zeros(0, dtype=np.int32)
+
+
+def load_array(path:str) -> np.ndarray:
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError:
+        # Empty arrays cannot be memory mapped
+        return np.load(path)
+
+
+def load_buffer(path:str):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def prefix(curie:str) -> str:
+    return curie.split(':')[0]
+
+
+def find_rows(needle:bytes, text, offsets:np.ndarray) -> np.ndarray:
+    """
+    The rows of an offset-indexed buffer whose text contains the needle
+    """
+    # The regular expression engine finds every match without returning to
+    # Python in between, and then they are all mapped to their rows at once
+    positions = np.fromiter((m.start() for m in re.finditer(re.escape(needle), text)), dtype=np.int64)
+    if len(positions) == 0:
+        return EMPTY
+    return np.unique(np.searchsorted(offsets, positions, 'right') - 1).astype(np.int32)
+
+
+class NodeTable(object):
+    """
+    The node table in the snapshot directory at `path`, whose categories and
+    prefixes are listed in order of their codes
+    """
+    def __init__(self, path:str, categories:list, prefixes:list):
+        self.categories = {category: code for code, category in enumerate(categories)}
+        self.prefixes = {p: code for code, p in enumerate(prefixes)}
+        self.category_bits = load_array(os.path.join(path, 'category_bits.npy'))
+        self.prefix_codes = load_array(os.path.join(path, 'prefix_codes.npy'))
+        self.text_offsets = load_array(os.path.join(path, 'text_offsets.npy'))
+        self.text = load_buffer(os.path.join(path, 'text.bin'))
+        self.size = len(self.prefix_codes)
+        self.keyword_nodes = lru_cache(maxsize=4096)(self._keyword_nodes)
+
+    def category_mask(self, categories:list) -> np.ndarray:
+        """
+        Whether each node has any of the categories, ignoring case
+        """
+        query = np.zeros(self.category_bits.shape[1], dtype=np.uint64)
+        for category in categories:
+            code = self.categories.get(category.lower())
+            if code is not None:
+                query[code // BITS] |= np.uint64(1) << np.uint64(code % BITS)
+        return (self.category_bits & query).any(axis=1)
+
+    def prefix_mask(self, prefixes:list) -> np.ndarray:
+        """
+        Whether the id of each node has any of the prefixes, ignoring case
+        """
+        codes = [code for p, code in self.prefixes.items() if p.lower() in {x.lower() for x in prefixes}]
+        return np.isin(self.prefix_codes, codes)
+
+    def mask(self, categories=None, prefixes=None):
+        """
+        Whether each node has any of the categories and any of the prefixes,
+        or None if neither is given
+        """
+        mask = None
+        if categories is not None:
+            mask = self.category_mask(categories)
+        if prefixes is not None:
+            mask = self.prefix_mask(prefixes) if mask is None else mask & self.prefix_mask(prefixes)
+        return mask
+
+    def _keyword_nodes(self, keyword:str) -> np.ndarray:
+        """
+        The nodes whose name or synonyms contain the keyword, ignoring case
+        """
+        needle = keyword.lower().encode()
+        if needle == b'':
+            found = np.flatnonzero(np.diff(self.text_offsets) > 0).astype(np.int32)
+        else:
+            found = find_rows(needle, self.text, self.text_offsets)
+        found.flags.writeable = False
+        return found
+
+    def matching(self, keywords:list, mask:np.ndarray=None) -> tuple:
+        """
+        The nodes that the mask lets through and whose name or synonyms
+        contain any of the keywords, and how many of the keywords each
+        contains
+        """
+        survivors = None if mask is None else np.flatnonzero(mask).astype(np.int32)
+
+        if survivors is not None and len(survivors) <= GATHER_RATIO * self.size:
+            # Match over a copy of only the survivors' text
+            positions = ranges(self.text_offsets, survivors)
+            text = np.frombuffer(self.text, dtype=np.uint8)[positions].tobytes() if len(positions) > 0 else b''
+            lengths = self.text_offsets[survivors + 1] - self.text_offsets[survivors]
+            offsets = np.concatenate([[0], np.cumsum(lengths)])
+            found = []
+            for keyword in keywords:
+                needle = keyword.lower().encode()
+                if needle == b'':
+                    found.append(survivors[lengths > 0])
+                else:
+                    found.append(survivors[find_rows(needle, text, offsets)])
+        else:
+            found = [self.keyword_nodes(keyword) for keyword in keywords]
+            if survivors is not None:
+                found = [f[mask[f]] for f in found]
+
+        return np.unique(np.concatenate([EMPTY] + found), return_counts=True)
+
+
+def ranges(offsets:np.ndarray, rows:np.ndarray) -> np.ndarray:
+    """
+    The positions of the items of the given rows of a CSR array, in order
+    """
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Each row's positions count up from its start, so shift a running count
+    # by how far each row's start is from where its items begin in the result
+    shifts = starts - (np.cumsum(lengths) - lengths)
+    return np.arange(total, dtype=np.int64) + np.repeat(shifts, lengths)
+
+
+class NodeTableWriter(object):
+    """
+    Writes the node table of the nodes added in order to the directory at
+    `path`, once closed
+    """
+    def __init__(self, path:str):
+        self.path = path
+        self.categories, self.prefixes = {}, {}
+        self.category_nodes, self.category_codes = array('i'), array('i')
+        self.prefix_codes = array('i')
+        self.text_offsets = array('q', [0])
+        self.text = open(os.path.join(path, 'text.bin'), 'wb')
+
+    def add(self, node:dict):
+        i = len(self.prefix_codes)
+
+        self.prefix_codes.append(self.prefixes.setdefault(prefix(node['id']), len(self.prefixes)))
+
+        for category in utils.listify(node.get('category')):
+            self.category_codes.append(self.categories.setdefault(category.lower(), len(self.categories)))
+            self.category_nodes.append(i)
+
+        b = b''.join(TEXT_SEPARATOR + t.lower().encode() for t in [node.get('name')] + utils.listify(node.get('synonym')) if isinstance(t, str))
+        self.text.write(b)
+        self.text_offsets.append(self.text_offsets[-1] + len(b))
+
+    def close(self) -> dict:
+        """
+        Writes the table, and returns the categories and prefixes it encodes
+        """
+        self.text.close()
+
+        nodes = np.frombuffer(self.category_nodes, dtype=np.int32) if len(self.category_nodes) > 0 else EMPTY
+        codes = np.frombuffer(self.category_codes, dtype=np.int32) if len(self.category_codes) > 0 else EMPTY
+        bits = np.zeros((len(self.prefix_codes), max(1, -(-len(self.categories) // BITS))), dtype=np.uint64)
+        np.bitwise_or.at(bits, (nodes, codes // BITS), np.left_shift(np.uint64(1), (codes % BITS).astype(np.uint64)))
+
+        np.save(os.path.join(self.path, 'category_bits.npy'), bits)
+        np.save(os.path.join(self.path, 'prefix_codes.npy'), np.array(self.prefix_codes, dtype=np.int32))
+        np.save(os.path.join(self.path, 'text_offsets.npy'), np.array(self.text_offsets, dtype=np.int64))
+
+        return dict(
+            categories=sorted(self.categories, key=self.categories.get),
+            prefixes=sorted(self.prefixes, key=self.prefixes.get)
+        )
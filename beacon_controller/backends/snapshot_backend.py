@@ -0,0 +1,409 @@
+"""
+A backend that reads the knowledge graph from a read only snapshot: a
+directory of NumPy arrays built from KGX files by `tkg-beacon build-snapshot`.
+Node ids, categories, edge labels and relations are dictionary encoded as
+integers, and the edges going out of and into each node are stored in
+compressed sparse row (CSR) form, so that statements are found by slicing and
+comparing arrays rather than by querying a database. Every file is memory
+mapped, so that the worker processes of a host share the one copy of the
+snapshot held in the page cache.
+
+    meta.json                               numbers of nodes and edges, and the categories, prefixes, edge labels and relations
+    node_data.bin, node_offsets.npy         the properties of each node as JSON, and where each starts
+    node_keys.npy, node_key_nodes.npy       the lowercase node ids, sorted, and their nodes
+    match_keys.npy, match_nodes.npy         the xrefs and clique members of the nodes, sorted, and their nodes
+    category_bits.npy, prefix_codes.npy, text.bin, text_offsets.npy     the node table, see node_table.py
+    edge_data.bin, edge_offsets.npy         the properties of each edge as JSON, and where each starts
+    edge_keys.npy, edge_key_edges.npy       the edge ids, sorted, and their edges
+    edge_subjects.npy, edge_objects.npy, edge_label_codes.npy, edge_relation_codes.npy
+    out_offsets.npy, out_neighbors.npy, out_labels.npy, out_edges.npy   CSR of the edges going out of each node
+    in_offsets.npy, in_neighbors.npy, in_labels.npy, in_edges.npy       CSR of the edges going into each node
+"""
+import os
+import json
+import shutil
+import logging
+
+from array import array
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError('Snapshots need NumPy, which is installed by: pip install translator-knowledge-graph-beacon[snapshot]') from e
+
+from beacon_controller import utils
+
+from .backend import Backend, Properties, Relation, parse_statement_id
+from .node_table import NodeTable, NodeTableWriter, EMPTY, load_array, load_buffer, ranges
+from . import kgx
+
+logger = logging.getLogger(__file__)
+
+VERSION = 2
+
+ARRAYS = [
+    'node_offsets', 'node_keys', 'node_key_nodes', 'match_keys', 'match_nodes',
+    'edge_offsets', 'edge_keys', 'edge_key_edges',
+    'edge_subjects', 'edge_objects', 'edge_label_codes', 'edge_relation_codes',
+    'out_offsets', 'out_neighbors', 'out_labels', 'out_edges',
+    'in_offsets', 'in_neighbors', 'in_labels', 'in_edges',
+]
+
+BUFFERS = ['node_data', 'edge_data']
+
+
+def lookup(keys:np.ndarray, values:np.ndarray, key:bytes) -> np.ndarray:
+    """
+    The values of the key in the sorted keys
+    """
+    if len(key) > keys.dtype.itemsize:
+        return EMPTY
+    return values[np.searchsorted(keys, key, 'left'):np.searchsorted(keys, key, 'right')]
+
+
+def window(offset, size) -> tuple:
+    """
+    The start and stop of a page, like SKIP and LIMIT in Cypher
+    """
+    start = offset if isinstance(offset, int) and offset >= 0 else 0
+    stop = start + size if isinstance(size, int) and size >= 1 else None
+    return start, stop
+
+
+class SnapshotBackend(Backend):
+    """
+    Reads the knowledge graph from the snapshot directory at `path`.
+    """
+    def __init__(self, path:str):
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.isfile(meta_path):
+            raise FileNotFoundError('{} does not exist, it can be built with tkg-beacon build-snapshot'.format(meta_path))
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        if meta.get('version') != VERSION:
+            raise ValueError('{} is a snapshot of version {}, rebuild it with tkg-beacon build-snapshot'.format(path, meta.get('version')))
+
+        self.path = path
+        self.node_count = meta['nodes']
+        self.edge_count = meta['edges']
+        self.edge_labels = {edge_label: code for code, edge_label in enumerate(meta['edge_labels'])}
+        self.relations = {relation: code for code, relation in enumerate(meta['relations'])}
+
+        for name in ARRAYS:
+            setattr(self, name, load_array(os.path.join(path, name + '.npy')))
+        for name in BUFFERS:
+            setattr(self, name, load_buffer(os.path.join(path, name + '.bin')))
+
+        self.table = NodeTable(path, meta['categories'], meta['prefixes'])
+
+        logger.info('Mapped a snapshot of {} nodes and {} edges'.format(self.node_count, self.edge_count))
+
+    def node(self, i) -> Properties:
+        return Properties(json.loads(self.node_data[self.node_offsets[i]:self.node_offsets[i + 1]]))
+
+    def edge(self, i) -> Relation:
+        return Relation(json.loads(self.edge_data[self.edge_offsets[i]:self.edge_offsets[i + 1]]))
+
+    def nodes_with_id(self, curie:str) -> np.ndarray:
+        """
+        The nodes whose id is the CURIE, ignoring case, in order
+        """
+        return np.sort(lookup(self.node_keys, self.node_key_nodes, curie.lower().encode()))
+
+    def select(self, ids=None, keywords=None, categories=None):
+        """
+        The sorted nodes that have any of the ids, any of the keywords and any
+        of the categories, or None if no constraint is given
+        """
+        selected = None
+
+        def intersect(found):
+            return found if selected is None else np.intersect1d(selected, found, assume_unique=True)
+
+        if ids is not None:
+            selected = intersect(np.unique(np.concatenate([EMPTY] + [self.nodes_with_id(curie) for curie in ids])))
+
+        if keywords is not None:
+            selected = intersect(np.unique(np.concatenate([EMPTY] + [self.table.keyword_nodes(keyword) for keyword in keywords])))
+
+        if categories is not None:
+            selected = intersect(np.flatnonzero(self.table.category_mask(categories)).astype(np.int32))
+
+        return selected
+
+    def concepts(self, keywords=None, categories=None, offset=None, size=None, prefixes=None):
+        """
+        Concepts can also be filtered on the prefixes of their ids, which
+        only this backend supports
+        """
+        if size is None:
+            size = 100
+
+        start, stop = window(offset, size)
+        mask = self.table.mask(categories, prefixes)
+
+        if keywords is not None:
+            # Concepts that match the most keywords first
+            found, counts = self.table.matching(keywords, mask)
+            ids = found[np.lexsort((found, -counts))][start:stop]
+        elif mask is not None:
+            ids = np.flatnonzero(mask)[start:stop]
+        else:
+            ids = range(start, self.node_count if stop is None else min(stop, self.node_count))
+
+        for i in ids:
+            node = self.node(i)
+            yield node['id'], node['name'], node['category'], node['description']
+
+    def concept_details(self, concept_id):
+        for i in self.nodes_with_id(concept_id)[:1]:
+            node = self.node(i)
+            yield dict(
+                id=node['id'],
+                uri=node['uri'],
+                iri=node['iri'],
+                name=node['name'],
+                category=node['category'],
+                symbol=node['symbol'],
+                description=node['description'],
+                synonyms=node['synonym'],
+                clique=node['clique'],
+                xrefs=node['xrefs'],
+                node=node
+            )
+
+    def exact_matches(self, c):
+        for input_id in c:
+            nodes = {int(i): self.node(i) for i in lookup(self.match_keys, self.match_nodes, input_id.encode())}
+            for i in self.nodes_with_id(input_id):
+                node = self.node(i)
+                if node['id'] == input_id:
+                    nodes[int(i)] = node
+            for node in sorted(nodes.values(), key=lambda node: node['id']):
+                yield dict(input_id=input_id, match_id=node['id'], xrefs=node['xrefs'], clique=node['clique'])
+
+    def statement_edges(self, subjects=None, objects=None, edge_label=None, relation=None) -> np.ndarray:
+        """
+        The sorted edges from any of the subjects to any of the objects, with
+        the edge label and relation, each of which may be None to match any
+        """
+        label = relation_code = None
+        if edge_label is not None:
+            label = self.edge_labels.get(edge_label)
+            if label is None:
+                return EMPTY
+        if relation is not None:
+            relation_code = self.relations.get(relation)
+            if relation_code is None:
+                return EMPTY
+
+        # Start from the edges of whichever end is constrained, and filter
+        # them by the other end
+        if subjects is not None:
+            positions = ranges(self.out_offsets, subjects)
+            edges, neighbors, labels, others = self.out_edges[positions], self.out_neighbors[positions], self.out_labels[positions], objects
+        elif objects is not None:
+            positions = ranges(self.in_offsets, objects)
+            edges, neighbors, labels, others = self.in_edges[positions], self.in_neighbors[positions], self.in_labels[positions], None
+        elif label is not None:
+            edges = np.flatnonzero(self.edge_label_codes == label)
+            neighbors, labels, others = None, None, None
+        else:
+            edges, neighbors, labels, others = None, None, None, None
+
+        if edges is None:
+            # Every edge, of the relation if given
+            if relation_code is None:
+                return np.arange(self.edge_count)
+            return np.flatnonzero(self.edge_relation_codes == relation_code)
+
+        keep = np.ones(len(edges), dtype=bool)
+        if others is not None:
+            keep &= np.isin(neighbors, others)
+        if labels is not None and label is not None:
+            keep &= labels == label
+        if relation_code is not None:
+            keep &= self.edge_relation_codes[edges] == relation_code
+
+        return np.sort(edges[keep])
+
+    def statements(self, s=None, s_keywords=None, s_categories=None, edge_label=None, relation=None, t=None, t_keywords=None, t_categories=None, offset=None, size=None):
+        if size is None:
+            size = 100
+
+        start, stop = window(offset, size)
+
+        subjects = self.select(s, s_keywords, s_categories)
+        objects = self.select(t, t_keywords, t_categories)
+
+        for i in self.statement_edges(subjects, objects, edge_label, relation)[start:stop]:
+            edge = self.edge(i)
+            yield dict(
+                subject=self.node(self.edge_subjects[i]),
+                object=self.node(self.edge_objects[i]),
+                edge_type=edge['edge_label'],
+                edge_label=edge['edge_label'],
+                relation=edge['relation'],
+                negated=edge['negated'],
+                statement_id=edge['id']
+            )
+
+    def statement_details(self, statement_id):
+        ids = parse_statement_id(statement_id)
+
+        if len(ids) == 1:
+            found = [(self.edge_subjects[i], i, self.edge_objects[i]) for i in lookup(self.edge_keys, self.edge_key_edges, statement_id.encode())[:1]]
+        else:
+            subject_id, edge_label, object_id = ids
+            subjects = np.array([i for i in self.nodes_with_id(subject_id) if self.node(i)['id'] == subject_id], dtype=np.int32)
+            objects = np.array([i for i in self.nodes_with_id(object_id) if self.node(i)['id'] == object_id], dtype=np.int32)
+            labels = [code for label, code in self.edge_labels.items() if label.lower() == edge_label.lower()]
+
+            # Edges in either direction, like the Cypher query
+            found = []
+            for a, b in [(subjects, objects), (objects, subjects)]:
+                positions = ranges(self.out_offsets, a)
+                keep = np.isin(self.out_neighbors[positions], b) & np.isin(self.out_labels[positions], labels)
+                for i in self.out_edges[positions][keep]:
+                    if a is subjects:
+                        found.append((self.edge_subjects[i], i, self.edge_objects[i]))
+                    else:
+                        found.append((self.edge_objects[i], i, self.edge_subjects[i]))
+
+        for subject, i, obj in found[:1]:
+            yield dict(subject=self.node(subject), relation=self.edge(i), object=self.node(obj))
+
+    def summary_source(self):
+        from beacon_controller.summaries import MemorySource
+        nodes = [self.node(i) for i in range(self.node_count)]
+        edges = [self.edge(i) for i in range(self.edge_count)]
+        return MemorySource(nodes, edges)
+
+
+def csr(rows:np.ndarray, row_count:int) -> tuple:
+    """
+    The offsets of each row, and the items (given by their row) in row order
+    """
+    offsets = np.zeros(row_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=row_count), out=offsets[1:])
+    return offsets, np.argsort(rows, kind='stable').astype(np.int32)
+
+
+def sorted_keys(keys:list, values) -> tuple:
+    keys = np.array(keys, dtype=bytes) if keys != [] else np.zeros(0, dtype='S1')
+    order = np.argsort(keys, kind='stable')
+    return keys[order], np.asarray(values, dtype=np.int32)[order]
+
+
+def build(path:str, node_paths:list, edge_paths:list):
+    """
+    Builds a snapshot of KGX files in the directory at `path`, replacing it
+    once it is complete. Beacons that have the old snapshot mapped carry on
+    reading it until they are restarted.
+    """
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    def save(name, a):
+        np.save(os.path.join(tmp_path, name + '.npy'), a)
+
+    nodes = {}
+    edge_labels, relations = {}, {}
+    node_offsets = array('q', [0])
+    match_keys, match_nodes = [], array('i')
+    table = NodeTableWriter(tmp_path)
+
+    with open(os.path.join(tmp_path, 'node_data.bin'), 'wb') as data:
+        for node in kgx.iter_nodes(node_paths, edge_paths):
+            if 'id' not in node or node['id'] in nodes:
+                continue
+            i = nodes[node['id']] = len(nodes)
+
+            b = json.dumps(node).encode()
+            data.write(b)
+            node_offsets.append(node_offsets[-1] + len(b))
+
+            table.add(node)
+
+            for match in utils.listify(node.get('xrefs')) + utils.listify(node.get('clique')):
+                match_keys.append(match.encode())
+                match_nodes.append(i)
+
+    encodings = table.close()
+    save('node_offsets', np.frombuffer(node_offsets, dtype=np.int64))
+    for name, a in zip(['node_keys', 'node_key_nodes'], sorted_keys([i.lower().encode() for i in nodes], range(len(nodes)))):
+        save(name, a)
+    for name, a in zip(['match_keys', 'match_nodes'], sorted_keys(match_keys, match_nodes)):
+        save(name, a)
+    logger.info('Wrote {} nodes'.format(len(nodes)))
+
+    subjects, objects, labels, relation_codes = array('i'), array('i'), array('i'), array('i')
+    edge_offsets = array('q', [0])
+    edge_keys, edge_key_edges = [], array('i')
+    skipped = 0
+
+    with open(os.path.join(tmp_path, 'edge_data.bin'), 'wb') as data:
+        for edge in kgx.iter_edges(node_paths, edge_paths):
+            if edge.get('subject') not in nodes or edge.get('object') not in nodes or edge.get('edge_label') is None:
+                skipped += 1
+                continue
+            i = len(subjects)
+
+            subjects.append(nodes[edge['subject']])
+            objects.append(nodes[edge['object']])
+            labels.append(edge_labels.setdefault(edge['edge_label'], len(edge_labels)))
+            relation_codes.append(relations.setdefault(edge['relation'], len(relations)) if edge.get('relation') is not None else -1)
+
+            if edge.get('id') is not None:
+                edge_keys.append(edge['id'].encode())
+                edge_key_edges.append(i)
+
+            b = json.dumps(edge).encode()
+            data.write(b)
+            edge_offsets.append(edge_offsets[-1] + len(b))
+
+    if skipped > 0:
+        logger.warning('Skipped {} edges without an edge label or whose subject or object is not a node'.format(skipped))
+
+    subjects = np.frombuffer(subjects, dtype=np.int32)
+    objects = np.frombuffer(objects, dtype=np.int32)
+    labels = np.frombuffer(labels, dtype=np.int32)
+
+    save('edge_offsets', np.frombuffer(edge_offsets, dtype=np.int64))
+    save('edge_subjects', subjects)
+    save('edge_objects', objects)
+    save('edge_label_codes', labels)
+    save('edge_relation_codes', np.frombuffer(relation_codes, dtype=np.int32))
+    for name, a in zip(['edge_keys', 'edge_key_edges'], sorted_keys(edge_keys, edge_key_edges)):
+        save(name, a)
+
+    for direction, rows, neighbors in [('out', subjects, objects), ('in', objects, subjects)]:
+        offsets, edges = csr(rows, len(nodes))
+        save(direction + '_offsets', offsets)
+        save(direction + '_edges', edges)
+        save(direction + '_neighbors', neighbors[edges])
+        save(direction + '_labels', labels[edges])
+    logger.info('Wrote {} edges'.format(len(subjects)))
+
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(dict(
+            version=VERSION,
+            nodes=len(nodes),
+            edges=len(subjects),
+            categories=encodings['categories'],
+            prefixes=encodings['prefixes'],
+            edge_labels=sorted(edge_labels, key=edge_labels.get),
+            relations=sorted(relations, key=relations.get)
+        ), f)
+
+    old_path = path + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    logger.info('Built a snapshot of {} nodes and {} edges in {}'.format(len(nodes), len(subjects), path))
@@ -0,0 +1,336 @@
+"""
+A backend that reads the knowledge graph from a single SQLite file, built from
+KGX files by `tkg-beacon load-sqlite`. Name and synonym keyword search uses an
+FTS5 table with the trigram tokenizer (SQLite 3.34 or later), which matches
+substrings the same way as CONTAINS in the Cypher queries.
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+
+from beacon_controller import utils
+
+from .backend import Backend, Properties, Relation, parse_statement_id
+from . import kgx
+
+logger = logging.getLogger(__file__)
+
+SCHEMA = """
+CREATE TABLE nodes (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    id_lower TEXT NOT NULL,
+    name TEXT,
+    category TEXT,
+    description TEXT,
+    properties TEXT NOT NULL
+);
+CREATE TABLE categories (node INTEGER NOT NULL, category TEXT NOT NULL);
+CREATE TABLE synonyms (node INTEGER NOT NULL, synonym TEXT NOT NULL);
+CREATE TABLE xrefs (node INTEGER NOT NULL, xref TEXT NOT NULL, clique INTEGER NOT NULL);
+CREATE TABLE edges (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT,
+    subject INTEGER NOT NULL,
+    object INTEGER NOT NULL,
+    edge_label TEXT NOT NULL,
+    relation TEXT,
+    properties TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE names USING fts5(node UNINDEXED, text, tokenize='trigram');
+"""
+
+# Created once the tables have been filled, which is much faster than keeping
+# them up to date row by row. Each covers the columns its queries read, so
+# that they never have to look the row up in the table.
+INDEXES = """
+CREATE UNIQUE INDEX nodes_id ON nodes (id);
+CREATE INDEX nodes_id_lower ON nodes (id_lower);
+CREATE INDEX categories_category ON categories (category, node);
+CREATE INDEX categories_node ON categories (node, category);
+CREATE INDEX synonyms_node ON synonyms (node, synonym);
+CREATE INDEX xrefs_xref ON xrefs (xref, node);
+CREATE INDEX edges_subject ON edges (subject, edge_label, relation, object);
+CREATE INDEX edges_object ON edges (object, edge_label, relation, subject);
+CREATE INDEX edges_edge_label ON edges (edge_label, relation, subject, object);
+CREATE INDEX edges_id ON edges (id);
+"""
+
+# FTS5 trigrams only match keywords of at least three characters
+MIN_TRIGRAM_LENGTH = 3
+
+
+def phrase(keyword:str) -> str:
+    return '"{}"'.format(keyword.replace('"', '""'))
+
+
+class SQLiteBackend(Backend):
+    """
+    Reads the knowledge graph from the SQLite file at `path`, opened read only
+    by each thread that uses it. `mmap_size` bytes of the file are memory
+    mapped, so that once warm the beacon is served from the page cache.
+    """
+    def __init__(self, path:str, mmap_size:int=2**30):
+        if not os.path.isfile(path):
+            raise FileNotFoundError('{} does not exist, it can be built with tkg-beacon load-sqlite'.format(path))
+        self.path = path
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        c = getattr(self._local, 'connection', None)
+        if c is None:
+            c = sqlite3.connect('file:{}?mode=ro'.format(self.path), uri=True, check_same_thread=False)
+            c.execute('PRAGMA mmap_size = {}'.format(int(self.mmap_size)))
+            self._local.connection = c
+        return c
+
+    def execute(self, q:str, args=()) -> list:
+        return self.connection().execute(q, args).fetchall()
+
+    def keyword_nodes(self, keywords:list, args:list) -> str:
+        """
+        A query of the nodes whose name or synonyms contain any of the
+        keywords, one row per keyword matched
+        """
+        queries = []
+        for keyword in keywords:
+            if len(keyword) >= MIN_TRIGRAM_LENGTH:
+                queries.append('SELECT DISTINCT node FROM names WHERE names MATCH ?')
+                args.append(phrase(keyword))
+            else:
+                queries.append("SELECT DISTINCT node FROM names WHERE text LIKE ? ESCAPE '\\'")
+                args.append('%{}%'.format(keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')))
+        return ' UNION ALL '.join(queries)
+
+    def node_conditions(self, column:str, ids, keywords, categories, args:list) -> list:
+        conditions = []
+        if ids is not None:
+            conditions.append('{} IN (SELECT rowid FROM nodes WHERE id_lower IN ({}))'.format(column, ', '.join('?' * len(ids))))
+            args += [i.lower() for i in ids]
+        if keywords is not None:
+            conditions.append('{} IN ({})'.format(column, self.keyword_nodes(keywords, args)))
+        if categories is not None:
+            conditions.append('{} IN (SELECT node FROM categories WHERE category IN ({}))'.format(column, ', '.join('?' * len(categories))))
+            args += [c.lower() for c in categories]
+        return conditions
+
+    def concepts(self, keywords=None, categories=None, offset=None, size=None):
+        if size is None:
+            size = 100
+
+        args = []
+
+        if keywords is not None:
+            q = 'SELECT n.id, n.name, n.category, n.description FROM ({}) AS k JOIN nodes AS n ON n.rowid = k.node'.format(
+                self.keyword_nodes(keywords, args)
+            )
+        else:
+            q = 'SELECT n.id, n.name, n.category, n.description FROM nodes AS n'
+
+        conditions = self.node_conditions('n.rowid', None, None, categories, args)
+        if conditions != []:
+            q += ' WHERE ' + ' AND '.join(conditions)
+
+        if keywords is not None:
+            # Concepts that match the most keywords first
+            q += ' GROUP BY n.rowid ORDER BY COUNT(*) DESC, n.rowid'
+
+        q += ' LIMIT ? OFFSET ?'
+        args += [size if isinstance(size, int) and size >= 1 else -1, offset if isinstance(offset, int) and offset >= 0 else 0]
+
+        for curie, name, category, description in self.execute(q, args):
+            yield curie, name, json.loads(category) if category is not None else None, description
+
+    def concept_details(self, concept_id):
+        rows = self.execute('SELECT properties FROM nodes WHERE id_lower = ? LIMIT 1', [concept_id.lower()])
+
+        for properties, in rows:
+            node = Properties(json.loads(properties))
+            yield dict(
+                id=node['id'],
+                uri=node['uri'],
+                iri=node['iri'],
+                name=node['name'],
+                category=node['category'],
+                symbol=node['symbol'],
+                description=node['description'],
+                synonyms=node['synonym'],
+                clique=node['clique'],
+                xrefs=node['xrefs'],
+                node=node
+            )
+
+    def exact_matches(self, c):
+        q = """
+        SELECT id, properties FROM nodes WHERE id = ?
+        UNION
+        SELECT n.id, n.properties FROM xrefs AS x JOIN nodes AS n ON n.rowid = x.node WHERE x.xref = ?
+        """
+        for input_id in c:
+            for match_id, properties in self.execute(q, [input_id, input_id]):
+                node = Properties(json.loads(properties))
+                yield dict(input_id=input_id, match_id=match_id, xrefs=node['xrefs'], clique=node['clique'])
+
+    def statements(self, s=None, s_keywords=None, s_categories=None, edge_label=None, relation=None, t=None, t_keywords=None, t_categories=None, offset=None, size=None):
+        if size is None:
+            size = 100
+
+        args = []
+        conditions = self.node_conditions('e.subject', s, s_keywords, s_categories, args)
+        conditions += self.node_conditions('e.object', t, t_keywords, t_categories, args)
+
+        if edge_label is not None:
+            conditions.append('e.edge_label = ?')
+            args.append(edge_label)
+        if relation is not None:
+            conditions.append('e.relation = ?')
+            args.append(relation)
+
+        q = """
+        SELECT e.properties, s.properties, o.properties
+        FROM edges AS e
+        JOIN nodes AS s ON s.rowid = e.subject
+        JOIN nodes AS o ON o.rowid = e.object
+        """
+        if conditions != []:
+            q += ' WHERE ' + ' AND '.join(conditions)
+
+        q += ' LIMIT ? OFFSET ?'
+        args += [size if isinstance(size, int) and size >= 1 else -1, offset if isinstance(offset, int) and offset >= 0 else 0]
+
+        for edge, subject, obj in self.execute(q, args):
+            edge = Relation(json.loads(edge))
+            yield dict(
+                subject=Properties(json.loads(subject)),
+                object=Properties(json.loads(obj)),
+                edge_type=edge['edge_label'],
+                edge_label=edge['edge_label'],
+                relation=edge['relation'],
+                negated=edge['negated'],
+                statement_id=edge['id']
+            )
+
+    def statement_details(self, statement_id):
+        ids = parse_statement_id(statement_id)
+
+        if len(ids) == 1:
+            q = """
+            SELECT e.properties, s.properties, o.properties
+            FROM edges AS e
+            JOIN nodes AS s ON s.rowid = e.subject
+            JOIN nodes AS o ON o.rowid = e.object
+            WHERE e.id = ?
+            LIMIT 1
+            """
+            rows = self.execute(q, [statement_id])
+        else:
+            subject_id, edge_label, object_id = ids
+            q = """
+            SELECT e.properties, s.properties, o.properties
+            FROM nodes AS s, nodes AS o, edges AS e
+            WHERE s.id = ? AND o.id = ? AND (
+                (e.subject = s.rowid AND e.object = o.rowid) OR
+                (e.subject = o.rowid AND e.object = s.rowid)
+            ) AND lower(e.edge_label) = lower(?)
+            LIMIT 1
+            """
+            rows = self.execute(q, [subject_id, object_id, edge_label])
+
+        for edge, subject, obj in rows:
+            yield dict(
+                subject=Properties(json.loads(subject)),
+                relation=Relation(json.loads(edge)),
+                object=Properties(json.loads(obj))
+            )
+
+    def summary_source(self):
+        """
+        The whole graph is read into a MemorySource, which is fine for the
+        sizes of graph this backend is meant for
+        """
+        from beacon_controller.summaries import MemorySource
+        nodes = [json.loads(p) for p, in self.execute('SELECT properties FROM nodes')]
+        edges = [json.loads(p) for p, in self.execute('SELECT properties FROM edges')]
+        return MemorySource(nodes, edges)
+
+
+def build(path:str, node_paths:list, edge_paths:list, batch_size:int=50000):
+    """
+    Loads KGX files into a new SQLite file at `path`, replacing it once it is
+    complete. Rows are inserted in transactions of `batch_size` nodes or
+    edges, without journaling, and indexed at the end.
+    """
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    c = sqlite3.connect(tmp_path)
+    c.execute('PRAGMA journal_mode = OFF')
+    c.execute('PRAGMA synchronous = OFF')
+    c.executescript(SCHEMA)
+
+    rowids = {}
+
+    def insert_nodes(batch):
+        with c:
+            c.executemany('INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)', [
+                (rowids[n['id']], n['id'], n['id'].lower(), n.get('name'), json.dumps(n['category']) if 'category' in n else None, n.get('description'), json.dumps(n))
+                for n in batch
+            ])
+            c.executemany('INSERT INTO categories VALUES (?, ?)', [
+                (rowids[n['id']], category.lower()) for n in batch for category in utils.listify(n.get('category'))
+            ])
+            c.executemany('INSERT INTO synonyms VALUES (?, ?)', [
+                (rowids[n['id']], synonym) for n in batch for synonym in utils.listify(n.get('synonym'))
+            ])
+            c.executemany('INSERT INTO xrefs VALUES (?, ?, ?)', [
+                (rowids[n['id']], xref, int(clique)) for n in batch for clique, key in [(False, 'xrefs'), (True, 'clique')] for xref in utils.listify(n.get(key))
+            ])
+            c.executemany('INSERT INTO names VALUES (?, ?)', [
+                (rowids[n['id']], text) for n in batch for text in [n.get('name')] + utils.listify(n.get('synonym')) if isinstance(text, str)
+            ])
+
+    def insert_edges(batch):
+        with c:
+            c.executemany('INSERT INTO edges (id, subject, object, edge_label, relation, properties) VALUES (?, ?, ?, ?, ?, ?)', [
+                (e.get('id'), rowids[e['subject']], rowids[e['object']], e['edge_label'], e.get('relation'), json.dumps(e))
+                for e in batch
+            ])
+
+    batch = []
+    for node in kgx.iter_nodes(node_paths, edge_paths):
+        if 'id' not in node or node['id'] in rowids:
+            continue
+        rowids[node['id']] = len(rowids) + 1
+        batch.append(node)
+        if len(batch) >= batch_size:
+            insert_nodes(batch)
+            batch = []
+    insert_nodes(batch)
+
+    batch, skipped = [], 0
+    for edge in kgx.iter_edges(node_paths, edge_paths):
+        if edge.get('subject') not in rowids or edge.get('object') not in rowids or edge.get('edge_label') is None:
+            skipped += 1
+            continue
+        batch.append(edge)
+        if len(batch) >= batch_size:
+            insert_edges(batch)
+            batch = []
+    insert_edges(batch)
+
+    if skipped > 0:
+        logger.warning('Skipped {} edges without an edge label or whose subject or object is not a node'.format(skipped))
+
+    logger.info('Indexing')
+    c.executescript(INDEXES)
+    c.execute("INSERT INTO names (names) VALUES ('optimize')")
+    c.execute('ANALYZE')
+    c.commit()
+    c.close()
+
+    os.replace(tmp_path, path)
+    logger.info('Loaded {} nodes into {}'.format(len(rowids), path))
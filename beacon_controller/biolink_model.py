@@ -1,17 +1,24 @@
 import bmt
 
+from beacon_controller.singleflight import initializers
+
 tk = None
 
 DEFAULT_EDGE_LABEL = 'related_to'
 DEFAULT_CATEGORY = 'named thing'
 
 
-def toolkit_instance():
+def load_toolkit():
     global tk
 
     if tk is None:
         tk = bmt.Toolkit()
 
+
+def toolkit_instance():
+    if tk is None:
+        initializers.do('toolkit', load_toolkit, label='toolkit')
+
     return tk
 
 
@@ -0,0 +1,220 @@
+"""
+Command line interface, installed as `tkg-beacon`:
+
+    tkg-beacon summarize --workers 8
+    tkg-beacon summarize --summary node --summary edge --sample-size 10000
+    tkg-beacon summarize --provided-by hgnc
+    tkg-beacon load-sqlite --nodes nodes.tsv --edges edges.tsv
+    tkg-beacon build-snapshot --nodes nodes.tsv --edges edges.tsv
+    tkg-beacon slow-queries --sort p95 --top 5
+"""
+import argparse
+import logging
+
+from beacon_controller import summaries
+
+
+def timestamp(value:str):
+    """
+    Load timestamps may be stored as numbers (e.g. epoch seconds) or strings
+    (e.g. ISO 8601 dates), and must be compared as such.
+    """
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def summarize(args):
+    batch = None
+    if args.provided_by is not None or args.since is not None:
+        batch = summaries.Batch(
+            provided_by=args.provided_by,
+            timestamp_property=args.timestamp_property if args.since is not None else None,
+            since=args.since
+        )
+
+    summarizer = summaries.Summarizer(
+        directory=args.directory,
+        workers=args.workers,
+        sample_size=args.sample_size,
+        confidence=args.confidence,
+        batch=batch
+    )
+    summarizer.run(args.summary or summaries.SUMMARIES, restart=args.restart)
+
+
+def kgx_paths(args) -> tuple:
+    from beacon_controller import backends
+
+    node_paths = args.nodes if args.nodes is not None else backends.kgx_paths('nodes')
+    edge_paths = args.edges if args.edges is not None else backends.kgx_paths('edges')
+    return node_paths, edge_paths
+
+
+def load_sqlite(args):
+    from beacon_controller import backends
+    from beacon_controller.backends import sqlite_backend
+
+    sqlite_backend.build(args.output or backends.sqlite_path(), *kgx_paths(args), batch_size=args.batch_size)
+
+
+def build_snapshot(args):
+    from beacon_controller import backends
+    from beacon_controller.backends import snapshot_backend
+
+    snapshot_backend.build(args.output or backends.snapshot_path(), *kgx_paths(args))
+
+
+def slow_queries(args):
+    from beacon_controller.database import slow_log
+
+    if args.paths:
+        paths = args.paths
+    else:
+        from beacon_controller.database import config as db_config
+        paths = [db_config.slow_query_log]
+
+    summaries = slow_log.summarize(slow_log.read(paths))
+    print(slow_log.report(summaries, sort=args.sort, top=args.top, operators=args.operators))
+
+
+def add_kgx_arguments(parser):
+    parser.add_argument(
+        '--nodes',
+        nargs='+',
+        help='KGX node files, TSV or JSON (default: kgx.nodes of config.yaml)'
+    )
+    parser.add_argument(
+        '--edges',
+        nargs='+',
+        help='KGX edge files, TSV or JSON (default: kgx.edges of config.yaml)'
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='tkg-beacon')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_summarize = subparsers.add_parser(
+        'summarize',
+        help='Generate the node, edge, namespace and prefix summaries that the beacon is served from'
+    )
+    parser_summarize.add_argument(
+        '--summary',
+        action='append',
+        choices=summaries.SUMMARIES,
+        help='Summary to generate, may be given more than once (default: all of them)'
+    )
+    parser_summarize.add_argument(
+        '--workers',
+        type=int,
+        default=4,
+        help='Number of partitions to summarize concurrently (default: 4)'
+    )
+    parser_summarize.add_argument(
+        '--directory',
+        default=summaries.directory,
+        help='Directory to write the summaries to (default: data/{beacon name}/)'
+    )
+    parser_summarize.add_argument(
+        '--restart',
+        action='store_true',
+        help='Ignore the checkpoint of an interrupted run and start over'
+    )
+    parser_summarize.add_argument(
+        '--sample-size',
+        type=int,
+        help='Estimate the node and edge summaries from a uniform sample of about this many nodes per label and edges per type'
+    )
+    parser_summarize.add_argument(
+        '--confidence',
+        type=float,
+        default=0.95,
+        help='Confidence level of the frequency bounds of estimated summaries (default: 0.95)'
+    )
+    incremental = parser_summarize.add_mutually_exclusive_group()
+    incremental.add_argument(
+        '--provided-by',
+        help='Only summarize the nodes and edges with this provided_by value, and add them to the existing summaries'
+    )
+    incremental.add_argument(
+        '--since',
+        type=timestamp,
+        help='Only summarize the nodes and edges whose --timestamp-property is at least this value, and add them to the existing summaries'
+    )
+    parser_summarize.add_argument(
+        '--timestamp-property',
+        default='load_timestamp',
+        help='Property holding the time that a node or edge was loaded (default: load_timestamp)'
+    )
+    parser_summarize.set_defaults(func=summarize)
+
+    parser_load_sqlite = subparsers.add_parser(
+        'load-sqlite',
+        help='Load KGX node and edge files into the SQLite file of the sqlite backend'
+    )
+    add_kgx_arguments(parser_load_sqlite)
+    parser_load_sqlite.add_argument(
+        '--output',
+        help='SQLite file to write (default: sqlite.path of config.yaml)'
+    )
+    parser_load_sqlite.add_argument(
+        '--batch-size',
+        type=int,
+        default=50000,
+        help='Number of nodes or edges inserted per transaction (default: 50000)'
+    )
+    parser_load_sqlite.set_defaults(func=load_sqlite)
+
+    parser_build_snapshot = subparsers.add_parser(
+        'build-snapshot',
+        help='Build the snapshot of KGX node and edge files that the snapshot backend maps'
+    )
+    add_kgx_arguments(parser_build_snapshot)
+    parser_build_snapshot.add_argument(
+        '--output',
+        help='Directory to write the snapshot to (default: snapshot.path of config.yaml)'
+    )
+    parser_build_snapshot.set_defaults(func=build_snapshot)
+
+    parser_slow_queries = subparsers.add_parser(
+        'slow-queries',
+        help='Report on the slowest shapes of query in slow query logs'
+    )
+    parser_slow_queries.add_argument(
+        'paths',
+        nargs='*',
+        help='Slow query logs, e.g. gathered from several hosts (default: slow_query_log of config.yaml)'
+    )
+    parser_slow_queries.add_argument(
+        '--sort',
+        choices=['total', 'count', 'p50', 'p95', 'max', 'rows'],
+        default='total',
+        help='Statistic to rank shapes of query by (default: total)'
+    )
+    parser_slow_queries.add_argument(
+        '--top',
+        type=int,
+        default=10,
+        help='Number of shapes of query to report (default: 10)'
+    )
+    parser_slow_queries.add_argument(
+        '--operators',
+        type=int,
+        default=5,
+        help='Number of operators with the most database hits to show from each profile (default: 5)'
+    )
+    parser_slow_queries.set_defaults(func=slow_queries)
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,9 @@ from swagger_server.models.beacon_concept_with_details import BeaconConceptWithD
 from swagger_server.models.exact_match_response import ExactMatchResponse
 from swagger_server.models.beacon_concept_detail import BeaconConceptDetail
 
-import beacon_controller.database as db
-from beacon_controller.database import Node
-from beacon_controller import utils
+from beacon_controller import utils, config
+from beacon_controller.result_cache import cache, concepts_key, exact_matches_key, CONCEPTS, EXACT_MATCHES
+from beacon_controller.backends import backend
 
 from beacon_controller import biolink_model as blm
 
@@ -27,35 +27,11 @@ def create_details_dict(node):
     return d
 
 
-def get_concept_details(concept_id):  # noqa: E501
-    """get_concept_details
-
-    Retrieves details for a specified concepts in the system, as specified by a (url-encoded) CURIE identifier of a concept known the given knowledge source.  # noqa: E501
-
-    :param concept_id: (url-encoded) CURIE identifier of concept of interest
-    :type concept_id: str
-
-    :rtype: BeaconConceptWithDetails
+def concept_details(results) -> BeaconConceptWithDetails:
     """
-    q = """
-    MATCH (n) WHERE LOWER(n.id)=LOWER({conceptId})
-    RETURN
-        n.id AS id,
-        n.uri AS uri,
-        n.iri AS iri,
-        n.name AS name,
-        n.category AS category,
-        n.symbol AS symbol,
-        n.description AS description,
-        n.synonym AS synonyms,
-        n.clique AS clique,
-        n.xrefs AS xrefs,
-        n AS node
-    LIMIT 1
+    Builds the response of `get_concept_details` from the records found by
+    the backend
     """
-
-    results = db.query(q, conceptId=concept_id)
-
     for result in results:
         uri = result['uri'] if result['uri'] is not None else result['iri']
 
@@ -87,71 +63,35 @@ def get_concept_details(concept_id):  # noqa: E501
         return BeaconConceptWithDetails()
 
 
-def get_concepts(keywords=None, categories=None, offset=None, size=None):  # noqa: E501
-    """get_concepts
+def get_concept_details(concept_id):  # noqa: E501
+    """get_concept_details
 
-    Retrieves a list of whose concept in the beacon knowledge base with names and/or synonyms matching a set of keywords or substrings. The results returned should generally be returned in order of the quality of the match, that is, the highest ranked concepts should exactly match the most keywords, in the same order as the keywords were given. Lower quality hits with fewer keyword matches or out-of-order keyword matches, should be returned lower in the list.  # noqa: E501
+    Retrieves details for a specified concepts in the system, as specified by a (url-encoded) CURIE identifier of a concept known the given knowledge source.  # noqa: E501
 
-    :param keywords: (Optional) array of keywords or substrings against which to match concept names and synonyms
-    :type keywords: List[str]
-    :param categories: (Optional) array set of concept categories - specified as Biolink name labels codes gene, pathway, etc. - to which to constrain concepts matched by the main keyword search (see [Biolink Model](https://biolink.github.io/biolink-model) for the full list of terms)
-    :type categories: List[str]
-    :param offset: offset (cursor position) to next batch of statements of amount &#39;size&#39; to return.
-    :type offset: int
-    :param size: maximum number of concept entries requested by the client; if this argument is omitted, then the query is expected to returned all the available data for the query
-    :type size: int
+    :param concept_id: (url-encoded) CURIE identifier of concept of interest
+    :type concept_id: str
 
-    :rtype: List[BeaconConcept]
+    :rtype: BeaconConceptWithDetails
     """
-    if size is None:
-        size = 100;
+    return concept_details(backend().concept_details(concept_id))
 
-    conjuncts = []
-    unwinds = []
-    data = {}
-
-    if keywords is not None:
-        unwinds.append("[x IN {keywords} | toLower(x)] AS keyword")
-        disjuncts = [
-            "toLower(n.name) CONTAINS keyword",
-            "ANY(syn IN n.synonym WHERE toLower(syn) CONTAINS keyword)"
-        ]
-        conjuncts.append(" OR ".join(disjuncts))
-        data['keywords'] = keywords
-
-    if categories is not None:
-        unwinds.append("[x IN {categories} | toLower(x)] AS category")
-        conjuncts.append("ANY(category IN {categories} WHERE category IN labels(n))")
-        data['categories'] = categories
-
-    q = "MATCH (n)"
-
-    if unwinds != []:
-        q = "UNWIND " + ' UNWIND '.join(unwinds) + " " + q
-
-    if conjuncts != []:
-        q = q + " WHERE (" + ') AND ('.join(conjuncts) + ")"
-
-    q += " RETURN n"
-
-    if isinstance(offset, int) and offset >= 0:
-        q += f' SKIP {offset}'
-    if isinstance(size, int) and size >= 1:
-        q += f' LIMIT {size}'
-
-    nodes = db.query(q, Node, keywords=keywords, categories=categories, limit=size)
 
+def concepts(rows) -> List[BeaconConcept]:
+    """
+    Builds the response of `get_concepts` from (id, name, category,
+    description) rows
+    """
     concepts = []
 
-    for node in nodes:
-        if all(len(category) == 1 for category in node.category):
-            node.category = [''.join(node.category)]
-        categories = utils.standardize(node.category)
+    for curie, name, category, description in rows:
+        if category is not None and all(len(c) == 1 for c in category):
+            category = [''.join(category)]
+        categories = utils.standardize(category)
         concept = BeaconConcept(
-            id=node.curie,
-            name=node.name,
+            id=curie,
+            name=name,
             categories=categories,
-            description=node.description
+            description=description
         )
 
         concepts.append(concept)
@@ -159,33 +99,31 @@ def get_concepts(keywords=None, categories=None, offset=None, size=None):  # noq
     return concepts
 
 
-def get_exact_matches_to_concept_list(c):  # noqa: E501
-    """get_exact_matches_to_concept_list
-
-    Given an input array of [CURIE](https://www.w3.org/TR/curie/) identifiers of known exactly matched concepts [*sensa*-SKOS](http://www.w3.org/2004/02/skos/core#exactMatch), retrieves the list of [CURIE](https://www.w3.org/TR/curie/) identifiers of additional concepts that are deemed by the given knowledge source to be exact matches to one or more of the input concepts **plus** whichever concept identifiers from the input list were specifically matched to these additional concepts, thus giving the whole known set of equivalent concepts known to this particular knowledge source.  If an empty set is returned, the it can be assumed that the given knowledge source does not know of any new equivalent concepts matching the input set. The caller of this endpoint can then decide whether or not to treat  its input identifiers as its own equivalent set.  # noqa: E501
+def get_concepts(keywords=None, categories=None, offset=None, size=None):  # noqa: E501
+    """get_concepts
 
-    :param c: an array set of [CURIE-encoded](https://www.w3.org/TR/curie/) identifiers of concepts thought to be exactly matching concepts, to be used in a search for additional exactly matching concepts [*sensa*-SKOS](http://www.w3.org/2004/02/skos/core#exactMatch).
-    :type c: List[str]
+    Retrieves a list of whose concept in the beacon knowledge base with names and/or synonyms matching a set of keywords or substrings. The results returned should generally be returned in order of the quality of the match, that is, the highest ranked concepts should exactly match the most keywords, in the same order as the keywords were given. Lower quality hits with fewer keyword matches or out-of-order keyword matches, should be returned lower in the list.  # noqa: E501
 
-    :rtype: List[ExactMatchResponse]
-    """
-    c = [utils.fix_curie(curie) for curie in c]
+    :param keywords: (Optional) array of keywords or substrings against which to match concept names and synonyms
+    :type keywords: List[str]
+    :param categories: (Optional) array set of concept categories - specified as Biolink name labels codes gene, pathway, etc. - to which to constrain concepts matched by the main keyword search (see [Biolink Model](https://biolink.github.io/biolink-model) for the full list of terms)
+    :type categories: List[str]
+    :param offset: offset (cursor position) to next batch of statements of amount &#39;size&#39; to return.
+    :type offset: int
+    :param size: maximum number of concept entries requested by the client; if this argument is omitted, then the query is expected to returned all the available data for the query
+    :type size: int
 
-    q = """
-    UNWIND {id_list} AS input_id
-    MATCH (n) WHERE
-        n.id = input_id OR
-        input_id IN n.xrefs OR
-        input_id IN n.clique
-    RETURN
-        input_id AS input_id,
-        n.id AS match_id,
-        n.xrefs AS xrefs,
-        n.clique AS clique;
+    :rtype: List[BeaconConcept]
     """
+    key = concepts_key(keywords, categories, offset, size)
+    return concepts(cache.cached(CONCEPTS, key, lambda: backend().concepts(keywords, categories, offset, size)))
 
-    results = db.query(q, id_list=c)
 
+def exact_matches(c, results) -> List[ExactMatchResponse]:
+    """
+    Builds the response of `get_exact_matches_to_concept_list` for the CURIEs
+    `c` from the records found by the backend
+    """
     exactmatch_dict = defaultdict(set)
 
     for result in results:
@@ -220,3 +158,18 @@ def get_exact_matches_to_concept_list(c):  # noqa: E501
             ))
 
     return exactmatch_responses
+
+
+def get_exact_matches_to_concept_list(c):  # noqa: E501
+    """get_exact_matches_to_concept_list
+
+    Given an input array of [CURIE](https://www.w3.org/TR/curie/) identifiers of known exactly matched concepts [*sensa*-SKOS](http://www.w3.org/2004/02/skos/core#exactMatch), retrieves the list of [CURIE](https://www.w3.org/TR/curie/) identifiers of additional concepts that are deemed by the given knowledge source to be exact matches to one or more of the input concepts **plus** whichever concept identifiers from the input list were specifically matched to these additional concepts, thus giving the whole known set of equivalent concepts known to this particular knowledge source.  If an empty set is returned, the it can be assumed that the given knowledge source does not know of any new equivalent concepts matching the input set. The caller of this endpoint can then decide whether or not to treat  its input identifiers as its own equivalent set.  # noqa: E501
+
+    :param c: an array set of [CURIE-encoded](https://www.w3.org/TR/curie/) identifiers of concepts thought to be exactly matching concepts, to be used in a search for additional exactly matching concepts [*sensa*-SKOS](http://www.w3.org/2004/02/skos/core#exactMatch).
+    :type c: List[str]
+
+    :rtype: List[ExactMatchResponse]
+    """
+    c = [utils.fix_curie(curie) for curie in c]
+
+    return exact_matches(c, cache.cached(EXACT_MATCHES, exact_matches_key(c), lambda: backend().exact_matches(c)))
@@ -1,12 +1,39 @@
 import connexion
 
 from swagger_server import encoder
-from flask import redirect
-from beacon_controller import config
+from flask import redirect, jsonify, Response
+from beacon_controller import config, utils, server, metrics, result_cache
+from beacon_controller import database as db
+from beacon_controller import biolink_model as blm
+from beacon_controller import backends
+from beacon_controller.controllers import metadata_controller
+from beacon_controller.watcher import watcher
+from beacon_controller.warmup import warmup
 
 BASEPATH = f'/beacon/{config["beacon_name"]}/'
 
 
+def ready():
+    """
+    Readiness check, responds with 503 until warm-up has finished. Also
+    reports the load, latency and errors of each Neo4j instance, and the
+    hits and misses of the result cache.
+    """
+    status = warmup.status()
+    status['database'] = db.stats()
+    status['result_cache'] = result_cache.cache.stats()
+    response = jsonify(status)
+    response.status_code = 200 if status['ready'] else 503
+    return response
+
+
+def metrics_endpoint():
+    """
+    Query and process metrics in the Prometheus text format
+    """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 def main(name:str):
     """
     Usage in swagger_server/main.py:
@@ -15,6 +42,29 @@ def main(name:str):
         if __name__ == '__main__':
             run(__name__)
     """
+    if config['server'] == 'tornado':
+        # Worker processes are forked before any background thread is started
+        sockets = server.fork(config['port'], processes=config.get('processes', 1))
+
+    warmup.add('backend', backends.backend)
+    warmup.add('metadata', metadata_controller.snapshot)
+    warmup.add('prefix_map', utils.prefix_map)
+    warmup.add('biolink_model', blm.toolkit_instance)
+    warmup.add('categories', utils.build_category_table)
+    warmup.start()
+
+    watcher.start()
+
+    utils.refresh_prefix_map(config.get('prefix_refresh_interval', 0))
+
+    if backends.backend_name() == backends.NEO4J:
+        db.check_liveness()
+
+    if config['server'] == 'aiohttp':
+        from beacon_controller import aio
+        aio.serve(BASEPATH, port=config['port'])
+        return
+
     app = connexion.App(name, specification_dir='./swagger/', server=config['server'])
 
     app.app.json_encoder = encoder.JSONEncoder
@@ -27,7 +77,13 @@ def main(name:str):
         arguments={'title': config['title']}
     )
 
+    app.app.add_url_rule(BASEPATH + 'ready', 'ready', ready)
+    app.app.add_url_rule(BASEPATH + 'metrics', 'metrics', metrics_endpoint)
+
     if config['redirect_404'] and isinstance(BASEPATH, str):
         app.add_error_handler(404, lambda e: redirect(BASEPATH))
 
-    app.run(port=config['port'])
+    if config['server'] == 'tornado':
+        server.serve(app.app, sockets, threads=config.get('threads', 16))
+    else:
+        app.run(port=config['port'])
@@ -7,29 +7,32 @@ from swagger_server.models.beacon_predicate import BeaconPredicate
 from swagger_server.models.namespace import Namespace
 from swagger_server.models.local_namespace import LocalNamespace
 
-from cachetools.func import ttl_cache
+from swagger_server import encoder
+
+from flask import request, Response
+from werkzeug.http import parse_accept_header, parse_etags
+from functools import lru_cache
+from prefixcommons.curie_util import default_curie_maps as cmaps
 
 import beacon_controller.database as db
 from beacon_controller.database import Node
-from beacon_controller import utils, config
+from beacon_controller import utils, config, summaries
 from beacon_controller import biolink_model as blm
+from beacon_controller.summaries import edge_path, node_path, namespace_path
+from beacon_controller.watcher import watcher
 
-import data
-import pandas as pd
 import os
+import gzip
+import json
+import time
+import hashlib
+import threading
 
 from collections import defaultdict
 
-edge_path = os.path.join(data.path, config['beacon_name'], 'edge_summary.txt')
-node_path = os.path.join(data.path, config['beacon_name'], 'node_summary.txt')
-
-
-__time_to_live_in_seconds = 604800
-
 def camel_case(s:str) -> str:
     return ''.join(w.title() for w in s.replace('_', ' ').split(' '))
 
-@ttl_cache(ttl=__time_to_live_in_seconds)
 def get_concept_categories():  # noqa: E501
     """get_concept_categories
 
@@ -38,8 +41,175 @@ def get_concept_categories():  # noqa: E501
 
     :rtype: List[BeaconConceptCategory]
     """
-    rows = pd.read_csv(node_path, sep='|').to_dict(orient='records')
+    return respond(snapshot().categories)
+
+
+def get_knowledge_map():  # noqa: E501
+    """get_knowledge_map
+
+    Get a high level knowledge map of the all the beacons by subject semantic type, predicate and semantic object type  # noqa: E501
+
+
+    :rtype: List[BeaconKnowledgeMapStatement]
+    """
+    return respond(snapshot().knowledge_map)
+
+
+def get_predicates():  # noqa: E501
+    """get_predicates
+
+    Get a list of predicates used in statements issued by the knowledge source  # noqa: E501
+
+
+    :rtype: List[BeaconPredicate]
+    """
+    return respond(snapshot().predicates)
+
+
+def get_namespaces():  # noqa: E501
+    """get_namespaces
+    Get a list of namespace (curie prefixes) mappings that this beacon can perform with its /exactmatches endpoint  # noqa: E501
+    :rtype: List[LocalNamespace]
+
+    Served from `namespace_summary.txt`. If that file does not exist yet then
+    it is generated in the background and an empty list is returned until the
+    generator has finished. A generator that failed is only retried after a
+    backoff, see `summaries.generate_in_background`.
+    """
+    s = snapshot()
+    if s.namespaces_missing:
+        summaries.generate_in_background(generate_namespace_summary)
+    return respond(s.namespaces)
+
+
+def accepts_gzip(accept_encoding:str) -> bool:
+    """
+    Whether an Accept-Encoding header gives gzip, or failing that `*`, a
+    q-value above 0. For servers that have no werkzeug request to ask.
+    """
+    return parse_accept_header(accept_encoding)['gzip'] > 0
+
+
+def etag_matches(etag:str, if_none_match:str) -> bool:
+    """
+    Whether an If-None-Match header lists the ETag, which is compared weakly
+    as RFC 7232 asks, or is `*`
+    """
+    return parse_etags(if_none_match).contains_weak(etag)
+
+
+def respond(serialized) -> Response:
+    """
+    Responds with pre-serialized (and if the client accepts it, pre-gzipped)
+    JSON, or with 304 Not Modified if the client already has it.
+    """
+    gzipped = request.accept_encodings['gzip'] > 0
+    etag = serialized.etag + '-gzip' if gzipped else serialized.etag
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif gzipped:
+        response = Response(serialized.gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(serialized.body, mimetype='application/json')
+
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+class JSONEncoder(encoder.JSONEncoder):
+    include_nulls = config['include_nulls']
+
+
+class SerializedResponse(object):
+    """
+    The JSON encoding of a list of models, along with its gzipped encoding and
+    a content hash to use as an ETag.
+    """
+    def __init__(self, models:list):
+        self.body = json.dumps(models, cls=JSONEncoder).encode('utf-8')
+        self.gzipped = gzip.compress(self.body)
+        self.etag = hashlib.sha1(self.body).hexdigest()
+
+
+class MetadataSnapshot(object):
+    """
+    The summary files as they were when the snapshot was taken, along with the
+    serialized response of every metadata endpoint. Snapshots are never
+    modified, a new one is built when the summaries change.
+    """
+    def __init__(self):
+        self.created = time.monotonic()
+
+        node_rows = summaries.read_summary(node_path)
+        edge_rows = summaries.read_summary(edge_path)
+
+        self.namespaces_missing = not os.path.isfile(namespace_path)
+        namespace_rows = [] if self.namespaces_missing else summaries.read_summary(namespace_path)
 
+        self.categories = SerializedResponse(concept_categories(node_rows))
+        self.knowledge_map = SerializedResponse(knowledge_map(edge_rows))
+        self.predicates = SerializedResponse(predicates(edge_rows))
+        self.namespaces = SerializedResponse(namespaces(namespace_rows))
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+# Seconds after which the snapshot is rebuilt from the summary files even if
+# the watcher saw no change, e.g. because reload_interval is 0
+snapshot_max_age = config.get('snapshot_max_age', 604800)
+
+
+def expired(s:MetadataSnapshot) -> bool:
+    return snapshot_max_age > 0 and time.monotonic() - s.created >= snapshot_max_age
+
+
+def snapshot() -> MetadataSnapshot:
+    """
+    Returns the current snapshot. Only the very first call, which builds the
+    snapshot, and the call that rebuilds an expired snapshot take a lock;
+    while it is being rebuilt other calls keep getting the expired one. Apart
+    from that the snapshot is replaced atomically by `reload_snapshot`, so a
+    request that holds on to the snapshot it was given always sees
+    consistent data.
+    """
+    global _snapshot
+
+    current = _snapshot
+    if current is not None and not expired(current):
+        return current
+
+    if not _snapshot_lock.acquire(blocking=current is None):
+        return current
+    try:
+        if _snapshot is None or expired(_snapshot):
+            _snapshot = MetadataSnapshot()
+        return _snapshot
+    finally:
+        _snapshot_lock.release()
+
+
+def reload_snapshot():
+    """
+    Builds a new snapshot from the summary files and swaps it in
+    """
+    global _snapshot
+
+    _snapshot = MetadataSnapshot()
+
+
+watcher.watch([node_path, edge_path, namespace_path], reload_snapshot)
+
+
+def generate_namespace_summary():
+    summaries.generate_namespace_summary()
+    reload_snapshot()
+
+
+def concept_categories(rows:list) -> list:
     category_dict = defaultdict(lambda: 0)
     for row in rows:
         category_dict[row['category']] += row['frequency']
@@ -66,17 +236,8 @@ def get_concept_categories():  # noqa: E501
 
     return categories
 
-@ttl_cache(ttl=__time_to_live_in_seconds)
-def get_knowledge_map():  # noqa: E501
-    """get_knowledge_map
-
-    Get a high level knowledge map of the all the beacons by subject semantic type, predicate and semantic object type  # noqa: E501
-
-
-    :rtype: List[BeaconKnowledgeMapStatement]
-    """
-    rows = pd.read_csv(edge_path, sep='|').to_dict(orient='records')
 
+def knowledge_map(rows:list) -> list:
     frequency = defaultdict(lambda: 0)
     subject_prefixes = defaultdict(set)
     object_prefixes = defaultdict(set)
@@ -120,17 +281,8 @@ def get_knowledge_map():  # noqa: E501
 
     return maps
 
-@ttl_cache(ttl=__time_to_live_in_seconds)
-def get_predicates():  # noqa: E501
-    """get_predicates
-
-    Get a list of predicates used in statements issued by the knowledge source  # noqa: E501
-
-
-    :rtype: List[BeaconPredicate]
-    """
-    rows = pd.read_csv(edge_path, sep='|').to_dict(orient='records')
 
+def predicates(rows:list) -> list:
     d = defaultdict(lambda: 0)
 
     for row in rows:
@@ -167,54 +319,57 @@ def get_predicates():  # noqa: E501
 
     return predicates
 
-from prefixcommons.curie_util import default_curie_maps as cmaps
 
-def prefix_to_uri(prefix):
+def build_prefix_uris() -> dict:
     """
-    Pulls the default curie map from prefixcommons and gets the uri from it
+    Builds a lookup table from lowercase prefixes to URIs. The prefixcommons
+    curie maps are searched in order, so the first map (and the first key
+    within it) that matches a prefix wins. Prefixes configured in the `prefixes`
+    section of config.yaml take precedence over prefixcommons.
     """
-    prefix = prefix.upper()
-
+    d = {}
     for cmap in cmaps:
         for key, value in cmap.items():
-            if prefix.lower() == key.lower():
-                return value
-    else:
-        return None
+            d.setdefault(key.lower(), value)
 
+    local_prefixes = config.get('prefixes') or {}
+    for key, value in local_prefixes.items():
+        d[str(key).lower()] = value
 
-@ttl_cache(ttl=__time_to_live_in_seconds)
-def get_namespaces():  # noqa: E501
-    """get_namespaces
-    Get a list of namespace (curie prefixes) mappings that this beacon can perform with its /exactmatches endpoint  # noqa: E501
-    :rtype: List[LocalNamespace]
+    return d
+
+
+prefix_uris = build_prefix_uris()
+
+
+@lru_cache(maxsize=4096)
+def prefix_to_uri(prefix):
     """
-    q = """
-    MATCH (n)
-    WITH
-        split(n.id, ":")[0] AS prefix,
-        FILTER(x IN n.xrefs WHERE x <> n.id) AS xrefs,
-        FILTER(x IN n.clique WHERE x <> n.id) AS clique
-    WITH
-        prefix AS prefix,
-        EXTRACT(id IN xrefs | split(id, ":")[0]) AS xref_prefixes,
-        EXTRACT(id IN clique | split(id, ":")[0]) AS clique_prefixes
-    UNWIND
-        COALESCE(xref_prefixes, []) + COALESCE(clique_prefixes, []) As p
-    RETURN DISTINCT prefix AS local_prefix, COLLECT(DISTINCT p) AS clique_prefixes, COUNT(*) AS frequency;
+    Gets the uri for the given prefix from the prefixcommons curie maps and the
+    locally configured prefixes. Returns None if the prefix is unknown.
     """
+    if not isinstance(prefix, str):
+        return None
 
-    results = db.query(q)
+    return prefix_uris.get(prefix.lower())
 
-    local_namespaces = []
 
-    for result in results:
-        local_prefix = result.get('local_prefix')
-        clique_prefixes = result.get('clique_prefixes')
-        frequency = result.get('frequency')
+def namespaces(rows:list) -> list:
+    frequency = defaultdict(lambda: 0)
+    clique_prefixes = defaultdict(list)
+    for row in rows:
+        # |local_prefix|clique_prefix|frequency
+        local_prefix = row['local_prefix']
+        if not isinstance(local_prefix, str):
+            continue
+        frequency[local_prefix] += row['frequency']
+        clique_prefixes[local_prefix].append(row['clique_prefix'])
+
+    local_namespaces = []
 
+    for local_prefix, fq in sorted(frequency.items(), key=lambda k: k[1], reverse=True):
         namespaces = []
-        for prefix in clique_prefixes:
+        for prefix in clique_prefixes[local_prefix]:
             namespaces.append(Namespace(
                 prefix=prefix,
                 uri=prefix_to_uri(prefix)
@@ -223,7 +378,7 @@ def get_namespaces():  # noqa: E501
         local_namespaces.append(LocalNamespace(
             local_prefix=local_prefix,
             clique_mappings=namespaces,
-            frequency=frequency,
+            frequency=fq,
             uri=prefix_to_uri(local_prefix),
         ))
 
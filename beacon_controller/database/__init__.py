@@ -1,19 +1,165 @@
+import json
+import time
+
+from beacon_controller import metrics
+from beacon_controller.singleflight import SingleFlight, default_timeout
+
 from . import config
 from .model import Node, Edge
+from .connection import Database, AsyncDatabase
+from .slow_log import SlowQueryLog
+
+database = Database(
+    config.read_uris,
+    auth=(config.username, config.password),
+    pool=config.pool,
+    timeouts=config.timeouts,
+    fetch_size=config.fetch_size,
+    backoff=config.ejection_backoff,
+    max_backoff=config.max_ejection_backoff,
+    failover_retry_time=config.failover_retry_time,
+    hedge=config.hedge,
+    hedge_percentile=config.hedge_percentile,
+    hedge_budget=config.hedge_budget
+)
+
+slow_queries = SlowQueryLog(
+    config.slow_query_log,
+    threshold=config.slow_query_threshold,
+    profile_rate=config.slow_query_profile_rate,
+    parameter_length=config.slow_query_parameter_length,
+    profiler=database.profile
+)
+
+# Identical queries that are run at the same time share one execution
+flights = SingleFlight('database', default_timeout())
+
+# Created by the first asynchronous query, since the asyncio driver is only
+# needed, and only usable, inside the aiohttp server's event loop
+async_database = None
+
+END = object()
+
+
+def observe(endpoint, q, parameters, elapsed, rows=0, decoded=0, error=None):
+    """
+    Records a query in the metrics and, if it was slow, the slow query log
+    """
+    metrics.queries.observe(endpoint, q, elapsed, rows, decoded, error)
+    slow_queries.observe(endpoint, q, parameters, elapsed, rows, error)
+
+
+def flight_key(endpoint, q, parameters) -> tuple:
+    return endpoint, q, json.dumps(parameters, sort_keys=True, default=str)
+
+
+def run(q, endpoint, parameters) -> list:
+    start = time.perf_counter()
+    try:
+        records = database.run(q, parameters, endpoint=endpoint)
+    except Exception as e:
+        observe(endpoint, q, parameters, time.perf_counter() - start, error=e)
+        raise
+    observe(endpoint, q, parameters, time.perf_counter() - start, len(records), metrics.estimate_size(records))
+    return records
+
+
+def query(q, inflator=None, endpoint=None, **kwargs):
+    """
+    Runs a read query, with the transaction timeout of the given endpoint (see
+    `timeouts` in config.yaml), and returns a list of its records or, if an
+    inflator is given, inflates the first column of each record. If an
+    identical query is already running, its records are shared instead.
+    """
+    records = flights.do(flight_key(endpoint, q, kwargs), lambda: run(q, endpoint, kwargs), label=endpoint)
+
+    if inflator != None:
+        return [inflator.inflate(record[0]) for record in records]
+    else:
+        return list(records)
+
+
+def stream(q, inflator=None, endpoint=None, fetch_size=None, **kwargs):
+    """
+    Like `query`, but yields records as they are fetched from the database
+    rather than holding all of them in memory at once. Only the time spent
+    waiting for records counts towards the query's latency, not the time spent
+    by the caller between records. Streams are not shared between identical
+    queries, the controllers coalesce the requests of cached endpoints instead
+    (see result_cache.py).
+    """
+    records = database.stream(q, kwargs, endpoint=endpoint, fetch_size=fetch_size)
+    elapsed, rows, decoded, error = 0.0, 0, 0, None
+    clock = time.perf_counter
+
+    try:
+        while True:
+            start = clock()
+            record = next(records, END)
+            elapsed += clock() - start
+            if record is END:
+                break
+
+            if rows % metrics.SIZE_SAMPLE == 0:
+                decoded += metrics.size(record) * metrics.SIZE_SAMPLE
+            rows += 1
+
+            if inflator != None:
+                yield inflator.inflate(record[0])
+            else:
+                yield record
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        records.close()
+        observe(endpoint, q, kwargs, elapsed, rows, decoded, error)
 
-from neomodel import db
 
+async def async_query(q, inflator=None, endpoint=None, **kwargs):
+    """
+    Like `query`, but without blocking the event loop, for the aiohttp server
+    """
+    global async_database
 
-def query(q, inflator=None, **kwargs):
-    results, meta = db.cypher_query(q, kwargs)
+    if async_database is None:
+        async_database = AsyncDatabase(
+            config.read_uris,
+            auth=(config.username, config.password),
+            pool=config.pool,
+            timeouts=config.timeouts,
+            fetch_size=config.fetch_size,
+            backoff=config.ejection_backoff,
+            max_backoff=config.max_ejection_backoff
+        )
+
+    records = await flights.async_do(flight_key(endpoint, q, kwargs), lambda: async_run(q, endpoint, kwargs), label=endpoint)
 
     if inflator != None:
-        return [inflator.inflate(row[0]) for row in results]
+        return [inflator.inflate(record[0]) for record in records]
     else:
-        rows = []
-        for result in results:
-            row = {}
-            for i, key in enumerate(meta):
-                row[key] = result[i]
-            rows.append(row)
-        return rows
+        return list(records)
+
+
+async def async_run(q, endpoint, parameters) -> list:
+    start = time.perf_counter()
+    try:
+        records = await async_database.run(q, parameters, endpoint=endpoint)
+    except Exception as e:
+        observe(endpoint, q, parameters, time.perf_counter() - start, error=e)
+        raise
+    observe(endpoint, q, parameters, time.perf_counter() - start, len(records), metrics.estimate_size(records))
+    return records
+
+
+def check_liveness():
+    database.check_liveness(config.liveness_check_interval)
+
+
+def stats() -> dict:
+    """
+    Queries in flight, their latency and errors for each Neo4j instance
+    """
+    if async_database is not None:
+        return async_database.stats()
+    return database.stats()
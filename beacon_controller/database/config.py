@@ -1,5 +1,8 @@
+import os
+
 from neomodel import config
 
+import data
 import beacon_controller
 
 db_config = beacon_controller.config['database']
@@ -8,9 +11,70 @@ username = db_config['username']
 password = db_config['password']
 address = db_config['address']
 
-if 'bolt://' in address:
-    address = address.replace('bolt://', '')
-elif 'http://' in address or 'https://' in address:
-    raise Exception('Only bolt protocol is allowed')
 
+def bolt_address(address:str) -> str:
+    if 'bolt://' in address:
+        return address.replace('bolt://', '')
+    elif 'http://' in address or 'https://' in address:
+        raise Exception('Only bolt protocol is allowed')
+    return address
+
+
+address = bolt_address(address)
+
+uri = 'bolt://{}'.format(address)
+
+# Reads are spread over these instances, e.g. the read replicas of a cluster,
+# or only sent to `address` if there are none
+read_uris = ['bolt://{}'.format(bolt_address(a)) for a in db_config.get('read_addresses') or []] or [uri]
+
+# Seconds for which an instance that cannot be reached is not sent queries,
+# doubling each time it fails again
+ejection_backoff = db_config.get('ejection_backoff', 1)
+max_ejection_backoff = db_config.get('max_ejection_backoff', 60)
+
+# Seconds for which the driver retries a read before it is sent to the next
+# instance, if there is one left to try
+failover_retry_time = db_config.get('failover_retry_time', 0)
+
+# Endpoints whose queries are also sent to a second instance if the first has
+# not answered within the endpoint's `hedge_percentile` latency, for at most a
+# `hedge_budget` fraction of queries
+hedge = db_config.get('hedge') or []
+hedge_percentile = db_config.get('hedge_percentile', 0.95)
+hedge_budget = db_config.get('hedge_budget', 0.05)
+
+# neomodel is only used to validate nodes and edges against the model
 config.DATABASE_URL = 'bolt://{}:{}@{}'.format(username, password, address)
+
+# Settings of the driver's connection pool, in seconds where applicable
+pool = {
+    'max_connection_pool_size': db_config.get('max_connection_pool_size', 100),
+    'max_connection_lifetime': db_config.get('max_connection_lifetime', 3600),
+    'connection_acquisition_timeout': db_config.get('connection_acquisition_timeout', 60),
+    'connection_timeout': db_config.get('connection_timeout', 30),
+    'keep_alive': True,
+}
+
+# Transaction timeouts in seconds for each endpoint, 0 meaning no timeout
+timeouts = {
+    'default': 60,
+    'summaries': 0,
+}
+timeouts.update(db_config.get('timeouts') or {})
+
+liveness_check_interval = db_config.get('liveness_check_interval', 30)
+
+# Number of records fetched from the database at a time when streaming results
+fetch_size = db_config.get('fetch_size', 1000)
+
+# Queries that take at least `slow_query_threshold` seconds are logged to this
+# file, relative to data/{beacon name}, unless it is empty. See slow_log.py.
+slow_query_log = db_config.get('slow_query_log', 'slow_queries.jsonl')
+if slow_query_log:
+    slow_query_log = os.path.join(data.path, beacon_controller.config['beacon_name'], slow_query_log)
+else:
+    slow_query_log = None
+slow_query_threshold = db_config.get('slow_query_threshold', 1)
+slow_query_profile_rate = db_config.get('slow_query_profile_rate', 0.1)
+slow_query_parameter_length = db_config.get('slow_query_parameter_length', 200)
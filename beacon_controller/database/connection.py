@@ -0,0 +1,547 @@
+import time
+import uuid
+import logging
+import threading
+
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from neo4j import GraphDatabase, Query, READ_ACCESS, unit_of_work
+from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+logger = logging.getLogger(__file__)
+
+# Errors that mean a Neo4j instance cannot be reached, rather than that the
+# query was at fault
+CONNECTION_ERRORS = (ServiceUnavailable, SessionExpired, OSError)
+
+# Errors after which a read is tried again, on another instance if there is one
+RETRY_ERRORS = CONNECTION_ERRORS + (TransientError,)
+
+# Weight of the latest query in the moving average of an instance's latency
+LATENCY_WEIGHT = 0.2
+
+# Number of latencies an endpoint must have recorded before its queries are
+# hedged, and number of them used to estimate the percentile
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 1000
+
+
+class Cancelled(Exception):
+    """
+    Raised in a hedged query whose other copy has already answered
+    """
+
+
+def read(session, work):
+    """
+    Runs `work` in a read transaction of the session, with either the 5.x (and
+    later) or the 4.x API of the driver
+    """
+    execute_read = getattr(session, 'execute_read', None)
+    if execute_read is None:
+        return session.read_transaction(work)
+    return execute_read(work)
+
+
+class Endpoint(object):
+    """
+    A Neo4j instance that queries can be sent to, along with its driver, the
+    number of queries it is running and a moving average of their latency.
+    An instance that cannot be reached is ejected for `backoff` seconds, which
+    doubles (up to `max_backoff`) each time it fails again.
+    """
+    def __init__(self, uri:str, driver, backoff:float=1, max_backoff:float=60):
+        self.uri = uri
+        self.driver = driver
+        self.min_backoff = backoff
+        self.max_backoff = max_backoff
+        self.backoff = backoff
+        self.ejected_until = 0
+        self.in_flight = 0
+        self.queries = 0
+        self.errors = 0
+        self.ejections = 0
+        self.hedges = 0
+        self.cancelled = 0
+        self.latency = None
+        self.lock = threading.Lock()
+
+    def available(self, now:float=None) -> bool:
+        return (now if now is not None else time.time()) >= self.ejected_until
+
+    def begin(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def end(self, elapsed:float, error:Exception=None):
+        with self.lock:
+            self.in_flight -= 1
+            self.queries += 1
+
+            if isinstance(error, Cancelled):
+                self.cancelled += 1
+                return
+            elif isinstance(error, CONNECTION_ERRORS):
+                self.errors += 1
+                self.eject(error)
+                return
+            elif error is not None:
+                self.errors += 1
+
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += LATENCY_WEIGHT * (elapsed - self.latency)
+            self.backoff = self.min_backoff
+
+    def eject(self, error:Exception=None):
+        now = time.time()
+        if self.available(now):
+            logger.warning('Ejecting {} for {}s: {}'.format(self.uri, self.backoff, error))
+            self.ejected_until = now + self.backoff
+            self.ejections += 1
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+
+    def readmit(self):
+        if self.ejected_until > 0:
+            logger.info('Database {} is available again'.format(self.uri))
+        self.ejected_until = 0
+        self.backoff = self.min_backoff
+
+    def stats(self) -> dict:
+        return {
+            'available': self.available(),
+            'in_flight': self.in_flight,
+            'queries': self.queries,
+            'errors': self.errors,
+            'ejections': self.ejections,
+            'hedges': self.hedges,
+            'cancelled': self.cancelled,
+            'latency': round(self.latency, 6) if self.latency is not None else None,
+        }
+
+
+class Router(object):
+    """
+    Sends each query to the available endpoint with the fewest queries in
+    flight, then the lowest latency. If every endpoint has been ejected the
+    one that is due back first is used, rather than failing outright.
+    """
+    def __init__(self, endpoints:list):
+        self.endpoints = endpoints
+
+    def choose(self, exclude=()) -> Endpoint:
+        now = time.time()
+        candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+        available = [e for e in candidates if e.available(now)]
+
+        if available == []:
+            return min(candidates, key=lambda e: e.ejected_until)
+
+        return min(available, key=lambda e: (e.in_flight, e.latency or 0))
+
+    @contextmanager
+    def route(self, exclude=(), endpoint:Endpoint=None):
+        if endpoint is None:
+            endpoint = self.choose(exclude)
+        endpoint.begin()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield endpoint
+        except GeneratorExit:
+            # A stream that was not read to the end
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            endpoint.end(time.perf_counter() - start, error)
+
+    def stats(self) -> dict:
+        return {e.uri: e.stats() for e in self.endpoints}
+
+
+class LatencyWindow(object):
+    """
+    The most recent latencies of an endpoint of the beacon, to estimate its
+    percentiles from
+    """
+    def __init__(self, size:int=HEDGE_WINDOW):
+        self.latencies = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self._percentiles = {}
+
+    def add(self, latency:float):
+        with self.lock:
+            self.latencies.append(latency)
+            # Estimates are reused until a few more latencies have come in
+            if len(self.latencies) % HEDGE_MIN_SAMPLES == 0:
+                self._percentiles = {}
+
+    def percentile(self, p:float):
+        """
+        The `p` percentile (between 0 and 1) of the recent latencies, or None
+        if too few have been recorded yet
+        """
+        with self.lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            if p not in self._percentiles:
+                latencies = sorted(self.latencies)
+                self._percentiles[p] = latencies[min(int(p * len(latencies)), len(latencies) - 1)]
+            return self._percentiles[p]
+
+
+class HedgeBudget(object):
+    """
+    A token bucket that lets at most `ratio` of queries be hedged. Every query
+    earns `ratio` tokens, up to `burst`, and every hedge spends one.
+    """
+    def __init__(self, ratio:float=0.05, burst:float=10):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = 0
+        self.lock = threading.Lock()
+
+    def earn(self):
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class Database(object):
+    """
+    A Neo4j driver for each of the instances that serve reads, along with
+    their connection pool settings and the transaction timeout of each
+    endpoint of the beacon. Drivers are created by `driver_factory`, which may
+    be replaced by a stand-in that speaks to something other than a real
+    Neo4j server.
+
+    While there are other instances left to try, the driver retries a read
+    transaction for at most `failover_retry_time` seconds rather than its own
+    `max_transaction_retry_time` (30s by default), so that a query moves on
+    to the next instance right away when one goes down.
+    """
+    def __init__(self, uris, auth:tuple, pool:dict=None, timeouts:dict=None, fetch_size:int=1000, driver_factory=GraphDatabase.driver, backoff:float=1, max_backoff:float=60, hedge=(), hedge_percentile:float=0.95, hedge_budget:float=0.05, failover_retry_time:float=0):
+        self.uris = [uris] if isinstance(uris, str) else list(uris)
+        self.auth = auth
+        self.pool = pool if pool is not None else {}
+        self.timeouts = timeouts if timeouts is not None else {}
+        self.fetch_size = fetch_size
+        self.failover_retry_time = failover_retry_time
+        self.driver_factory = driver_factory
+        self.router = Router([
+            Endpoint(uri, driver_factory(uri, auth=auth, **self.pool), backoff, max_backoff) for uri in self.uris
+        ])
+        self.hedge = set(hedge or ())
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = HedgeBudget(hedge_budget)
+        self.latencies = defaultdict(LatencyWindow)
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+        self.healthy = True
+        self._liveness_thread = None
+
+    def timeout(self, endpoint:str=None):
+        """
+        Transaction timeout in seconds for the given endpoint, falling back on
+        the default timeout. None means that transactions never time out.
+        """
+        timeout = self.timeouts.get(endpoint, self.timeouts.get('default'))
+        return timeout if timeout else None
+
+    def hedged(self, endpoint:str=None) -> bool:
+        return endpoint in self.hedge and len(self.router.endpoints) > 1
+
+    def run(self, q:str, parameters:dict, endpoint:str=None) -> list:
+        """
+        Runs a query in a read transaction and returns its records. The
+        transaction is terminated by the database if it runs longer than the
+        endpoint's timeout. If a Neo4j instance cannot be reached, or fails
+        with a transient error, the query is tried on each of the other
+        instances in turn. Only on the last of them does the driver keep
+        retrying it for its full `max_transaction_retry_time`.
+
+        Queries of the endpoints listed in `hedge` are run by `hedged_run`
+        instead.
+        """
+        if self.hedged(endpoint):
+            return self.hedged_run(q, parameters, endpoint)
+
+        def work(tx):
+            return list(tx.run(q, parameters))
+
+        timeout = self.timeout(endpoint)
+        if timeout is not None:
+            work = unit_of_work(timeout=timeout)(work)
+
+        tried = []
+        while True:
+            try:
+                with self.router.route(exclude=tried) as e:
+                    tried.append(e)
+                    settings = {}
+                    if len(tried) < len(self.router.endpoints):
+                        settings['max_transaction_retry_time'] = self.failover_retry_time
+                    with e.driver.session(default_access_mode=READ_ACCESS, **settings) as session:
+                        return read(session, work)
+            except RETRY_ERRORS:
+                if len(tried) >= len(self.router.endpoints):
+                    raise
+
+    def stream(self, q:str, parameters:dict, endpoint:str=None, fetch_size:int=None):
+        """
+        Runs a query and yields its records as they arrive from the database,
+        `fetch_size` records at a time. Records are tuples that share a single
+        index of their keys, and can be read like dictionaries. Unlike `run`,
+        the query is not retried since records may already have been yielded.
+
+        Queries of hedged endpoints are run by `hedged_run`, and their records
+        only yielded once the whole result has arrived.
+        """
+        if self.hedged(endpoint):
+            yield from self.hedged_run(q, parameters, endpoint)
+            return
+
+        with self.router.route() as e:
+            session = e.driver.session(
+                default_access_mode=READ_ACCESS,
+                fetch_size=fetch_size if fetch_size is not None else self.fetch_size
+            )
+            with session:
+                for record in session.run(Query(q, timeout=self.timeout(endpoint)), parameters):
+                    yield record
+
+    def hedged_run(self, q:str, parameters:dict, endpoint:str=None) -> list:
+        """
+        Runs a query on one instance and, if it has not answered within the
+        endpoint's `hedge_percentile` latency and the hedge budget allows it,
+        runs it on a second instance too. The first answer is returned and the
+        other query is terminated on its instance (see `terminate`). A query
+        that fails to reach its instance is retried on another, without
+        spending the budget.
+        """
+        window = self.latencies[endpoint]
+        delay = window.percentile(self.hedge_percentile)
+        self.hedge_budget.earn()
+
+        # Tags the transactions of this call, so that the losing one can be
+        # found and terminated
+        tag = uuid.uuid4().hex
+        tried = []
+        pending = {}
+
+        def submit(e:Endpoint):
+            tried.append(e)
+            cancelled = threading.Event()
+            future = self.hedge_executor().submit(self.fetch, e, q, parameters, endpoint, cancelled, tag)
+            pending[future] = (e, cancelled)
+
+        submit(self.router.choose())
+        error = None
+
+        try:
+            while pending:
+                timeout = delay if len(tried) == 1 else None
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                if not done:
+                    delay = None
+                    other = self.router.choose(exclude=tried)
+                    if other not in tried and self.hedge_budget.spend():
+                        other.hedges += 1
+                        submit(other)
+                    continue
+
+                for future in done:
+                    del pending[future]
+                    try:
+                        return future.result()
+                    except CONNECTION_ERRORS as e:
+                        error = e
+                        other = self.router.choose(exclude=tried)
+                        if pending == {} and other not in tried:
+                            submit(other)
+
+            raise error
+        finally:
+            for e, cancelled in pending.values():
+                cancelled.set()
+                self.hedge_executor().submit(self.terminate, e, tag)
+
+    def fetch(self, e:Endpoint, q:str, parameters:dict, endpoint:str, cancelled:threading.Event, tag:str=None) -> list:
+        """
+        Runs a query on the given instance for `hedged_run`, giving up once
+        `cancelled` is set. The latency of every query that completes is
+        recorded in the endpoint's window, whether or not it was hedged or
+        its answer was used.
+        """
+        start = time.perf_counter()
+        with self.router.route(endpoint=e):
+            if cancelled.is_set():
+                raise Cancelled()
+            with e.driver.session(default_access_mode=READ_ACCESS, fetch_size=self.fetch_size) as session:
+                records = []
+                try:
+                    query = Query(q, timeout=self.timeout(endpoint), metadata={'hedge': tag} if tag else None)
+                    for record in session.run(query, parameters):
+                        if cancelled.is_set():
+                            raise Cancelled()
+                        records.append(record)
+                except Cancelled:
+                    raise
+                except Exception as error:
+                    # Most likely terminated by `terminate`
+                    if cancelled.is_set():
+                        raise Cancelled() from error
+                    raise
+                self.latencies[endpoint].add(time.perf_counter() - start)
+                if cancelled.is_set():
+                    raise Cancelled()
+                return records
+
+    def terminate(self, e:Endpoint, tag:str):
+        """
+        Terminates the transactions of a hedged query on the given instance,
+        rather than letting it run until its next batch of records arrives
+        """
+        try:
+            with e.driver.session(default_access_mode=READ_ACCESS) as session:
+                ids = [
+                    record['transactionId'] for record in session.run(
+                        'SHOW TRANSACTIONS YIELD transactionId, metaData '
+                        'WHERE metaData.hedge = $tag RETURN transactionId',
+                        {'tag': tag}
+                    )
+                ]
+                if ids != []:
+                    session.run('TERMINATE TRANSACTIONS $ids', {'ids': ids}).consume()
+        except Exception as error:
+            logger.warning('Could not terminate a hedged query on {}: {}'.format(e.uri, error))
+
+    def profile(self, q:str, parameters:dict, endpoint:str=None) -> dict:
+        """
+        Runs a query with PROFILE, discarding its records, and returns its
+        profiled plan
+        """
+        with self.router.route() as e:
+            with e.driver.session(default_access_mode=READ_ACCESS) as session:
+                result = session.run(Query('PROFILE ' + q, timeout=self.timeout(endpoint)), parameters)
+                return result.consume().profile
+
+    def hedge_executor(self) -> ThreadPoolExecutor:
+        if self._hedge_executor is None:
+            with self._hedge_lock:
+                if self._hedge_executor is None:
+                    workers = self.pool.get('max_connection_pool_size', 100) * len(self.router.endpoints)
+                    self._hedge_executor = ThreadPoolExecutor(workers, thread_name_prefix='hedged-query')
+        return self._hedge_executor
+
+    def ping(self, timeout:float=5) -> bool:
+        """
+        Checks that every Neo4j instance answers a trivial query, ejecting
+        those that do not and readmitting those that do. If an instance fails
+        while already ejected then its driver is replaced, discarding every
+        pooled connection, since they are most likely broken. The database is
+        healthy as long as any instance is.
+        """
+        @unit_of_work(timeout=timeout)
+        def work(tx):
+            return tx.run('RETURN 1').single()
+
+        healthy = False
+        for e in self.router.endpoints:
+            try:
+                with e.driver.session(default_access_mode=READ_ACCESS) as session:
+                    read(session, work)
+                e.readmit()
+                healthy = True
+            except Exception as error:
+                logger.warning('Liveness check of database {} failed: {}'.format(e.uri, error))
+                if e.ejected_until > 0:
+                    self.reconnect(e)
+                e.eject(error)
+
+        self.healthy = healthy
+        return self.healthy
+
+    def reconnect(self, e:Endpoint):
+        old_driver = e.driver
+        e.driver = self.driver_factory(e.uri, auth=self.auth, **self.pool)
+        old_driver.close()
+
+    def check_liveness(self, interval:float):
+        """
+        Pings the database every `interval` seconds in a background thread
+        """
+        def run():
+            while True:
+                time.sleep(interval)
+                self.ping()
+
+        if self._liveness_thread is None and interval > 0:
+            self._liveness_thread = threading.Thread(target=run, name='liveness-check', daemon=True)
+            self._liveness_thread.start()
+
+    def stats(self) -> dict:
+        """
+        Queries in flight, latency and errors of each Neo4j instance
+        """
+        return self.router.stats()
+
+    def close(self):
+        for e in self.router.endpoints:
+            e.driver.close()
+
+
+class AsyncDatabase(object):
+    """
+    The asyncio counterpart of Database, used when the beacon is served by
+    aiohttp. Queries wait for a pooled connection, and for their records,
+    without holding a thread, so the number of concurrent requests is only
+    bounded by the connection pool.
+    """
+    def __init__(self, uris, auth:tuple, pool:dict=None, timeouts:dict=None, fetch_size:int=1000, driver_factory=None, backoff:float=1, max_backoff:float=60):
+        if driver_factory is None:
+            from neo4j import AsyncGraphDatabase
+            driver_factory = AsyncGraphDatabase.driver
+        self.uris = [uris] if isinstance(uris, str) else list(uris)
+        self.pool = pool if pool is not None else {}
+        self.timeouts = timeouts if timeouts is not None else {}
+        self.fetch_size = fetch_size
+        self.router = Router([
+            Endpoint(uri, driver_factory(uri, auth=auth, **self.pool), backoff, max_backoff) for uri in self.uris
+        ])
+
+    timeout = Database.timeout
+    stats = Database.stats
+
+    async def stream(self, q:str, parameters:dict, endpoint:str=None, fetch_size:int=None):
+        """
+        Runs a query and yields its records as they arrive from the database
+        """
+        with self.router.route() as e:
+            session = e.driver.session(
+                default_access_mode=READ_ACCESS,
+                fetch_size=fetch_size if fetch_size is not None else self.fetch_size
+            )
+            async with session:
+                result = await session.run(Query(q, timeout=self.timeout(endpoint)), parameters)
+                async for record in result:
+                    yield record
+
+    async def run(self, q:str, parameters:dict, endpoint:str=None) -> list:
+        return [record async for record in self.stream(q, parameters, endpoint=endpoint)]
+
+    async def close(self):
+        for e in self.router.endpoints:
+            await e.driver.close()
@@ -0,0 +1,239 @@
+"""
+The slow query log. Queries that take at least `slow_query_threshold` seconds
+are appended to a file of JSON lines, along with their parameters (truncated)
+and how long they took:
+
+    {"type": "query", "time": 1571234567.8, "pid": 12, "endpoint": "statements", "shape": "72aebf11cd11",
+     "query": "MATCH ...", "parameters": {"s": ["HGNC:1"]}, "seconds": 2.31, "rows": 100, "error": null}
+
+The first time that a shape of query (see metrics.py) is slow, it is re-run
+with PROFILE with a probability of `slow_query_profile_rate`, in the
+background, and the operators of its plan are logged along with the rows
+and database hits of each. Once a shape has been profiled it is not profiled
+again by the same process.
+
+    {"type": "profile", ..., "db_hits": 123456, "operators": [{"operator": "NodeByLabelScan", "depth": 3,
+     "db_hits": 100001, "rows": 100000, "details": "n:gene"}, ...]}
+
+`tkg-beacon slow-queries` reads these files and reports on the slowest shapes.
+"""
+import os
+import json
+import time
+import random
+import logging
+import threading
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from beacon_controller import metrics
+
+logger = logging.getLogger(__file__)
+
+QUERY = 'query'
+PROFILE = 'profile'
+
+# Lists of parameters are cut to this many items
+MAX_ITEMS = 20
+
+
+def truncate(value, length:int):
+    """
+    The value, with strings cut to `length` characters and lists to
+    MAX_ITEMS items, so that huge parameters do not bloat the log
+    """
+    if isinstance(value, str):
+        return value if len(value) <= length else value[:length] + '...'
+    if isinstance(value, (list, tuple)):
+        items = [truncate(v, length) for v in value[:MAX_ITEMS]]
+        if len(value) > MAX_ITEMS:
+            items.append('... {} more'.format(len(value) - MAX_ITEMS))
+        return items
+    if isinstance(value, dict):
+        return {key: truncate(v, length) for key, v in value.items()}
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return truncate(str(value), length)
+
+
+def operators(plan:dict, depth:int=0):
+    """
+    Yields the operators of a profiled plan, as returned by the driver, from
+    the root down
+    """
+    arguments = plan.get('args') or {}
+    details = arguments.get('Details') or arguments.get('ExpandExpression') or arguments.get('LegacyExpression')
+    yield dict(
+        operator=plan.get('operatorType'),
+        depth=depth,
+        db_hits=plan.get('dbHits', 0),
+        rows=plan.get('rows', 0),
+        details=details if details is not None else ', '.join(plan.get('identifiers') or [])
+    )
+    for child in plan.get('children') or []:
+        yield from operators(child, depth + 1)
+
+
+class SlowQueryLog(object):
+    """
+    Logs the queries that take at least `threshold` seconds to the file at
+    `path`, and profiles them with `profiler(q, parameters, endpoint)`,
+    which returns the profiled plan. Nothing is logged if `path` is None.
+    """
+    def __init__(self, path:str, threshold:float=1, profile_rate:float=0.1, parameter_length:int=200, profiler=None):
+        self.path = path
+        self.threshold = threshold
+        self.profile_rate = profile_rate
+        self.parameter_length = parameter_length
+        self.profiler = profiler
+        self.profiled = set()
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def executor(self) -> ThreadPoolExecutor:
+        # A single thread, so that a burst of slow queries cannot turn into a
+        # burst of expensive profiles
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(1, thread_name_prefix='slow-query-profile')
+            return self._executor
+
+    def write(self, entry:dict):
+        line = json.dumps(entry, default=str) + '\n'
+        try:
+            with self.lock:
+                with open(self.path, 'a') as f:
+                    f.write(line)
+        except OSError as e:
+            logger.warning('Could not write to the slow query log {}: {}'.format(self.path, e))
+
+    def observe(self, endpoint:str, q:str, parameters:dict, elapsed:float, rows:int=0, error:Exception=None):
+        if self.path is None or elapsed < self.threshold:
+            return
+
+        key, text = metrics.shape(q)
+        entry = dict(
+            type=QUERY,
+            time=round(time.time(), 3),
+            pid=os.getpid(),
+            endpoint=endpoint,
+            shape=key,
+            query=q,
+            parameters=truncate(parameters, self.parameter_length),
+            seconds=round(elapsed, 6),
+            rows=rows,
+            error=repr(error) if error is not None else None
+        )
+        self.write(entry)
+
+        if self.profiler is None:
+            return
+
+        with self.lock:
+            if key in self.profiled or random.random() >= self.profile_rate:
+                return
+            self.profiled.add(key)
+
+        self.executor().submit(self.profile, entry, q, parameters)
+
+    def profile(self, entry:dict, q:str, parameters:dict):
+        start = time.perf_counter()
+        profile = dict(entry, type=PROFILE, time=round(time.time(), 3))
+
+        try:
+            plan = self.profiler(q, parameters, entry['endpoint'])
+        except Exception as e:
+            logger.warning('Could not profile query of shape {}: {}'.format(entry['shape'], e))
+            profile.update(error=repr(e), seconds=round(time.perf_counter() - start, 6))
+        else:
+            ops = list(operators(plan or {}))
+            profile.update(
+                error=None,
+                seconds=round(time.perf_counter() - start, 6),
+                rows=(plan or {}).get('rows'),
+                db_hits=sum(op['db_hits'] or 0 for op in ops),
+                operators=ops
+            )
+
+        self.write(profile)
+
+
+def read(paths:list) -> list:
+    """
+    The entries of slow query logs, skipping lines that are not JSON (e.g.
+    one that was being written when the log was copied)
+    """
+    entries = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logger.warning('Skipping a malformed line of {}'.format(path))
+    return entries
+
+
+def percentile(values:list, p:float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def summarize(entries:list) -> list:
+    """
+    Statistics of each shape of slow query, with its latest profile
+    """
+    shapes = defaultdict(lambda: dict(seconds=[], rows=[], endpoints=set(), errors=0, query=None, profile=None))
+
+    for entry in entries:
+        s = shapes[entry['shape']]
+        if entry.get('type') == PROFILE:
+            if entry.get('operators') is not None:
+                s['profile'] = entry
+            continue
+        s['query'] = entry['query']
+        s['seconds'].append(entry['seconds'])
+        s['rows'].append(entry.get('rows') or 0)
+        s['endpoints'].add(entry.get('endpoint'))
+        s['errors'] += entry.get('error') is not None
+
+    summaries = []
+    for key, s in shapes.items():
+        if s['seconds'] == []:
+            continue
+        summaries.append(dict(
+            shape=key,
+            query=s['query'],
+            endpoints=sorted(str(e) for e in s['endpoints']),
+            count=len(s['seconds']),
+            errors=s['errors'],
+            total=sum(s['seconds']),
+            p50=percentile(s['seconds'], 0.5),
+            p95=percentile(s['seconds'], 0.95),
+            max=max(s['seconds']),
+            rows=sum(s['rows']) / len(s['rows']),
+            profile=s['profile']
+        ))
+    return summaries
+
+
+def report(summaries:list, sort:str='total', top:int=10, operators:int=5) -> str:
+    """
+    A report of the `top` shapes of slow query by `sort`, with the operators
+    of their profile that had the most database hits
+    """
+    lines = []
+    for s in sorted(summaries, key=lambda s: s[sort], reverse=True)[:top]:
+        lines.append('{shape}  {endpoints}  count={count} errors={errors} total={total:.2f}s p50={p50:.3f}s p95={p95:.3f}s max={max:.3f}s rows={rows:.0f}'.format(
+            **dict(s, endpoints=','.join(s['endpoints']))
+        ))
+        lines.append('    ' + ' '.join(s['query'].split()))
+
+        profile = s['profile']
+        if profile is not None:
+            lines.append('    profile: {} db hits, {} rows'.format(profile.get('db_hits'), profile.get('rows')))
+            for op in sorted(profile['operators'], key=lambda op: op['db_hits'] or 0, reverse=True)[:operators]:
+                lines.append('      {:>12} db hits {:>10} rows  {}{} {}'.format(op['db_hits'], op['rows'], '  ' * op['depth'], op['operator'], op['details'] or ''))
+        lines.append('')
+    return '\n'.join(lines)
@@ -0,0 +1,266 @@
+"""
+Metrics of the queries that the beacon runs and of its process, served by
+`/metrics` in the Prometheus text format.
+
+Queries are grouped by endpoint and by shape, which is their Cypher with any
+literal replaced by `?`, so that queries which only differ in their SKIP and
+LIMIT share a shape. Shapes are labelled by a short hash of their Cypher, and
+`beacon_query_shape_info` gives the Cypher of each hash.
+
+Each worker process has its own metrics, so if the beacon is run with several
+`processes` each scrape only covers the worker that answers it.
+"""
+import gc
+import os
+import re
+import sys
+import time
+import bisect
+import hashlib
+import logging
+import threading
+
+from functools import lru_cache
+
+logger = logging.getLogger(__file__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds of the buckets of the latency histograms
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Beyond this many shapes, queries of new shapes are counted as one "other"
+# shape, so that a bug building queries cannot make the metrics grow forever
+MAX_SHAPES = 500
+OTHER = 'other'
+
+# Only one in this many records is sized, and the total estimated from them,
+# since sizing every record would cost a good part of building the response
+SIZE_SAMPLE = 64
+
+LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b")
+WHITESPACE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=4096)
+def shape(q:str) -> tuple:
+    """
+    The hash and the Cypher of the shape of a query
+    """
+    text = WHITESPACE.sub(' ', LITERALS.sub('?', q)).strip()
+    return hashlib.sha1(text.encode()).hexdigest()[:12], text
+
+
+def size(value) -> int:
+    """
+    Approximately how many bytes were decoded into a value of a record:
+    strings count their length, and numbers and booleans eight bytes
+    """
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum([size(v) for v in value])
+    if value is None:
+        return 0
+    items = getattr(value, 'items', None)
+    if items is not None:
+        return sum([len(k) + size(v) for k, v in items()])
+    if isinstance(value, bytes):
+        return len(value)
+    return 8
+
+
+def estimate_size(records:list) -> int:
+    """
+    Approximately how many bytes were decoded into the records, from a sample
+    """
+    sample = records[::SIZE_SAMPLE]
+    if len(sample) == 0:
+        return 0
+    return sum([size(record) for record in sample]) * len(records) // len(sample)
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(**kwargs) -> str:
+    return '{' + ','.join('{}="{}"'.format(key, escape(value)) for key, value in kwargs.items()) + '}'
+
+
+class Series(object):
+    """
+    The latency histogram and counters of the queries of one endpoint and shape
+    """
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.rows = 0
+        self.bytes = 0
+        self.errors = {}
+
+
+class QueryMetrics(object):
+    def __init__(self, max_shapes:int=MAX_SHAPES):
+        self.max_shapes = max_shapes
+        self.series = {}
+        self.shapes = {}
+        self.lock = threading.Lock()
+
+    def observe(self, endpoint:str, q:str, elapsed:float, rows:int=0, decoded:int=0, error:Exception=None):
+        """
+        Records a query that took `elapsed` seconds and returned `rows`
+        records holding `decoded` bytes, or failed with `error`
+        """
+        key, text = shape(q)
+        bucket = bisect.bisect_left(BUCKETS, elapsed)
+
+        with self.lock:
+            if key not in self.shapes:
+                if len(self.shapes) >= self.max_shapes:
+                    key = OTHER
+                else:
+                    self.shapes[key] = text
+
+            series = self.series.get((endpoint, key))
+            if series is None:
+                series = self.series[(endpoint, key)] = Series()
+
+            series.buckets[bucket] += 1
+            series.sum += elapsed
+            series.count += 1
+            series.rows += rows
+            series.bytes += decoded
+            if error is not None:
+                name = type(error).__name__
+                series.errors[name] = series.errors.get(name, 0) + 1
+
+    def render(self) -> list:
+        with self.lock:
+            series = sorted(self.series.items(), key=lambda item: (str(item[0][0]), item[0][1]))
+            shapes = sorted(self.shapes.items())
+
+            lines = [
+                '# HELP beacon_query_duration_seconds Time spent running queries and fetching their records.',
+                '# TYPE beacon_query_duration_seconds histogram',
+            ]
+            for (endpoint, key), s in series:
+                cumulative = 0
+                for bound, count in zip(list(BUCKETS) + ['+Inf'], s.buckets):
+                    cumulative += count
+                    lines.append('beacon_query_duration_seconds_bucket{} {}'.format(labels(endpoint=endpoint, shape=key, le=bound), cumulative))
+                lines.append('beacon_query_duration_seconds_sum{} {}'.format(labels(endpoint=endpoint, shape=key), s.sum))
+                lines.append('beacon_query_duration_seconds_count{} {}'.format(labels(endpoint=endpoint, shape=key), s.count))
+
+            lines += [
+                '# HELP beacon_query_rows_total Records returned by queries.',
+                '# TYPE beacon_query_rows_total counter',
+            ]
+            lines += ['beacon_query_rows_total{} {}'.format(labels(endpoint=endpoint, shape=key), s.rows) for (endpoint, key), s in series]
+
+            lines += [
+                '# HELP beacon_query_decoded_bytes_total Approximate size of the values decoded from the records of queries.',
+                '# TYPE beacon_query_decoded_bytes_total counter',
+            ]
+            lines += ['beacon_query_decoded_bytes_total{} {}'.format(labels(endpoint=endpoint, shape=key), s.bytes) for (endpoint, key), s in series]
+
+            lines += [
+                '# HELP beacon_query_errors_total Queries that failed, by the class of their error.',
+                '# TYPE beacon_query_errors_total counter',
+            ]
+            for (endpoint, key), s in series:
+                for error, count in sorted(s.errors.items()):
+                    lines.append('beacon_query_errors_total{} {}'.format(labels(endpoint=endpoint, shape=key, error=error), count))
+
+        lines += [
+            '# HELP beacon_query_shape_info The Cypher of each query shape.',
+            '# TYPE beacon_query_shape_info gauge',
+        ]
+        lines += ['beacon_query_shape_info{} 1'.format(labels(shape=key, query=text)) for key, text in shapes]
+
+        return lines
+
+
+def database_metrics(stats:dict) -> list:
+    """
+    The state of each Neo4j instance, from `database.stats()`
+    """
+    metrics = [
+        ('beacon_database_available', 'gauge', 'Whether the Neo4j instance is taking queries.', 'available'),
+        ('beacon_database_in_flight', 'gauge', 'Queries running on the Neo4j instance.', 'in_flight'),
+        ('beacon_database_queries_total', 'counter', 'Queries run on the Neo4j instance.', 'queries'),
+        ('beacon_database_errors_total', 'counter', 'Queries that failed on the Neo4j instance.', 'errors'),
+        ('beacon_database_ejections_total', 'counter', 'Times that the Neo4j instance was ejected.', 'ejections'),
+        ('beacon_database_hedges_total', 'counter', 'Hedged queries sent to the Neo4j instance.', 'hedges'),
+    ]
+    lines = []
+    for name, kind, description, key in metrics:
+        lines += ['# HELP {} {}'.format(name, description), '# TYPE {} {}'.format(name, kind)]
+        for uri, s in sorted(stats.items()):
+            lines.append('{}{} {}'.format(name, labels(uri=uri), int(s.get(key) or 0)))
+    return lines
+
+
+def process_metrics() -> list:
+    """
+    The standard process metrics, as far as the platform provides them
+    """
+    metrics = [
+        ('process_cpu_seconds_total', 'counter', 'Total user and system CPU time spent in seconds.', time.process_time()),
+        ('python_threads', 'gauge', 'Number of live threads.', threading.active_count()),
+    ]
+
+    try:
+        with open('/proc/self/statm') as f:
+            pages = f.read().split()
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        metrics.append(('process_virtual_memory_bytes', 'gauge', 'Virtual memory size in bytes.', int(pages[0]) * page_size))
+        metrics.append(('process_resident_memory_bytes', 'gauge', 'Resident memory size in bytes.', int(pages[1]) * page_size))
+        metrics.append(('process_open_fds', 'gauge', 'Number of open file descriptors.', len(os.listdir('/proc/self/fd'))))
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+        metrics.append(('process_max_fds', 'gauge', 'Maximum number of open file descriptors.', resource.getrlimit(resource.RLIMIT_NOFILE)[0]))
+    except (ImportError, OSError):
+        pass
+
+    metrics.append(('process_start_time_seconds', 'gauge', 'Start time of the process since unix epoch in seconds.', start_time))
+
+    lines = []
+    for name, kind, description, value in metrics:
+        lines += ['# HELP {} {}'.format(name, description), '# TYPE {} {}'.format(name, kind), '{} {}'.format(name, value)]
+
+    lines += [
+        '# HELP python_gc_collections_total Number of times each generation was collected.',
+        '# TYPE python_gc_collections_total counter',
+    ]
+    lines += [
+        'python_gc_collections_total{} {}'.format(labels(generation=generation), stats['collections'])
+        for generation, stats in enumerate(gc.get_stats())
+    ]
+    lines += [
+        '# HELP python_info Python platform information.',
+        '# TYPE python_info gauge',
+        'python_info{} 1'.format(labels(implementation=sys.implementation.name, version='.'.join(map(str, sys.version_info[:3])))),
+    ]
+
+    return lines
+
+
+def render() -> str:
+    """
+    Every metric in the Prometheus text format
+    """
+    from beacon_controller import database as db
+    from beacon_controller import singleflight
+    from beacon_controller.result_cache import cache
+
+    lines = queries.render() + cache.render() + singleflight.render() + database_metrics(db.stats()) + process_metrics()
+    return '\n'.join(lines) + '\n'
+
+
+start_time = time.time()
+queries = QueryMetrics()
@@ -0,0 +1,250 @@
+"""
+A cache of the records that the backend finds for /concepts, /statements and
+/exactmatches, since aggregators tend to send the same requests over and over.
+
+Requests are keyed by their parameters, normalized only as far as every
+backend already ignores the difference: keywords, the CURIEs and categories of
+/statements are lowercased, and the CURIEs of /exactmatches (which are fixed
+by `utils.fix_curie` before they get here) are sorted and deduplicated, since
+the response is built for each of them in turn. The order of the other lists
+is kept, as it decides the order of the records and so their paging, and the
+categories of /concepts keep their case, as they are matched against Neo4j
+labels as they are. The backend is always queried with the caller's own
+parameters.
+
+Entries expire `ttl` seconds after they were stored, and beyond `max_bytes`
+(an approximation, from the size of the values of the records) the least
+recently used entries are evicted. Each worker process has its own cache.
+
+Identical requests that miss the cache at the same time share one query (see
+singleflight.py). The records of such a query are held in a list, which the
+cache needs anyway. The requests of an endpoint that is left out of the cache
+neither wait for each other nor hold the records, and they stream the records
+from the backend as they arrive.
+"""
+import time
+import logging
+import threading
+
+from collections import OrderedDict
+
+from beacon_controller import config, utils, metrics
+from beacon_controller.singleflight import SingleFlight, default_timeout
+
+logger = logging.getLogger(__file__)
+
+CONCEPTS = 'concepts'
+STATEMENTS = 'statements'
+EXACT_MATCHES = 'exactmatches'
+ENDPOINTS = [CONCEPTS, STATEMENTS, EXACT_MATCHES]
+
+# What a record and an entry take beyond the size of their values, roughly
+RECORD_OVERHEAD = 200
+ENTRY_OVERHEAD = 500
+
+# An entry may take at most this share of max_bytes, so that one huge result
+# cannot flush the rest of the cache
+MAX_ENTRY_SHARE = 0.1
+
+
+def lowercase(values) -> tuple:
+    """
+    Lowercased, in the same order, for parameters that every backend matches
+    regardless of their case
+    """
+    if values is None:
+        return None
+    return tuple(value.lower() for value in values)
+
+
+def as_is(values) -> tuple:
+    if values is None:
+        return None
+    return tuple(values)
+
+
+def concepts_key(keywords=None, categories=None, offset=None, size=None) -> tuple:
+    return lowercase(keywords), as_is(categories), offset, size
+
+
+def statements_key(s=None, s_keywords=None, s_categories=None, edge_label=None, relation=None, t=None, t_keywords=None, t_categories=None, offset=None, size=None) -> tuple:
+    return lowercase(s), lowercase(s_keywords), lowercase(s_categories), edge_label, relation, lowercase(t), lowercase(t_keywords), lowercase(t_categories), offset, size
+
+
+def exact_matches_key(c) -> tuple:
+    # The CURIEs have already been fixed, and exact matches are case sensitive
+    return tuple(sorted(set(c)))
+
+
+def result_size(records:list) -> int:
+    return ENTRY_OVERHEAD + metrics.estimate_size(records) + RECORD_OVERHEAD * len(records)
+
+
+class Counters(object):
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.entries = 0
+        self.bytes = 0
+
+
+class ResultCache(object):
+    """
+    An LRU cache of backend results of at most `max_bytes`, whose entries
+    expire after `ttl` seconds (never if it is 0), for the endpoints in
+    `endpoints`
+    """
+    def __init__(self, max_bytes:int, ttl:float, endpoints, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.endpoints = set(endpoints) if max_bytes > 0 else set()
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.counters = {endpoint: Counters() for endpoint in ENDPOINTS}
+        self.lock = threading.Lock()
+        self.flights = SingleFlight('requests', default_timeout())
+
+    def enabled(self, endpoint:str) -> bool:
+        return endpoint in self.endpoints
+
+    def lookup(self, endpoint:str, key:tuple) -> tuple:
+        """
+        Whether the result of the request is cached, and if so the result
+        """
+        key = (endpoint, key)
+        counters = self.counters[endpoint]
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                records, size, expires = entry
+                if expires is None or self.clock() < expires:
+                    self.entries.move_to_end(key)
+                    counters.hits += 1
+                    return True, records
+                self.remove(key)
+                counters.expirations += 1
+            counters.misses += 1
+            return False, None
+
+    def store(self, endpoint:str, key:tuple, records:list):
+        size = result_size(records)
+        if size > MAX_ENTRY_SHARE * self.max_bytes:
+            return
+
+        key = (endpoint, key)
+        expires = self.clock() + self.ttl if self.ttl else None
+
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (records, size, expires)
+            self.bytes += size
+            self.counters[endpoint].entries += 1
+            self.counters[endpoint].bytes += size
+
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self.remove(oldest)
+                self.counters[oldest[0]].evictions += 1
+
+    def remove(self, key:tuple):
+        # Only called with the lock held
+        records, size, expires = self.entries.pop(key)
+        self.bytes -= size
+        self.counters[key[0]].entries -= 1
+        self.counters[key[0]].bytes -= size
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self.remove(key)
+
+    def cached(self, endpoint:str, key:tuple, function) -> list:
+        """
+        The records that `function()` finds, from the cache if they are in it
+        under `key`, or else from the call with the same key in flight if
+        there is one. For an endpoint that is not cached, whatever
+        `function()` returns, which may stream its records.
+        """
+        if not self.enabled(endpoint):
+            return function()
+
+        found, records = self.lookup(endpoint, key)
+        if found:
+            return records
+
+        def load():
+            records = list(function())
+            self.store(endpoint, key, records)
+            return records
+
+        return self.flights.do((endpoint, key), load, label=endpoint)
+
+    async def async_cached(self, endpoint:str, key:tuple, function) -> list:
+        """
+        Like `cached`, for a coroutine function
+        """
+        if not self.enabled(endpoint):
+            return await function()
+
+        found, records = self.lookup(endpoint, key)
+        if found:
+            return records
+
+        async def load():
+            records = list(await function())
+            self.store(endpoint, key, records)
+            return records
+
+        return await self.flights.async_do((endpoint, key), load, label=endpoint)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                endpoint: dict(
+                    enabled=self.enabled(endpoint),
+                    hits=c.hits,
+                    misses=c.misses,
+                    evictions=c.evictions,
+                    expirations=c.expirations,
+                    entries=c.entries,
+                    bytes=c.bytes
+                )
+                for endpoint, c in self.counters.items()
+            }
+
+    def render(self) -> list:
+        """
+        The counters of each endpoint in the Prometheus text format
+        """
+        stats = self.stats()
+        series = [
+            ('beacon_result_cache_hits_total', 'counter', 'Requests answered from the result cache.', 'hits'),
+            ('beacon_result_cache_misses_total', 'counter', 'Requests that the result cache could not answer.', 'misses'),
+            ('beacon_result_cache_evictions_total', 'counter', 'Results evicted to keep the result cache within max_bytes.', 'evictions'),
+            ('beacon_result_cache_expirations_total', 'counter', 'Results found to have expired.', 'expirations'),
+            ('beacon_result_cache_entries', 'gauge', 'Results in the result cache.', 'entries'),
+            ('beacon_result_cache_bytes', 'gauge', 'Approximate size of the results in the result cache.', 'bytes'),
+        ]
+        lines = []
+        for name, kind, description, key in series:
+            lines += ['# HELP {} {}'.format(name, description), '# TYPE {} {}'.format(name, kind)]
+            for endpoint, s in sorted(stats.items()):
+                lines.append('{}{} {}'.format(name, metrics.labels(endpoint=endpoint), s[key]))
+        return lines
+
+
+def create_cache() -> ResultCache:
+    c = config.get('result_cache') or {}
+    return ResultCache(
+        max_bytes=c.get('max_bytes', 64 * 1024 * 1024),
+        ttl=c.get('ttl', 600),
+        endpoints=[endpoint for endpoint in ENDPOINTS if c.get(endpoint, True)]
+    )
+
+
+cache = create_cache()
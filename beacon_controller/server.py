@@ -0,0 +1,48 @@
+"""
+Serves the Flask app of connexion with tornado. Unlike connexion's own tornado
+server, which runs every request on the IOLoop thread one after the other, the
+WSGI app is run on a bounded pool of threads, and optionally in several forked
+processes, so that a slow query does not hold up every other request.
+"""
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes, task_id
+from tornado.wsgi import WSGIContainer
+
+logger = logging.getLogger(__file__)
+
+
+def fork(port:int, processes:int=1) -> list:
+    """
+    Binds the listening sockets and, if more than one process is wanted, forks
+    that many worker processes (one per CPU if `processes` is 0) which all
+    accept connections on them. Only the workers return, the parent process
+    waits for them and restarts any that crash.
+
+    This must be called before any thread is started or any database
+    connection is opened, since neither survives a fork.
+    """
+    sockets = bind_sockets(port)
+    if processes != 1:
+        fork_processes(processes if processes > 0 else None)
+    return sockets
+
+
+def serve(app, sockets:list, threads:int=16):
+    """
+    Runs the WSGI app on a pool of `threads` threads, serving the sockets
+    returned by `fork` until the process is stopped.
+    """
+    executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi') if threads > 1 else None
+    server = HTTPServer(WSGIContainer(app, executor=executor))
+    server.add_sockets(sockets)
+
+    worker = task_id()
+    logger.info('Serving with {} thread(s){}'.format(threads, '' if worker is None else f' in worker {worker}'))
+
+    IOLoop.current().start()
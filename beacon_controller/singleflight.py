@@ -0,0 +1,162 @@
+"""
+Coalesces concurrent identical calls, so that when many identical requests
+arrive at once (say for the statements of a concept that is trending) only
+the first runs its query, and the others wait for it and share its result,
+or its error.
+
+Each call in flight has a future under its key, which is dropped once the
+call has finished, so results are never kept beyond that (see
+result_cache.py for that). A caller that finds a call in flight waits for it
+for at most `coalesce_timeout` seconds (see config.yaml) and then fails with
+a TimeoutError, while the call itself carries on.
+"""
+import asyncio
+import logging
+import threading
+
+from concurrent import futures
+
+from beacon_controller import config, metrics
+
+logger = logging.getLogger(__file__)
+
+# Every SingleFlight, for /metrics
+registry = []
+
+
+def default_timeout():
+    timeout = config.get('coalesce_timeout', 120)
+    return timeout if timeout else None
+
+
+class Counters(object):
+    def __init__(self):
+        self.executions = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+
+class SingleFlight(object):
+    """
+    Runs at most one call at a time per key, named `name` in the metrics,
+    whose waiting callers give up after `timeout` seconds (None for never)
+    """
+    def __init__(self, name:str, timeout:float=None):
+        self.name = name
+        self.timeout = timeout
+        self.calls = {}
+        self.tasks = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def count(self, label, leader:bool):
+        # Only called with the lock held
+        counters = self.counters.get(label)
+        if counters is None:
+            counters = self.counters[label] = Counters()
+        if leader:
+            counters.executions += 1
+        else:
+            counters.coalesced += 1
+
+    def timed_out(self, key, label):
+        with self.lock:
+            self.counters[label].timeouts += 1
+        raise TimeoutError('Gave up after {}s waiting for an identical call in flight: {}'.format(self.timeout, key))
+
+    def do(self, key, function, label=None):
+        """
+        The result of `function()`, or of the identical call with the same
+        key that is already in flight
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = futures.Future()
+            self.count(label, leader)
+
+        if not leader:
+            try:
+                return future.result(self.timeout)
+            except futures.TimeoutError:
+                self.timed_out(key, label)
+
+        try:
+            result = function()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    async def async_do(self, key, function, label=None):
+        """
+        Like `do`, for a coroutine function. The call runs in its own task,
+        so that it carries on for the others if its first caller is cancelled.
+        """
+        task = self.tasks.get(key)
+        leader = task is None
+
+        if leader:
+            task = self.tasks[key] = asyncio.ensure_future(function())
+
+            def done(t):
+                if self.tasks.get(key) is t:
+                    del self.tasks[key]
+                # Retrieve the error, if every caller gave up on the task
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(done)
+
+        with self.lock:
+            self.count(label, leader)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), None if leader else self.timeout)
+        except asyncio.TimeoutError:
+            if task.done():
+                raise
+            self.timed_out(key, label)
+
+    def in_flight(self) -> int:
+        return len(self.calls) + len(self.tasks)
+
+
+def render() -> list:
+    """
+    The counters of every SingleFlight in the Prometheus text format
+    """
+    series = [
+        ('beacon_single_flight_executions_total', 'Calls that ran, rather than waiting for an identical one.', 'executions'),
+        ('beacon_single_flight_coalesced_total', 'Calls that shared the result of an identical one in flight.', 'coalesced'),
+        ('beacon_single_flight_timeouts_total', 'Calls that gave up waiting for an identical one in flight.', 'timeouts'),
+    ]
+    lines = []
+    for name, description, key in series:
+        lines += ['# HELP {} {}'.format(name, description), '# TYPE {} counter'.format(name)]
+        for flight in registry:
+            with flight.lock:
+                counters = sorted(flight.counters.items(), key=lambda item: str(item[0]))
+                lines += [
+                    '{}{} {}'.format(name, metrics.labels(flight=flight.name, label=label), getattr(c, key))
+                    for label, c in counters
+                ]
+
+    lines += [
+        '# HELP beacon_single_flight_in_flight Calls in flight that others can wait for.',
+        '# TYPE beacon_single_flight_in_flight gauge',
+    ]
+    lines += ['beacon_single_flight_in_flight{} {}'.format(metrics.labels(flight=flight.name), flight.in_flight()) for flight in registry]
+    return lines
+
+
+# For lazily initialized state, such as the prefix map and the Biolink Model
+# toolkit, which is otherwise loaded by every request that finds it missing
+initializers = SingleFlight('initializers', default_timeout())
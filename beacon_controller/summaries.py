@@ -0,0 +1,816 @@
+"""
+Reading and generating the offline metadata summaries that live in
+`data/{beacon name}/`. The metadata endpoints are served from these files
+rather than from live Cypher queries, which are far too slow to run on the
+request path.
+
+Summaries are generated by partitioning the graph by node label and by
+relationship type, and running each partition as a separate (much smaller)
+query. Partitions run concurrently, each worker thread using its own database
+session, and every finished partition is checkpointed so that an interrupted
+run can be resumed.
+
+For very large graphs the node and edge summaries can instead be estimated
+from a uniform sample of each label and relationship type. Estimated rows are
+flagged as such and carry confidence bounds on their frequency.
+
+After a new source has been loaded into the graph, the summaries can be updated
+incrementally by summarizing only that batch of nodes and edges (selected by
+their `provided_by` or by a load timestamp property) and adding the result to
+the existing files. Applied batches are recorded so that they are never added
+twice.
+"""
+import os
+import json
+import math
+import time
+import hashlib
+import datetime
+import random
+import logging
+import functools
+import threading
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+import data
+from beacon_controller import config
+from beacon_controller import biolink_model as blm
+
+logger = logging.getLogger(__file__)
+
+directory = os.path.join(data.path, config['beacon_name'])
+
+edge_path = os.path.join(directory, 'edge_summary.txt')
+node_path = os.path.join(directory, 'node_summary.txt')
+namespace_path = os.path.join(directory, 'namespace_summary.txt')
+prefix_path = os.path.join(directory, 'prefixes.txt')
+
+NODE = 'node'
+EDGE = 'edge'
+NAMESPACE = 'namespace'
+PREFIX = 'prefix'
+
+SUMMARIES = [NODE, EDGE, NAMESPACE, PREFIX]
+
+# Summaries that are partitioned by node label
+NODE_SUMMARIES = [NODE, NAMESPACE, PREFIX]
+
+FILENAMES = {
+    NODE: 'node_summary.txt',
+    EDGE: 'edge_summary.txt',
+    NAMESPACE: 'namespace_summary.txt',
+    PREFIX: 'prefixes.txt',
+}
+
+COLUMNS = {
+    NODE: ['category', 'prefix', 'frequency'],
+    EDGE: ['subject_category', 'subject_prefix', 'edge_type', 'relation', 'object_category', 'object_prefix', 'negated', 'frequency'],
+    NAMESPACE: ['local_prefix', 'clique_prefix', 'frequency'],
+    PREFIX: ['prefix', 'frequency'],
+}
+
+NAMESPACE_COLUMNS = COLUMNS[NAMESPACE]
+
+# Additional columns written by the approximate mode
+ESTIMATE_COLUMNS = ['estimated', 'frequency_lower', 'frequency_upper']
+
+FREQUENCY_COLUMNS = ['frequency', 'frequency_lower', 'frequency_upper']
+
+CHECKPOINT_FILENAME = '.summary_checkpoint.json'
+
+BATCHES_FILENAME = 'summary_batches.json'
+
+
+def read_summary(path:str) -> list:
+    """
+    Reads a pipe separated summary file into a list of dictionaries, one per row
+    """
+    return pd.read_csv(path, sep='|').to_dict(orient='records')
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def write_summary(rows:list, columns:list, path:str):
+    """
+    Writes rows in the same pipe separated format as the KGX summaries. The
+    file is written to a temporary location first and then moved into place,
+    so that readers never see a partially written summary.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    pd.DataFrame(rows, columns=columns).to_csv(tmp_path, sep='|')
+    os.replace(tmp_path, path)
+
+
+def file_digest(path:str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def merge_rows(rows:list, columns:list) -> list:
+    """
+    Sums the frequencies (and frequency bounds, if any) of rows that agree on
+    every other column, and returns the merged rows in descending order of
+    frequency.
+    """
+    keys = [c for c in columns if c not in FREQUENCY_COLUMNS and c != 'estimated']
+    totals = [c for c in columns if c in FREQUENCY_COLUMNS]
+    merged = {}
+    for row in rows:
+        key = tuple(None if _is_missing(row.get(k)) else row.get(k) for k in keys)
+        if key not in merged:
+            merged[key] = dict(zip(keys, key), **{c: 0 for c in totals})
+            if 'estimated' in columns:
+                merged[key]['estimated'] = False
+        for c in totals:
+            merged[key][c] += row[c]
+        if 'estimated' in columns:
+            merged[key]['estimated'] = merged[key]['estimated'] or bool(row.get('estimated'))
+
+    return sorted(merged.values(), key=lambda row: row['frequency'], reverse=True)
+
+
+def wilson_interval(k:int, n:int, z:float=1.96) -> tuple:
+    """
+    Wilson score interval for a proportion of k successes out of n trials
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = k / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def z_score(confidence:float) -> float:
+    """
+    Two sided standard normal critical value for the given confidence level,
+    e.g. 1.96 for 0.95
+    """
+    low, high = 0.0, 10.0
+    for _ in range(64):
+        z = (low + high) / 2
+        if math.erf(z / math.sqrt(2)) < confidence:
+            low = z
+        else:
+            high = z
+    return (low + high) / 2
+
+
+def estimate_rows(sample:list, total:int, columns:list, z:float=1.96) -> list:
+    """
+    Scales up a uniform sample of `total` nodes or edges into estimated summary
+    rows. Each sampled item may contribute several rows (one for each of its
+    categories), so the items are passed in as lists of rows. If the sample
+    covers the whole population then the rows are exact.
+
+    The sample may have been drawn by keeping each item with the same
+    probability, in which case its size varies, but given its size it is a
+    uniform sample without replacement, so scaling by it is still unbiased.
+    """
+    m = len(sample)
+    hits = defaultdict(lambda: 0)
+    for item_rows in sample:
+        for key in set(tuple(row.get(c) for c in columns if c != 'frequency') for row in item_rows):
+            hits[key] += 1
+
+    keys = [c for c in columns if c != 'frequency']
+    rows = []
+    for key, k in hits.items():
+        if m >= total:
+            frequency = lower = upper = k
+        else:
+            lower, upper = wilson_interval(k, m, z)
+            frequency = round(k / m * total)
+            lower, upper = math.floor(lower * total), math.ceil(upper * total)
+        rows.append(dict(
+            zip(keys, key),
+            frequency=frequency,
+            estimated=m < total,
+            frequency_lower=lower,
+            frequency_upper=upper
+        ))
+    return rows
+
+
+def _sampling_probability(size:int, total:int) -> float:
+    return min(1.0, size / total) if total > 0 else 1.0
+
+
+def _escape(name:str) -> str:
+    return '`{}`'.format(name.replace('`', '``'))
+
+
+def _where(*conditions) -> str:
+    conditions = [c for c in conditions if c is not None]
+    return 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+
+class Batch(object):
+    """
+    A batch of nodes and edges that were loaded into the graph together,
+    selected either by their `provided_by` value or by a load timestamp
+    property being at least `since`.
+    """
+    def __init__(self, provided_by:str=None, timestamp_property:str=None, since=None):
+        if (provided_by is None) == (timestamp_property is None or since is None):
+            raise ValueError('A batch is given either by provided_by, or by timestamp_property and since')
+        self.provided_by = provided_by
+        self.timestamp_property = timestamp_property
+        self.since = since
+
+    @property
+    def id(self) -> str:
+        if self.provided_by is not None:
+            return f'provided_by={self.provided_by}'
+        else:
+            return f'{self.timestamp_property}>={self.since}'
+
+    def condition(self, variable:str) -> str:
+        """
+        Cypher condition selecting the batch. Adding an empty list turns a
+        single provided_by value into a list, so both forms are matched.
+        """
+        if self.provided_by is not None:
+            return f'$batch_provided_by IN ({variable}.provided_by + [])'
+        else:
+            return f'{variable}[$batch_timestamp_property] >= $batch_since'
+
+    def parameters(self) -> dict:
+        if self.provided_by is not None:
+            return dict(batch_provided_by=self.provided_by)
+        else:
+            return dict(batch_timestamp_property=self.timestamp_property, batch_since=self.since)
+
+    def matches(self, properties:dict) -> bool:
+        if self.provided_by is not None:
+            from beacon_controller import utils
+            return self.provided_by in utils.listify(properties.get('provided_by'))
+        else:
+            value = properties.get(self.timestamp_property)
+            return value is not None and value >= self.since
+
+
+def _prefix(curie):
+    return curie.split(':')[0] if isinstance(curie, str) else curie
+
+
+class Neo4jSource(object):
+    """
+    Computes partial summaries with Cypher. Each method handles exactly one
+    partition of the graph, and is safe to call from multiple threads.
+    """
+    def __init__(self, query=None):
+        if query is None:
+            from beacon_controller import database as db
+            query = functools.partial(db.query, endpoint='summaries')
+        self.query = query
+
+    def labels(self) -> list:
+        results = self.query('CALL db.labels() YIELD label RETURN label')
+        return [result['label'] for result in results]
+
+    def edge_types(self) -> list:
+        results = self.query('CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType AS edge_type')
+        return [result['edge_type'] for result in results]
+
+    def node_summary(self, label, batch:Batch=None) -> list:
+        batch_condition = batch.condition('n') if batch is not None else None
+        parameters = batch.parameters() if batch is not None else {}
+
+        if label is None:
+            q = """
+            MATCH (n) {where}
+            RETURN $category AS category, split(n.id, ":")[0] AS prefix, COUNT(*) AS frequency;
+            """.format(where=_where('size(labels(n)) = 0', batch_condition))
+            return self.query(q, category=blm.DEFAULT_CATEGORY, **parameters)
+        else:
+            q = """
+            MATCH (n:{label}) {where}
+            RETURN $category AS category, split(n.id, ":")[0] AS prefix, COUNT(*) AS frequency;
+            """.format(label=_escape(label), where=_where(batch_condition))
+            return self.query(q, category=label, **parameters)
+
+    def edge_summary(self, edge_type, batch:Batch=None) -> list:
+        batch_condition = batch.condition('r') if batch is not None else None
+        parameters = batch.parameters() if batch is not None else {}
+
+        q = """
+        MATCH (s)-[r:{edge_type}]->(o) {where}
+        UNWIND CASE WHEN size(labels(s)) = 0 THEN [$default_category] ELSE labels(s) END AS subject_category
+        UNWIND CASE WHEN size(labels(o)) = 0 THEN [$default_category] ELSE labels(o) END AS object_category
+        RETURN
+            subject_category AS subject_category,
+            split(s.id, ":")[0] AS subject_prefix,
+            type(r) AS edge_type,
+            r.relation AS relation,
+            object_category AS object_category,
+            split(o.id, ":")[0] AS object_prefix,
+            r.negated AS negated,
+            COUNT(*) AS frequency;
+        """.format(edge_type=_escape(edge_type), where=_where(batch_condition))
+        return self.query(q, default_category=blm.DEFAULT_CATEGORY, **parameters)
+
+    def namespace_summary(self, label, batch:Batch=None) -> list:
+        batch_condition = batch.condition('n') if batch is not None else None
+        parameters = batch.parameters() if batch is not None else {}
+
+        # Nodes with several labels must only be counted in one partition
+        if label is None:
+            match = 'MATCH (n) ' + _where('size(labels(n)) = 0', batch_condition)
+        else:
+            match = 'MATCH (n:{}) '.format(_escape(label)) + _where('head(labels(n)) = $label', batch_condition)
+
+        q = match + """
+        WITH
+            split(n.id, ":")[0] AS local_prefix,
+            [x IN COALESCE(n.xrefs, []) + COALESCE(n.clique, []) WHERE x <> n.id] AS ids
+        UNWIND
+            ids AS id
+        RETURN
+            local_prefix AS local_prefix,
+            split(id, ":")[0] AS clique_prefix,
+            COUNT(*) AS frequency;
+        """
+        return self.query(q, label=label, **parameters)
+
+    def prefix_summary(self, label, batch:Batch=None) -> list:
+        batch_condition = batch.condition('n') if batch is not None else None
+        parameters = batch.parameters() if batch is not None else {}
+
+        if label is None:
+            match = 'MATCH (n) ' + _where('size(labels(n)) = 0', batch_condition)
+        else:
+            match = 'MATCH (n:{}) '.format(_escape(label)) + _where('head(labels(n)) = $label', batch_condition)
+
+        q = match + """
+        RETURN split(n.id, ":")[0] AS prefix, COUNT(*) AS frequency;
+        """
+        return self.query(q, label=label, **parameters)
+
+    def count_nodes(self, label) -> int:
+        q = 'MATCH (n:{}) RETURN COUNT(n) AS count'.format(_escape(label))
+        return self.query(q)[0]['count']
+
+    def count_edges(self, edge_type) -> int:
+        q = 'MATCH ()-[r:{}]->() RETURN COUNT(r) AS count'.format(_escape(edge_type))
+        return self.query(q)[0]['count']
+
+    def sample_nodes(self, label, size:int, total:int) -> list:
+        # Every node is kept with the same probability, and there is no LIMIT,
+        # which would keep the first nodes in scan order rather than a uniform
+        # sample. The sample therefore only has about `size` nodes.
+        q = """
+        MATCH (n:{label}) WHERE rand() < $p
+        RETURN split(n.id, ":")[0] AS prefix;
+        """.format(label=_escape(label))
+        return self.query(q, p=_sampling_probability(size, total))
+
+    def sample_edges(self, edge_type, size:int, total:int) -> list:
+        q = """
+        MATCH (s)-[r:{edge_type}]->(o) WHERE rand() < $p
+        RETURN
+            labels(s) AS subject_categories,
+            split(s.id, ":")[0] AS subject_prefix,
+            type(r) AS edge_type,
+            r.relation AS relation,
+            labels(o) AS object_categories,
+            split(o.id, ":")[0] AS object_prefix,
+            r.negated AS negated;
+        """.format(edge_type=_escape(edge_type))
+        return self.query(q, p=_sampling_probability(size, total))
+
+
+class MemorySource(object):
+    """
+    Computes partial summaries over nodes and edges held in memory, standing in
+    for a graph database. Nodes are dictionaries with `id`, `category`, `xrefs`
+    and `clique` properties; edges are dictionaries with `subject`, `object`,
+    `edge_label`, `relation` and `negated` properties.
+    """
+    def __init__(self, nodes:list, edges:list):
+        self.nodes = {node['id']: node for node in nodes}
+        self.edges = edges
+
+    @staticmethod
+    def _categories(node) -> list:
+        from beacon_controller import utils
+        return utils.listify(node.get('category'))
+
+    def labels(self) -> list:
+        labels = set()
+        for node in self.nodes.values():
+            labels.update(self._categories(node))
+        return sorted(labels)
+
+    def edge_types(self) -> list:
+        return sorted(set(edge['edge_label'] for edge in self.edges))
+
+    def node_summary(self, label, batch:Batch=None) -> list:
+        rows = []
+        for node in self.nodes.values():
+            if batch is not None and not batch.matches(node):
+                continue
+            categories = self._categories(node)
+            if label in categories or (label is None and categories == []):
+                category = label if label is not None else blm.DEFAULT_CATEGORY
+                rows.append(dict(category=category, prefix=_prefix(node['id']), frequency=1))
+        return merge_rows(rows, COLUMNS[NODE])
+
+    def edge_summary(self, edge_type, batch:Batch=None) -> list:
+        rows = []
+        for edge in self.edges:
+            if edge['edge_label'] != edge_type:
+                continue
+            if batch is not None and not batch.matches(edge):
+                continue
+            s, o = self.nodes.get(edge['subject'], {}), self.nodes.get(edge['object'], {})
+            for subject_category in self._categories(s) or [blm.DEFAULT_CATEGORY]:
+                for object_category in self._categories(o) or [blm.DEFAULT_CATEGORY]:
+                    rows.append(dict(
+                        subject_category=subject_category,
+                        subject_prefix=_prefix(edge['subject']),
+                        edge_type=edge_type,
+                        relation=edge.get('relation'),
+                        object_category=object_category,
+                        object_prefix=_prefix(edge['object']),
+                        negated=edge.get('negated'),
+                        frequency=1
+                    ))
+        return merge_rows(rows, COLUMNS[EDGE])
+
+    def namespace_summary(self, label, batch:Batch=None) -> list:
+        from beacon_controller import utils
+        rows = []
+        for node in self.nodes.values():
+            if batch is not None and not batch.matches(node):
+                continue
+            categories = self._categories(node)
+            if (categories[0] if categories else None) != label:
+                continue
+            ids = utils.listify(node.get('xrefs')) + utils.listify(node.get('clique'))
+            for i in ids:
+                if i != node['id']:
+                    rows.append(dict(local_prefix=_prefix(node['id']), clique_prefix=_prefix(i), frequency=1))
+        return merge_rows(rows, COLUMNS[NAMESPACE])
+
+    def prefix_summary(self, label, batch:Batch=None) -> list:
+        rows = []
+        for node in self.nodes.values():
+            if batch is not None and not batch.matches(node):
+                continue
+            categories = self._categories(node)
+            if (categories[0] if categories else None) == label:
+                rows.append(dict(prefix=_prefix(node['id']), frequency=1))
+        return merge_rows(rows, COLUMNS[PREFIX])
+
+    def count_nodes(self, label) -> int:
+        return sum(1 for node in self.nodes.values() if label in self._categories(node))
+
+    def count_edges(self, edge_type) -> int:
+        return sum(1 for edge in self.edges if edge['edge_label'] == edge_type)
+
+    def sample_nodes(self, label, size:int, total:int) -> list:
+        nodes = [node for node in self.nodes.values() if label in self._categories(node)]
+        return [dict(prefix=_prefix(node['id'])) for node in random.sample(nodes, min(size, len(nodes)))]
+
+    def sample_edges(self, edge_type, size:int, total:int) -> list:
+        edges = [edge for edge in self.edges if edge['edge_label'] == edge_type]
+        rows = []
+        for edge in random.sample(edges, min(size, len(edges))):
+            s, o = self.nodes.get(edge['subject'], {}), self.nodes.get(edge['object'], {})
+            rows.append(dict(
+                subject_categories=self._categories(s),
+                subject_prefix=_prefix(edge['subject']),
+                edge_type=edge_type,
+                relation=edge.get('relation'),
+                object_categories=self._categories(o),
+                object_prefix=_prefix(edge['object']),
+                negated=edge.get('negated')
+            ))
+        return rows
+
+
+class Summarizer(object):
+    """
+    Generates the summary files in `directory` from the given source, by
+    default the configured backend.
+
+    If `sample_size` is given then the node and edge summaries are estimated
+    from samples of about that many nodes per label and edges per type, with
+    frequency bounds at the given confidence level. Nodes without any label are
+    not sampled.
+
+    If `batch` is given then only that batch of nodes and edges is summarized,
+    and the result is added to the existing summary files.
+
+    Finished partitions are checkpointed to `.summary_checkpoint.json` unless
+    `checkpoint` is False, as it is for the generators that the beacon runs in
+    the background, so that they never pick up or remove the checkpoint of an
+    interrupted `tkg-beacon summarize`.
+
+    Usage:
+
+        Summarizer(workers=8).run([NODE, EDGE])
+        Summarizer(sample_size=10000).run([NODE, EDGE])
+        Summarizer(batch=Batch(provided_by='hgnc')).run()
+    """
+    def __init__(self, source=None, directory:str=directory, workers:int=4, sample_size:int=None, confidence:float=0.95, batch:Batch=None, checkpoint:bool=True):
+        if sample_size is not None and batch is not None:
+            raise ValueError('Batches cannot be applied to estimated summaries')
+        if source is None:
+            from beacon_controller.backends import backend
+            source = backend().summary_source()
+        self.source = source
+        self.directory = directory
+        self.workers = workers
+        self.sample_size = sample_size
+        self.z = z_score(confidence)
+        self.batch = batch
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT_FILENAME) if checkpoint else None
+        self.batches_path = os.path.join(directory, BATCHES_FILENAME)
+        self._lock = threading.Lock()
+
+    def estimated(self, summary:str) -> bool:
+        return self.sample_size is not None and summary in [NODE, EDGE]
+
+    def columns(self, summary:str) -> list:
+        if self.estimated(summary):
+            return COLUMNS[summary] + ESTIMATE_COLUMNS
+        else:
+            return COLUMNS[summary]
+
+    def partitions(self, summaries:list) -> list:
+        """
+        Returns a list of (key, summary, argument) tuples, one for each
+        partition of the graph that needs to be summarized.
+        """
+        partitions = []
+        if any(summary in summaries for summary in NODE_SUMMARIES):
+            labels = self.source.labels()
+            for summary in NODE_SUMMARIES:
+                if summary in summaries:
+                    arguments = labels if self.estimated(summary) else labels + [None]
+                    partitions += [(self.key(summary, label), summary, label) for label in arguments]
+        if EDGE in summaries:
+            partitions += [(self.key(EDGE, edge_type), EDGE, edge_type) for edge_type in self.source.edge_types()]
+        return partitions
+
+    def key(self, summary:str, argument) -> str:
+        if self.estimated(summary):
+            return f'{summary}:{argument}:{self.sample_size}'
+        elif self.batch is not None:
+            return f'{summary}:{argument}:{self.batch.id}'
+        else:
+            return f'{summary}:{argument}'
+
+    def load_checkpoint(self) -> dict:
+        if self.checkpoint_path is None or not os.path.isfile(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path, 'r') as f:
+            return json.load(f)
+
+    def save_checkpoint(self, checkpoint:dict):
+        if self.checkpoint_path is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def load_batches(self) -> dict:
+        """
+        Returns the batches that have already been applied, as a dictionary
+        from batch id to the summaries it was applied to and when.
+        """
+        if not os.path.isfile(self.batches_path):
+            return {}
+        with open(self.batches_path, 'r') as f:
+            return json.load(f)
+
+    def save_batches(self, batches:dict):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.batches_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(batches, f, indent=2)
+        os.replace(tmp_path, self.batches_path)
+
+    def record_batch(self, summary:str, digest:str=None):
+        """
+        Records the batch as applied to the summary or, given the digest of
+        the summary file that applying it is about to write, as pending
+        """
+        batches = self.load_batches()
+        record = batches.setdefault(self.batch.id, {'summaries': []})
+        pending = record.setdefault('pending', {})
+        if digest is not None:
+            pending[summary] = digest
+        else:
+            pending.pop(summary, None)
+            record['summaries'].append(summary)
+            record['applied'] = datetime.datetime.now().isoformat()
+        if not pending:
+            del record['pending']
+        self.save_batches(batches)
+
+    def resolve_pending(self):
+        """
+        Settles the summaries that the batch was being applied to when a
+        previous run stopped: if the summary file is the one that applying it
+        was about to write then the batch was applied, and otherwise it was not
+        """
+        record = self.load_batches().get(self.batch.id, {})
+        for summary, digest in list(record.get('pending', {}).items()):
+            path = os.path.join(self.directory, FILENAMES[summary])
+            if os.path.isfile(path) and file_digest(path) == digest:
+                logger.info('Batch {} had been applied to {} before the previous run stopped'.format(self.batch.id, path))
+                self.record_batch(summary)
+            else:
+                batches = self.load_batches()
+                pending = batches[self.batch.id]['pending']
+                del pending[summary]
+                if not pending:
+                    del batches[self.batch.id]['pending']
+                self.save_batches(batches)
+
+    def apply_delta(self, summary:str, rows:list, path:str):
+        """
+        Adds the rows summarizing a batch to an existing summary file, and
+        records the batch as applied to it. If that summary was estimated then
+        the batch's exact rows are added with bounds equal to their frequency.
+
+        The new file is written next to the old one, and the batch recorded as
+        pending with the new file's digest, before the new file replaces the
+        old one. A run that stops in between can then tell from the file
+        whether the batch was applied, so that it is never added twice.
+        """
+        existing = read_summary(path) if os.path.isfile(path) else []
+        columns = COLUMNS[summary]
+        if existing and 'estimated' in existing[0]:
+            columns = columns + ESTIMATE_COLUMNS
+            rows = [dict(row, estimated=False, frequency_lower=row['frequency'], frequency_upper=row['frequency']) for row in rows]
+
+        delta_path = path + '.delta'
+        write_summary(merge_rows(existing + rows, columns), columns, delta_path)
+        self.record_batch(summary, digest=file_digest(delta_path))
+        os.replace(delta_path, path)
+        self.record_batch(summary)
+
+    def summarize(self, summary:str, argument) -> list:
+        if self.estimated(summary):
+            return self.estimate(summary, argument)
+        method = getattr(self.source, f'{summary}_summary')
+        if self.batch is not None:
+            results = method(argument, batch=self.batch)
+        else:
+            results = method(argument)
+        return [{k: row[k] for k in COLUMNS[summary]} for row in results]
+
+    def estimate(self, summary:str, argument) -> list:
+        if summary == NODE:
+            total = self.source.count_nodes(argument)
+            sample = [
+                [dict(category=argument, prefix=row['prefix'])]
+                for row in self.source.sample_nodes(argument, self.sample_size, total)
+            ]
+        else:
+            total = self.source.count_edges(argument)
+            sample = []
+            for row in self.source.sample_edges(argument, self.sample_size, total):
+                item_rows = []
+                for subject_category in row['subject_categories'] or [blm.DEFAULT_CATEGORY]:
+                    for object_category in row['object_categories'] or [blm.DEFAULT_CATEGORY]:
+                        item_rows.append(dict(
+                            row,
+                            subject_category=subject_category,
+                            object_category=object_category
+                        ))
+                sample.append(item_rows)
+        return estimate_rows(sample, total, COLUMNS[summary], self.z)
+
+    def run(self, summaries:list=SUMMARIES, restart:bool=False):
+        """
+        Summarizes every partition that has not already been checkpointed, and
+        then writes the summary files. The checkpoint is removed once the files
+        have been written.
+        """
+        if self.batch is not None:
+            self.resolve_pending()
+            applied = self.load_batches().get(self.batch.id, {}).get('summaries', [])
+            if applied:
+                logger.info('Batch {} has already been applied to the {} summaries'.format(self.batch.id, ', '.join(applied)))
+            summaries = [summary for summary in summaries if summary not in applied]
+
+        checkpoint = {} if restart else self.load_checkpoint()
+        partitions = self.partitions(summaries)
+        pending = [p for p in partitions if p[0] not in checkpoint]
+
+        logger.info('Summarizing {} partitions, {} already checkpointed'.format(
+            len(pending), len(partitions) - len(pending)
+        ))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.summarize, summary, argument): key for key, summary, argument in pending}
+            for future in as_completed(futures):
+                key = futures[future]
+                rows = future.result()
+                with self._lock:
+                    checkpoint[key] = rows
+                    self.save_checkpoint(checkpoint)
+                logger.info('Finished partition {} ({} rows)'.format(key, len(rows)))
+
+        for summary in summaries:
+            rows = []
+            for key, s, argument in partitions:
+                if s == summary:
+                    rows += checkpoint[key]
+            path = os.path.join(self.directory, FILENAMES[summary])
+            if self.batch is not None:
+                self.apply_delta(summary, rows, path)
+                logger.info('Applied batch {} to {}'.format(self.batch.id, path))
+            else:
+                columns = self.columns(summary)
+                write_summary(merge_rows(rows, columns), columns, path)
+                logger.info('Wrote {}'.format(path))
+
+        if self.checkpoint_path is not None and os.path.isfile(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+
+def generate_namespace_summary(path:str=namespace_path):
+    """
+    Generates `namespace_summary.txt` from the graph. Each row counts the
+    number of times that an identifier with the given clique prefix is mapped
+    onto a node with the given local prefix.
+    """
+    logger.info('Generating namespace summary {}'.format(path))
+    Summarizer(directory=os.path.dirname(path), checkpoint=False).run([NAMESPACE])
+
+
+def generate_prefix_summary(path:str=prefix_path):
+    """
+    Generates `prefixes.txt`, the identifier prefixes used in the graph and
+    the number of nodes with each of them.
+    """
+    logger.info('Generating prefix summary {}'.format(path))
+    Summarizer(directory=os.path.dirname(path), checkpoint=False).run([PREFIX])
+
+
+# After a background generator fails it is not run again for this many
+# seconds, doubling with each failure in a row up to the maximum, so that a
+# request that triggers it does not start a full scan every time
+GENERATOR_RETRY_BACKOFF = 60
+MAX_GENERATOR_RETRY_BACKOFF = 3600
+
+__generator_locks = defaultdict(threading.Lock)
+__generator_locks_lock = threading.Lock()
+
+# The failures in a row of each generator, and when it may be run again
+__generator_failures = {}
+
+
+def generate_in_background(generator, *args, clock=time.monotonic) -> bool:
+    """
+    Runs the given summary generator in a daemon thread so that the caller is
+    not blocked. Each generator only runs once at a time, returns False if it
+    is still running, or if it failed recently and is backing off.
+    """
+    with __generator_locks_lock:
+        lock = __generator_locks[generator]
+
+    if not lock.acquire(blocking=False):
+        logger.debug('Summary generator {} is still running'.format(generator.__name__))
+        return False
+
+    with __generator_locks_lock:
+        failures, retry_at = __generator_failures.get(generator, (0, None))
+
+    if retry_at is not None and clock() < retry_at:
+        logger.debug('Summary generator {} failed {} time(s) in a row, not retrying yet'.format(generator.__name__, failures))
+        lock.release()
+        return False
+
+    def run():
+        try:
+            generator(*args)
+        except Exception:
+            backoff = min(GENERATOR_RETRY_BACKOFF * 2 ** failures, MAX_GENERATOR_RETRY_BACKOFF)
+            logger.exception('Failed to run summary generator {}, retrying in {} seconds'.format(generator.__name__, backoff))
+            with __generator_locks_lock:
+                __generator_failures[generator] = (failures + 1, clock() + backoff)
+        else:
+            with __generator_locks_lock:
+                __generator_failures.pop(generator, None)
+        finally:
+            lock.release()
+
+    threading.Thread(target=run, name=generator.__name__, daemon=True).start()
+    return True
@@ -0,0 +1,209 @@
+import os
+import json
+import asyncio
+import threading
+import shutil
+import tempfile
+import unittest
+
+from beacon_controller.backends import Backend, MemoryBackend, SQLiteBackend, sqlite_backend
+from beacon_controller.backends.snapshot_backend import SnapshotBackend, build as build_snapshot
+
+KGX = os.path.join(os.path.dirname(__file__), 'kgx')
+NODES = [os.path.join(KGX, 'nodes.tsv'), os.path.join(KGX, 'extra.json')]
+# The edges of extra.json are read along with its nodes
+EDGES = [os.path.join(KGX, 'edges.tsv')]
+
+CONCEPTS = [
+    dict(keywords=['gene']),
+    dict(keywords=['P53', 'cancer']),
+    dict(keywords=['carcinoma']),
+    dict(categories=['disease']),
+    dict(keywords=['a'], categories=['gene', 'chemical_substance']),
+    dict(keywords=['no such concept']),
+    dict(),
+]
+
+STATEMENTS = [
+    dict(),
+    dict(s=['hgnc:2']),
+    dict(t=['MONDO:1']),
+    dict(s=['HGNC:2'], t=['MONDO:2']),
+    dict(edge_label='causes'),
+    dict(relation='RO:3'),
+    dict(s_keywords=['tp5'], t_keywords=['lung']),
+    dict(s_categories=['gene'], t_categories=['disease']),
+    dict(t_categories=['protein']),
+    dict(s=['NO:1']),
+]
+
+EXACT_MATCHES = [
+    ['NCBIGene:1', 'HGNC:2', 'NO:1'],
+    ['UniProtKB:P04637'],
+    ['DOID:1324', 'MONDO:2'],
+]
+
+CONCEPT_DETAILS = ['HGNC:1', 'hgnc:2', 'CHEBI:15365', 'NO:1']
+
+STATEMENT_DETAILS = ['E:1', 'HGNC:2:causes:MONDO:2', 'NO:1']
+
+
+def normalized(records) -> list:
+    """
+    The records as JSON, in order, to compare the records of different backends
+    """
+    return [json.dumps(record if isinstance(record, tuple) else dict(record), sort_keys=True, default=dict) for record in records]
+
+
+class TestBackends(unittest.TestCase):
+    """
+    Every backend finds the same records in the same KGX files
+    """
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        sqlite_path = os.path.join(cls.directory, 'beacon.sqlite')
+        snapshot_path = os.path.join(cls.directory, 'snapshot')
+        sqlite_backend.build(sqlite_path, NODES, EDGES)
+        build_snapshot(snapshot_path, NODES, EDGES)
+
+        cls.memory = MemoryBackend.load(NODES, EDGES)
+        cls.others = [SQLiteBackend(sqlite_path), SnapshotBackend(snapshot_path)]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def assertSameRecords(self, method, *args, **kwargs):
+        expected = normalized(getattr(self.memory, method)(*args, **kwargs))
+        for backend in self.others:
+            with self.subTest(backend=type(backend).__name__):
+                self.assertEqual(normalized(getattr(backend, method)(*args, **kwargs)), expected)
+        return expected
+
+    def test_concepts(self):
+        for parameters in CONCEPTS:
+            with self.subTest(**parameters):
+                self.assertSameRecords('concepts', **parameters)
+
+        self.assertEqual(len(self.assertSameRecords('concepts', keywords=['cancer'])), 2)
+
+    def test_concepts_paging(self):
+        every = self.assertSameRecords('concepts')
+        self.assertEqual(len(every), 5)
+        pages = [self.assertSameRecords('concepts', offset=offset, size=2) for offset in range(0, 6, 2)]
+        self.assertEqual(sum(pages, []), every)
+
+    def test_statements(self):
+        for parameters in STATEMENTS:
+            with self.subTest(**parameters):
+                self.assertSameRecords('statements', **parameters)
+
+        self.assertEqual(len(self.assertSameRecords('statements', s=['hgnc:2'])), 2)
+
+    def test_statements_paging(self):
+        every = self.assertSameRecords('statements')
+        self.assertEqual(len(every), 4)
+        pages = [self.assertSameRecords('statements', offset=offset, size=3) for offset in range(0, 6, 3)]
+        self.assertEqual(sum(pages, []), every)
+
+    def test_exact_matches(self):
+        for c in EXACT_MATCHES:
+            with self.subTest(c=c):
+                self.assertSameRecords('exact_matches', c)
+
+        self.assertEqual(self.assertSameRecords('exact_matches', ['NO:1']), [])
+
+    def test_concept_details(self):
+        for concept_id in CONCEPT_DETAILS:
+            with self.subTest(concept_id=concept_id):
+                self.assertSameRecords('concept_details', concept_id)
+
+    def test_statement_details(self):
+        for statement_id in STATEMENT_DETAILS:
+            with self.subTest(statement_id=statement_id):
+                self.assertSameRecords('statement_details', statement_id)
+
+    def test_async(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        for backend in [self.memory] + self.others:
+            with self.subTest(backend=type(backend).__name__):
+                records = loop.run_until_complete(backend.async_concepts(keywords=['cancer']))
+                self.assertEqual(normalized(records), normalized(backend.concepts(keywords=['cancer'])))
+
+
+class TestMemoryBackend(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.backend = MemoryBackend.load(NODES, EDGES)
+
+    def ids(self, records, key=0):
+        return [record[key] for record in records]
+
+    def test_concepts(self):
+        self.assertEqual(self.ids(self.backend.concepts(keywords=['cancer'])), ['MONDO:1', 'MONDO:2'])
+        self.assertEqual(self.ids(self.backend.concepts(keywords=['acetylsalicylic'])), ['CHEBI:15365'])
+        self.assertEqual(self.ids(self.backend.concepts(categories=['protein'])), ['HGNC:2'])
+        self.assertEqual(len(list(self.backend.concepts())), 5)
+        self.assertEqual(self.ids(self.backend.concepts(offset=4, size=2)), ['CHEBI:15365'])
+
+    def test_statements(self):
+        self.assertEqual(self.ids(self.backend.statements(s=['hgnc:2']), 'statement_id'), ['E:2', 'E:3'])
+        self.assertEqual(len(list(self.backend.statements(edge_label='causes'))), 2)
+        self.assertEqual(len(list(self.backend.statements())), 4)
+
+        statement = list(self.backend.statements(relation='RO:3'))[0]
+        self.assertEqual(statement['subject']['id'], 'CHEBI:15365')
+        self.assertEqual(statement['edge_label'], 'treats')
+
+    def test_exact_matches(self):
+        matches = list(self.backend.exact_matches(['NCBIGene:1', 'HGNC:2', 'NO:1']))
+
+        self.assertEqual([(m['input_id'], m['match_id']) for m in matches], [('NCBIGene:1', 'HGNC:1'), ('HGNC:2', 'HGNC:2')])
+
+    def test_concept_details(self):
+        details = list(self.backend.concept_details('hgnc:2'))
+
+        self.assertEqual(self.ids(details, 'id'), ['HGNC:2'])
+        self.assertEqual(details[0]['synonyms'], ['tumor protein p53'])
+        self.assertEqual(list(self.backend.concept_details('NO:1')), [])
+
+    def test_statement_details(self):
+        details = list(self.backend.statement_details('E:1'))
+
+        self.assertEqual(details[0]['relation']['publications'], ['PMID:1', 'PMID:2'])
+        self.assertEqual(details[0]['object']['id'], 'HGNC:2')
+        self.assertEqual(list(self.backend.statement_details('HGNC:2:causes:MONDO:2'))[0]['relation']['id'], 'E:3')
+        self.assertEqual(list(self.backend.statement_details('NO:1')), [])
+
+
+class TestBackend(unittest.TestCase):
+
+    def test_abstract_methods(self):
+        class Incomplete(Backend):
+            def concepts(self, keywords=None, categories=None, offset=None, size=None):
+                return []
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_async_in_thread(self):
+        threads = []
+
+        class Blocking(MemoryBackend):
+            def concepts(self, *args, **kwargs):
+                threads.append(threading.current_thread())
+                return super().concepts(*args, **kwargs)
+
+        backend = Blocking.load(NODES, EDGES)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        records = loop.run_until_complete(backend.async_concepts(categories=['protein']))
+
+        self.assertEqual([record[0] for record in records], ['HGNC:2'])
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
@@ -0,0 +1,321 @@
+import time
+import threading
+import unittest
+
+from neo4j import READ_ACCESS
+from neo4j.exceptions import ServiceUnavailable, TransientError
+
+from beacon_controller.database.connection import Database, Endpoint, Router, HedgeBudget, LatencyWindow, HEDGE_MIN_SAMPLES
+
+
+class FakeCluster(object):
+    """
+    Stands in for the Neo4j instances behind a Database. Every instance answers
+    a query with a single record naming itself, unless it is down. The first
+    run of a query whose parameters ask for it to be slow blocks until it is
+    terminated.
+    """
+    def __init__(self):
+        self.down = set()
+        self.drivers = []
+        self.sessions = []
+        self.transactions = {}
+        self.terminated = []
+        self.slow_started = threading.Event()
+        self.lock = threading.Lock()
+
+    def driver(self, uri, auth=None, **pool):
+        driver = FakeDriver(self, uri, pool)
+        self.drivers.append(driver)
+        return driver
+
+    def run(self, uri, query, parameters):
+        if uri in self.down:
+            raise ServiceUnavailable('{} is down'.format(uri))
+
+        text = getattr(query, 'text', query)
+        if text.startswith('SHOW TRANSACTIONS'):
+            return [dict(transactionId=t) for t, (u, tag, _) in self.transactions.items() if u == uri and tag == parameters['tag']]
+        if text.startswith('TERMINATE TRANSACTIONS'):
+            for t in parameters['ids']:
+                self.terminated.append(t)
+                self.transactions[t][2].set()
+            return FakeResult([])
+
+        return FakeResult(self.records(uri, query, parameters))
+
+    def records(self, uri, query, parameters):
+        if parameters.get('slow') and not self.slow_started.is_set():
+            self.slow_started.set()
+            terminated = threading.Event()
+            metadata = getattr(query, 'metadata', None) or {}
+            with self.lock:
+                t = len(self.transactions)
+                self.transactions[t] = (uri, metadata.get('hedge'), terminated)
+            if terminated.wait(10):
+                raise TransientError('Terminated')
+        yield dict(uri=uri)
+
+
+class FakeResult(list):
+    def single(self):
+        return self[0]
+
+    def consume(self):
+        return None
+
+
+class FakeDriver(object):
+    def __init__(self, cluster, uri, pool):
+        self.cluster = cluster
+        self.uri = uri
+        self.pool = pool
+        self.closed = False
+
+    def session(self, **config):
+        session = FakeSession(self.cluster, self.uri, config)
+        self.cluster.sessions.append(session)
+        return session
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession(object):
+    def __init__(self, cluster, uri, config):
+        self.cluster = cluster
+        self.uri = uri
+        self.config = config
+        self.timeout = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def run(self, query, parameters=None):
+        return self.cluster.run(self.uri, query, parameters or {})
+
+    def execute_read(self, work):
+        self.timeout = getattr(work, 'timeout', None)
+        return work(self)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('Timed out')
+        time.sleep(0.01)
+
+
+class TestDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster = FakeCluster()
+
+    def database(self, uris=('bolt://a', 'bolt://b'), **kwargs):
+        return Database(list(uris), auth=None, driver_factory=self.cluster.driver, **kwargs)
+
+    def answered_by(self, records):
+        return [record['uri'] for record in records]
+
+    def test_run(self):
+        db = self.database(uris=['bolt://a'], pool=dict(max_connection_pool_size=10))
+
+        self.assertEqual(self.answered_by(db.run('q', {})), ['bolt://a'])
+        self.assertEqual(self.cluster.drivers[0].pool, dict(max_connection_pool_size=10))
+        self.assertEqual(self.cluster.sessions[0].config['default_access_mode'], READ_ACCESS)
+
+    def test_timeouts(self):
+        db = self.database(uris=['bolt://a'], timeouts=dict(default=60, statements=10, summaries=0))
+
+        self.assertEqual(db.timeout('statements'), 10)
+        self.assertEqual(db.timeout('concepts'), 60)
+        self.assertIsNone(db.timeout('summaries'))
+
+        db.run('q', {}, endpoint='statements')
+        db.run('q', {}, endpoint='summaries')
+        self.assertEqual([s.timeout for s in self.cluster.sessions], [10, None])
+
+    def test_failover(self):
+        db = self.database()
+        self.cluster.down.add('bolt://a')
+
+        self.assertEqual(self.answered_by(db.run('q', {})), ['bolt://b'])
+        self.assertEqual(self.answered_by(db.run('q', {})), ['bolt://b'])
+
+        stats = db.stats()
+        self.assertFalse(stats['bolt://a']['available'])
+        self.assertEqual(stats['bolt://a']['errors'], 1)
+        self.assertEqual(stats['bolt://a']['ejections'], 1)
+        self.assertEqual(stats['bolt://b']['queries'], 2)
+
+    def test_failover_skips_driver_retries(self):
+        db = self.database(failover_retry_time=0.5)
+        self.cluster.down.add('bolt://a')
+        db.router.endpoints[1].latency = 1
+
+        db.run('q', {})
+
+        first, last = self.cluster.sessions
+        self.assertEqual(first.uri, 'bolt://a')
+        self.assertEqual(first.config['max_transaction_retry_time'], 0.5)
+        self.assertNotIn('max_transaction_retry_time', last.config)
+
+    def test_every_instance_down(self):
+        db = self.database()
+        self.cluster.down.update(['bolt://a', 'bolt://b'])
+
+        with self.assertRaises(ServiceUnavailable):
+            db.run('q', {})
+        self.assertEqual([s.uri for s in self.cluster.sessions], ['bolt://a', 'bolt://b'])
+
+    def test_ejected_instance_comes_back(self):
+        db = self.database(backoff=0.05)
+        self.cluster.down.add('bolt://a')
+        db.run('q', {})
+        self.cluster.down.clear()
+
+        self.assertEqual(self.answered_by(db.run('q', {})), ['bolt://b'])
+        time.sleep(0.1)
+        self.assertEqual(self.answered_by(db.run('q', {})), ['bolt://a'])
+
+    def test_ping(self):
+        db = self.database()
+        a, b = db.router.endpoints
+        self.cluster.down.add('bolt://a')
+
+        self.assertTrue(db.ping())
+        self.assertFalse(a.available())
+        self.assertTrue(b.available())
+
+        # Failing again while ejected replaces the driver
+        driver = a.driver
+        a.ejected_until = 1
+        db.ping()
+        self.assertTrue(driver.closed)
+        self.assertIsNot(a.driver, driver)
+
+        self.cluster.down.clear()
+        self.assertTrue(db.ping())
+        self.assertTrue(a.available())
+
+        self.cluster.down.update(['bolt://a', 'bolt://b'])
+        self.assertFalse(db.ping())
+        self.assertFalse(db.healthy)
+
+    def test_close(self):
+        db = self.database()
+        db.close()
+
+        self.assertTrue(all(driver.closed for driver in self.cluster.drivers))
+
+    def test_stream(self):
+        db = self.database(uris=['bolt://a'])
+
+        self.assertEqual(self.answered_by(db.stream('q', {})), ['bolt://a'])
+        self.assertEqual(db.stats()['bolt://a']['queries'], 1)
+
+    def test_hedging(self):
+        db = self.database(hedge=['statements'], hedge_budget=0.5)
+        for i in range(HEDGE_MIN_SAMPLES):
+            db.run('q', {}, endpoint='statements')
+
+        records = db.run('q', dict(slow=True), endpoint='statements')
+
+        slow_uri = self.cluster.transactions[0][0]
+        self.assertNotEqual(self.answered_by(records), [slow_uri])
+        wait_for(lambda: db.stats()[slow_uri]['cancelled'] == 1)
+        self.assertEqual(self.cluster.terminated, [0])
+        self.assertEqual(sum(s['hedges'] for s in db.stats().values()), 1)
+        self.assertEqual(sum(s['errors'] for s in db.stats().values()), 0)
+        self.assertTrue(all(s['available'] for s in db.stats().values()))
+
+    def test_no_hedging_with_one_instance(self):
+        db = self.database(uris=['bolt://a'], hedge=['statements'])
+
+        self.assertFalse(db.hedged('statements'))
+
+    def test_hedged_query_fails_over(self):
+        db = self.database(hedge=['statements'])
+        self.cluster.down.add('bolt://a')
+
+        self.assertEqual(self.answered_by(db.run('q', {}, endpoint='statements')), ['bolt://b'])
+        self.assertEqual(self.answered_by(db.run('q', {}, endpoint='statements')), ['bolt://b'])
+        self.assertEqual(db.stats()['bolt://a']['ejections'], 1)
+
+    def test_latency_of_every_query(self):
+        db = self.database(hedge=['statements'])
+        for i in range(5):
+            db.run('q', {}, endpoint='statements')
+
+        self.assertEqual(len(db.latencies['statements'].latencies), 5)
+
+
+class TestEndpoint(unittest.TestCase):
+
+    def test_backoff(self):
+        e = Endpoint('bolt://a', None, backoff=1, max_backoff=3)
+
+        e.eject()
+        self.assertFalse(e.available())
+        self.assertEqual(e.backoff, 2)
+        # Failures while ejected do not extend the ejection
+        e.eject()
+        self.assertEqual(e.ejections, 1)
+
+        e.ejected_until = 0
+        e.eject()
+        e.ejected_until = 0
+        e.eject()
+        self.assertEqual(e.backoff, 3)
+
+        e.readmit()
+        self.assertTrue(e.available())
+        self.assertEqual(e.backoff, 1)
+
+    def test_choose(self):
+        a, b, c = [Endpoint(uri, None) for uri in ['bolt://a', 'bolt://b', 'bolt://c']]
+        router = Router([a, b, c])
+
+        a.in_flight = 2
+        b.latency = 0.2
+        c.latency = 0.1
+        self.assertIs(router.choose(), c)
+        self.assertIs(router.choose(exclude=[c]), b)
+
+        b.eject()
+        c.eject()
+        self.assertIs(router.choose(exclude=[a]), b)
+
+
+class TestHedgeBudget(unittest.TestCase):
+
+    def test_spend(self):
+        budget = HedgeBudget(ratio=0.25, burst=2)
+        self.assertFalse(budget.spend())
+
+        for i in range(4):
+            budget.earn()
+        self.assertTrue(budget.spend())
+        self.assertFalse(budget.spend())
+
+        for i in range(100):
+            budget.earn()
+        self.assertEqual(budget.tokens, 2)
+
+
+class TestLatencyWindow(unittest.TestCase):
+
+    def test_percentile(self):
+        window = LatencyWindow(size=100)
+        for i in range(HEDGE_MIN_SAMPLES - 1):
+            window.add(i)
+        self.assertIsNone(window.percentile(0.5))
+
+        for i in range(200):
+            window.add(i)
+        self.assertEqual(window.percentile(0.5), 150)
+        self.assertEqual(window.percentile(1), 199)
@@ -0,0 +1,148 @@
+import gzip
+import time
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from beacon_controller.controllers import metadata_controller
+from beacon_controller.controllers.metadata_controller import accepts_gzip, etag_matches, respond
+
+
+class Serialized(object):
+    """
+    Stands in for a SerializedResponse
+    """
+    def __init__(self, body:bytes):
+        self.body = body
+        self.gzipped = gzip.compress(body)
+        self.etag = 'abc'
+
+
+class TestHeaders(unittest.TestCase):
+
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip('gzip'))
+        self.assertTrue(accepts_gzip('deflate, GZIP;q=0.5'))
+        self.assertTrue(accepts_gzip('*'))
+        self.assertTrue(accepts_gzip('identity, *;q=0.1'))
+        self.assertFalse(accepts_gzip('gzip;q=0'))
+        self.assertFalse(accepts_gzip('gzip;q=0, *'))
+        self.assertFalse(accepts_gzip('deflate'))
+        self.assertFalse(accepts_gzip(''))
+
+    def test_etag_matches(self):
+        self.assertTrue(etag_matches('abc', '"abc"'))
+        self.assertTrue(etag_matches('abc', 'W/"abc"'))
+        self.assertTrue(etag_matches('abc', '"xyz", W/"abc"'))
+        self.assertTrue(etag_matches('abc', '*'))
+        self.assertFalse(etag_matches('abc', '"abc-gzip"'))
+        self.assertFalse(etag_matches('abc', '"xyz", "ab"'))
+        self.assertFalse(etag_matches('abc', ''))
+
+
+class TestRespond(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.serialized = Serialized(b'[{"id": "HGNC:1"}]')
+
+    def respond(self, **headers):
+        with self.app.test_request_context(headers=headers):
+            return respond(self.serialized)
+
+    def test_identity(self):
+        response = self.respond()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), self.serialized.body)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.headers['ETag'], '"abc"')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.mimetype, 'application/json')
+
+    def test_gzip(self):
+        response = self.respond(**{'Accept-Encoding': 'gzip, deflate'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.get_data()), self.serialized.body)
+        self.assertEqual(response.headers['ETag'], '"abc-gzip"')
+
+    def test_gzip_refused(self):
+        response = self.respond(**{'Accept-Encoding': 'gzip;q=0, *'})
+
+        self.assertEqual(response.get_data(), self.serialized.body)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_not_modified(self):
+        response = self.respond(**{'If-None-Match': '"xyz", W/"abc"'})
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['ETag'], '"abc"')
+
+    def test_not_modified_gzip(self):
+        # The gzipped and identity encodings have different ETags
+        response = self.respond(**{'Accept-Encoding': 'gzip', 'If-None-Match': '"abc"'})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.respond(**{'Accept-Encoding': 'gzip', 'If-None-Match': '"abc-gzip"'})
+        self.assertEqual(response.status_code, 304)
+
+
+
+class Snapshot(object):
+    """
+    Stands in for a MetadataSnapshot, without reading any summary file
+    """
+    def __init__(self):
+        self.created = time.monotonic()
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(metadata_controller, 'MetadataSnapshot', Snapshot),
+            mock.patch.object(metadata_controller, '_snapshot', None),
+            mock.patch.object(metadata_controller, 'snapshot_max_age', 100),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_cached(self):
+        first = metadata_controller.snapshot()
+
+        self.assertIs(metadata_controller.snapshot(), first)
+
+    def test_max_age(self):
+        first = metadata_controller.snapshot()
+        first.created -= 100
+
+        second = metadata_controller.snapshot()
+
+        self.assertIsNot(second, first)
+        self.assertIs(metadata_controller.snapshot(), second)
+
+    def test_no_max_age(self):
+        metadata_controller.snapshot_max_age = 0
+        first = metadata_controller.snapshot()
+        first.created -= 10 ** 9
+
+        self.assertIs(metadata_controller.snapshot(), first)
+
+    def test_expired_while_rebuilding(self):
+        first = metadata_controller.snapshot()
+        first.created -= 100
+
+        # Another request is rebuilding the snapshot
+        with metadata_controller._snapshot_lock:
+            self.assertIs(metadata_controller.snapshot(), first)
+
+    def test_reload(self):
+        first = metadata_controller.snapshot()
+        metadata_controller.reload_snapshot()
+
+        self.assertIsNot(metadata_controller.snapshot(), first)
@@ -0,0 +1,113 @@
+import unittest
+
+from beacon_controller import metrics
+from beacon_controller.metrics import QueryMetrics, shape
+
+
+class TestShape(unittest.TestCase):
+
+    def test_literals(self):
+        key, text = shape("MATCH (n) WHERE n.id = 'CHEBI:1' RETURN n SKIP 10 LIMIT 20")
+
+        self.assertEqual(text, 'MATCH (n) WHERE n.id = ? RETURN n SKIP ? LIMIT ?')
+        self.assertEqual(len(key), 12)
+
+    def test_same_shape(self):
+        first = shape("MATCH (n)\n  WHERE n.name = \"a \\\" b\"\n RETURN n LIMIT 1")
+        second = shape("MATCH (n) WHERE n.name = 'c' RETURN n LIMIT 2.5")
+
+        self.assertEqual(first, second)
+
+    def test_different_shape(self):
+        self.assertNotEqual(shape('MATCH (n) RETURN n')[0], shape('MATCH (n) RETURN n.id')[0])
+
+    def test_identifiers(self):
+        self.assertEqual(shape('MATCH (n1:Gene) RETURN n1')[1], 'MATCH (n1:Gene) RETURN n1')
+
+
+class TestSize(unittest.TestCase):
+
+    def test_size(self):
+        self.assertEqual(metrics.size('abc'), 3)
+        self.assertEqual(metrics.size(['ab', 1, None]), 10)
+        self.assertEqual(metrics.size({'id': 'ab', 'score': 1.5}), 2 + 2 + 5 + 8)
+
+    def test_estimate_size(self):
+        records = [{'id': 'abcd'}] * (metrics.SIZE_SAMPLE * 3)
+
+        self.assertEqual(metrics.estimate_size(records), 6 * len(records))
+        self.assertEqual(metrics.estimate_size([]), 0)
+
+    def test_labels(self):
+        self.assertEqual(metrics.labels(a='x', b='say "hi"\n'), '{a="x",b="say \\"hi\\"\\n"}')
+
+
+class TestQueryMetrics(unittest.TestCase):
+
+    def test_render(self):
+        m = QueryMetrics()
+        q = "MATCH (n) WHERE n.id = 'X:1' RETURN n"
+        m.observe('concepts', q, 0.003, rows=2, decoded=100)
+        m.observe('concepts', q.replace('X:1', 'X:2'), 0.2, rows=3, decoded=50)
+        m.observe('concepts', q, 60, error=ValueError())
+        key, text = shape(q)
+
+        lines = m.render()
+
+        series = 'endpoint="concepts",shape="{}"'.format(key)
+        self.assertIn('beacon_query_duration_seconds_bucket{%s,le="0.001"} 0' % series, lines)
+        self.assertIn('beacon_query_duration_seconds_bucket{%s,le="0.005"} 1' % series, lines)
+        self.assertIn('beacon_query_duration_seconds_bucket{%s,le="0.25"} 2' % series, lines)
+        self.assertIn('beacon_query_duration_seconds_bucket{%s,le="30"} 2' % series, lines)
+        self.assertIn('beacon_query_duration_seconds_bucket{%s,le="+Inf"} 3' % series, lines)
+        self.assertIn('beacon_query_duration_seconds_count{%s} 3' % series, lines)
+        self.assertIn('beacon_query_rows_total{%s} 5' % series, lines)
+        self.assertIn('beacon_query_decoded_bytes_total{%s} 150' % series, lines)
+        self.assertIn('beacon_query_errors_total{%s,error="ValueError"} 1' % series, lines)
+        self.assertIn('beacon_query_shape_info{shape="%s",query="%s"} 1' % (key, text), lines)
+
+        total = [line for line in lines if line.startswith('beacon_query_duration_seconds_sum')]
+        self.assertEqual(len(total), 1)
+        self.assertAlmostEqual(float(total[0].split()[-1]), 60.203)
+
+    def test_endpoints(self):
+        m = QueryMetrics()
+        m.observe('concepts', 'MATCH (n) RETURN n', 0.1)
+        m.observe('statements', 'MATCH (n) RETURN n', 0.1)
+
+        counts = [line for line in m.render() if line.startswith('beacon_query_duration_seconds_count')]
+
+        self.assertEqual(len(counts), 2)
+
+    def test_max_shapes(self):
+        m = QueryMetrics(max_shapes=2)
+        for label in ['A', 'B', 'C', 'D']:
+            m.observe('concepts', 'MATCH (n:{}) RETURN n'.format(label), 0.1)
+
+        lines = m.render()
+
+        self.assertEqual(len(m.shapes), 2)
+        self.assertIn('beacon_query_duration_seconds_count{endpoint="concepts",shape="other"} 2', lines)
+        self.assertEqual(len([line for line in lines if line.startswith('beacon_query_shape_info')]), 2)
+
+    def test_empty(self):
+        lines = QueryMetrics().render()
+
+        self.assertTrue(all(line.startswith('#') for line in lines))
+
+
+class TestRender(unittest.TestCase):
+
+    def test_process(self):
+        text = '\n'.join(metrics.process_metrics())
+
+        self.assertIn('process_cpu_seconds_total', text)
+        self.assertIn('process_start_time_seconds {}'.format(metrics.start_time), text)
+        self.assertIn('python_info{implementation=', text)
+
+    def test_database(self):
+        lines = metrics.database_metrics({'bolt://a:7687': {'available': True, 'queries': 3}})
+
+        self.assertIn('beacon_database_available{uri="bolt://a:7687"} 1', lines)
+        self.assertIn('beacon_database_queries_total{uri="bolt://a:7687"} 3', lines)
+        self.assertIn('beacon_database_errors_total{uri="bolt://a:7687"} 0', lines)
@@ -0,0 +1,167 @@
+import unittest
+
+from beacon_controller.result_cache import ResultCache, ENDPOINTS, CONCEPTS, STATEMENTS, EXACT_MATCHES, MAX_ENTRY_SHARE
+from beacon_controller.result_cache import concepts_key, statements_key, exact_matches_key
+
+
+class Backend(object):
+    """
+    Records the calls made to it, and finds a few small records for each
+    """
+    def __init__(self):
+        self.calls = []
+
+    def find(self, *args):
+        self.calls.append(args)
+        return (dict(id=i, name='concept') for i in range(3))
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestKeys(unittest.TestCase):
+
+    def test_concepts_key(self):
+        self.assertEqual(
+            concepts_key(['Kinase', 'ALPHA'], ['gene'], 0, 10),
+            concepts_key(['kinase', 'alpha'], ['gene'], 0, 10)
+        )
+        # The order of keywords decides the order of the records
+        self.assertNotEqual(concepts_key(['kinase', 'alpha']), concepts_key(['alpha', 'kinase']))
+        # Categories are matched against Neo4j labels, which are case sensitive
+        self.assertNotEqual(concepts_key(None, ['gene']), concepts_key(None, ['Gene']))
+        self.assertNotEqual(concepts_key(['a'], None, 0, 10), concepts_key(['a'], None, 10, 10))
+
+    def test_statements_key(self):
+        self.assertEqual(
+            statements_key(['HGNC:1'], ['TP53'], ['Gene'], 'causes', 'RO:1', ['MONDO:1'], ['Cancer'], ['Disease']),
+            statements_key(['hgnc:1'], ['tp53'], ['gene'], 'causes', 'RO:1', ['mondo:1'], ['cancer'], ['disease'])
+        )
+        self.assertNotEqual(statements_key(['HGNC:1', 'HGNC:2']), statements_key(['HGNC:2', 'HGNC:1']))
+        self.assertNotEqual(statements_key(edge_label='causes'), statements_key(edge_label='Causes'))
+
+    def test_exact_matches_key(self):
+        self.assertEqual(exact_matches_key(['HGNC:2', 'HGNC:1', 'HGNC:2']), exact_matches_key(['HGNC:1', 'HGNC:2']))
+        self.assertNotEqual(exact_matches_key(['HGNC:1']), exact_matches_key(['hgnc:1']))
+
+    def test_keys_are_hashable(self):
+        hash(concepts_key(['a'], ['gene'], 0, 10))
+        hash(statements_key(['HGNC:1'], ['a'], ['gene'], None, None, ['HGNC:2'], ['b'], ['gene'], 0, 10))
+        hash(exact_matches_key(['HGNC:1']))
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = Backend()
+        self.clock = Clock()
+
+    def cache(self, max_bytes=100000, ttl=10, endpoints=ENDPOINTS):
+        return ResultCache(max_bytes, ttl, endpoints, clock=self.clock)
+
+    def test_hit(self):
+        cache = self.cache()
+
+        first = cache.cached(CONCEPTS, concepts_key(['Kinase']), lambda: self.backend.find(['Kinase']))
+        second = cache.cached(CONCEPTS, concepts_key(['kinase']), lambda: self.backend.find(['kinase']))
+
+        self.assertEqual(len(first), 3)
+        self.assertIs(first, second)
+        # The backend is queried with the caller's own parameters
+        self.assertEqual(self.backend.calls, [(['Kinase'],)])
+        stats = cache.stats()[CONCEPTS]
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_expiry(self):
+        cache = self.cache(ttl=10)
+        cache.cached(CONCEPTS, ('a',), lambda: self.backend.find('a'))
+
+        self.clock.now = 9
+        cache.cached(CONCEPTS, ('a',), lambda: self.backend.find('a'))
+        self.assertEqual(len(self.backend.calls), 1)
+
+        self.clock.now = 10
+        cache.cached(CONCEPTS, ('a',), lambda: self.backend.find('a'))
+        self.assertEqual(len(self.backend.calls), 2)
+        self.assertEqual(cache.stats()[CONCEPTS]['expirations'], 1)
+
+    def test_no_expiry(self):
+        cache = self.cache(ttl=0)
+        cache.cached(CONCEPTS, ('a',), lambda: self.backend.find('a'))
+
+        self.clock.now = 10 ** 9
+        cache.cached(CONCEPTS, ('a',), lambda: self.backend.find('a'))
+        self.assertEqual(len(self.backend.calls), 1)
+
+    def test_eviction(self):
+        cache = self.cache(max_bytes=20000, ttl=0)
+        for i in range(30):
+            cache.cached(STATEMENTS, (i,), lambda: self.backend.find(i))
+            # Keep the first entry recently used
+            cache.cached(STATEMENTS, (0,), lambda: self.backend.find(0))
+
+        self.assertLessEqual(cache.bytes, 20000)
+        self.assertGreater(cache.stats()[STATEMENTS]['evictions'], 0)
+        self.assertTrue(cache.lookup(STATEMENTS, (0,))[0])
+        self.assertFalse(cache.lookup(STATEMENTS, (1,))[0])
+
+    def test_large_results_are_not_stored(self):
+        cache = self.cache(max_bytes=20000)
+        records = cache.cached(CONCEPTS, ('a',), lambda: [dict(name='x' * int(MAX_ENTRY_SHARE * 20000))])
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(cache.stats()[CONCEPTS]['entries'], 0)
+
+    def test_endpoint_not_cached(self):
+        cache = self.cache(endpoints=[CONCEPTS])
+        records = self.backend.find()
+
+        # The records are streamed as the backend returns them
+        self.assertIs(cache.cached(EXACT_MATCHES, ('a',), lambda: records), records)
+        self.assertEqual(cache.stats()[EXACT_MATCHES]['entries'], 0)
+        self.assertEqual(cache.flights.counters, {})
+
+    def test_disabled(self):
+        cache = self.cache(max_bytes=0)
+
+        self.assertFalse(any(cache.enabled(endpoint) for endpoint in ENDPOINTS))
+
+    def test_clear(self):
+        cache = self.cache()
+        cache.cached(CONCEPTS, ('a',), lambda: self.backend.find('a'))
+        cache.cached(STATEMENTS, ('a',), lambda: self.backend.find('a'))
+
+        cache.clear()
+        self.assertEqual(cache.bytes, 0)
+        self.assertEqual(sum(s['entries'] for s in cache.stats().values()), 0)
+
+    def test_async_cached(self):
+        import asyncio
+
+        cache = self.cache()
+
+        async def find(*args):
+            return list(self.backend.find(*args))
+
+        async def requests():
+            return await asyncio.gather(*[cache.async_cached(STATEMENTS, ('a',), lambda: find('a')) for i in range(3)])
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(requests())
+        finally:
+            loop.close()
+
+        self.assertEqual(len(self.backend.calls), 1)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    def test_render(self):
+        cache = self.cache()
+        cache.cached(CONCEPTS, ('a',), lambda: self.backend.find('a'))
+
+        self.assertIn('beacon_result_cache_misses_total{endpoint="concepts"} 1', cache.render())
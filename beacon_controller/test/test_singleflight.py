@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from beacon_controller import singleflight
+from beacon_controller.singleflight import SingleFlight
+
+
+class Call(object):
+    """
+    A call that blocks until it is released, counting how often it ran
+    """
+    def __init__(self, result='result', error=None):
+        self.result = result
+        self.error = error
+        self.runs = 0
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def __call__(self):
+        self.runs += 1
+        self.started.set()
+        self.released.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def callers(self, flight, call, n, key='key'):
+        """
+        Runs `n` identical calls at once, returning their futures once all of
+        them are waiting for the first
+        """
+        executor = ThreadPoolExecutor(n)
+        self.addCleanup(executor.shutdown)
+        leader = executor.submit(flight.do, key, call, 'label')
+        call.started.wait(5)
+        followers = [executor.submit(flight.do, key, call, 'label') for i in range(n - 1)]
+        while flight.counters['label'].coalesced < n - 1:
+            threading.Event().wait(0.001)
+        return [leader] + followers
+
+    def test_coalesce(self):
+        flight = SingleFlight('test')
+        call = Call()
+
+        futures = self.callers(flight, call, 5)
+        call.released.set()
+
+        self.assertEqual([f.result(5) for f in futures], ['result'] * 5)
+        self.assertEqual(call.runs, 1)
+        self.assertEqual(flight.counters['label'].executions, 1)
+        self.assertEqual(flight.counters['label'].coalesced, 4)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_error(self):
+        flight = SingleFlight('test')
+        call = Call(error=ValueError('failed'))
+
+        futures = self.callers(flight, call, 3)
+        call.released.set()
+
+        for future in futures:
+            with self.assertRaises(ValueError):
+                future.result(5)
+
+        # Results and errors are not kept once the call has finished
+        self.assertEqual(flight.do('key', lambda: 'again'), 'again')
+
+    def test_different_keys(self):
+        flight = SingleFlight('test')
+
+        self.assertEqual(flight.do('a', lambda: 1), 1)
+        self.assertEqual(flight.do('b', lambda: 2), 2)
+        self.assertEqual(flight.counters[None].executions, 2)
+
+    def test_timeout(self):
+        flight = SingleFlight('test', timeout=0.05)
+        call = Call()
+        futures = self.callers(flight, call, 2)
+
+        with self.assertRaises(TimeoutError):
+            futures[1].result(5)
+        call.released.set()
+
+        self.assertEqual(futures[0].result(5), 'result')
+        self.assertEqual(flight.counters['label'].timeouts, 1)
+
+    def test_async(self):
+        flight = SingleFlight('test')
+        runs = []
+
+        async def call():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return 'result'
+
+        async def callers():
+            return await asyncio.gather(*[flight.async_do('key', call, 'label') for i in range(5)])
+
+        self.assertEqual(run(callers()), ['result'] * 5)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(flight.counters['label'].coalesced, 4)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_async_leader_cancelled(self):
+        flight = SingleFlight('test')
+
+        async def call():
+            await asyncio.sleep(0.01)
+            return 'result'
+
+        async def callers():
+            leader = asyncio.ensure_future(flight.async_do('key', call))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.async_do('key', call))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        # The call carries on for the others when its first caller gives up
+        self.assertEqual(run(callers()), 'result')
+
+    def test_async_timeout(self):
+        flight = SingleFlight('test', timeout=0.01)
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return 'result'
+
+        async def callers():
+            leader = asyncio.ensure_future(flight.async_do('key', call))
+            await asyncio.sleep(0)
+            with self.assertRaises(TimeoutError):
+                await flight.async_do('key', call)
+            return await leader
+
+        self.assertEqual(run(callers()), 'result')
+        self.assertEqual(flight.counters[None].timeouts, 1)
+
+    def test_render(self):
+        flight = SingleFlight('rendered')
+        flight.do('key', lambda: None, 'label')
+
+        lines = singleflight.render()
+        self.assertIn('beacon_single_flight_executions_total{flight="rendered",label="label"} 1', lines)
+        self.assertIn('beacon_single_flight_in_flight{flight="rendered"} 0', lines)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
@@ -0,0 +1,178 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from beacon_controller import metrics
+from beacon_controller.database import slow_log
+from beacon_controller.database.slow_log import SlowQueryLog
+
+Q = "MATCH (n) WHERE n.id IN $ids RETURN n LIMIT 10"
+
+PLAN = {
+    'operatorType': 'ProduceResults',
+    'dbHits': 0,
+    'rows': 2,
+    'identifiers': ['n'],
+    'children': [{
+        'operatorType': 'NodeByLabelScan',
+        'dbHits': 101,
+        'rows': 100,
+        'args': {'Details': 'n:gene'},
+    }],
+}
+
+
+class TestSlowQueryLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'slow_queries.jsonl')
+        self.profiled = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def profiler(self, q, parameters, endpoint):
+        self.profiled.append((q, parameters, endpoint))
+        if endpoint == 'broken':
+            raise ValueError('Profile failed')
+        return PLAN
+
+    def entries(self, log):
+        if log._executor is not None:
+            log._executor.shutdown(wait=True)
+        if not os.path.exists(self.path):
+            return []
+        return slow_log.read([self.path])
+
+    def test_threshold(self):
+        log = SlowQueryLog(self.path, threshold=1, profile_rate=0)
+        log.observe('concepts', Q, {'ids': ['X:1']}, 0.5)
+        log.observe('concepts', Q, {'ids': ['X:1']}, 1.5, rows=2)
+
+        entries = self.entries(log)
+
+        self.assertEqual(len(entries), 1)
+        entry = entries[0]
+        self.assertEqual(entry['type'], slow_log.QUERY)
+        self.assertEqual(entry['shape'], metrics.shape(Q)[0])
+        self.assertEqual(entry['query'], Q)
+        self.assertEqual(entry['parameters'], {'ids': ['X:1']})
+        self.assertEqual(entry['seconds'], 1.5)
+        self.assertEqual(entry['rows'], 2)
+        self.assertIsNone(entry['error'])
+
+    def test_no_path(self):
+        log = SlowQueryLog(None, threshold=0, profile_rate=1, profiler=self.profiler)
+        log.observe('concepts', Q, {}, 10)
+
+        self.assertEqual(self.entries(log), [])
+        self.assertEqual(self.profiled, [])
+
+    def test_error(self):
+        log = SlowQueryLog(self.path, threshold=0)
+        log.observe('concepts', Q, {}, 2, error=ValueError('Bad query'))
+
+        self.assertEqual(self.entries(log)[0]['error'], "ValueError('Bad query')")
+
+    def test_truncate(self):
+        log = SlowQueryLog(self.path, threshold=0, parameter_length=3)
+        log.observe('concepts', Q, {'ids': ['abcdef'] * 25, 'limit': 10}, 2)
+
+        parameters = self.entries(log)[0]['parameters']
+
+        self.assertEqual(parameters['ids'], ['abc...'] * slow_log.MAX_ITEMS + ['... 5 more'])
+        self.assertEqual(parameters['limit'], 10)
+
+    def test_profile(self):
+        log = SlowQueryLog(self.path, threshold=0, profile_rate=1, profiler=self.profiler)
+        log.observe('statements', Q, {'ids': ['X:1']}, 2)
+        log.observe('statements', Q.replace('10', '20'), {'ids': ['X:2']}, 3)
+
+        entries = self.entries(log)
+
+        self.assertEqual(self.profiled, [(Q, {'ids': ['X:1']}, 'statements')])
+        profiles = [entry for entry in entries if entry['type'] == slow_log.PROFILE]
+        self.assertEqual(len(profiles), 1)
+        profile = profiles[0]
+        self.assertEqual(profile['shape'], metrics.shape(Q)[0])
+        self.assertEqual(profile['db_hits'], 101)
+        self.assertEqual(profile['rows'], 2)
+        self.assertEqual(profile['operators'], [
+            dict(operator='ProduceResults', depth=0, db_hits=0, rows=2, details='n'),
+            dict(operator='NodeByLabelScan', depth=1, db_hits=101, rows=100, details='n:gene'),
+        ])
+
+    def test_profile_rate(self):
+        log = SlowQueryLog(self.path, threshold=0, profile_rate=0, profiler=self.profiler)
+        log.observe('statements', Q, {}, 2)
+
+        self.assertEqual(len(self.entries(log)), 1)
+        self.assertEqual(self.profiled, [])
+
+    def test_profile_failed(self):
+        log = SlowQueryLog(self.path, threshold=0, profile_rate=1, profiler=self.profiler)
+        log.observe('broken', Q, {}, 2)
+
+        profile = self.entries(log)[1]
+
+        self.assertEqual(profile['type'], slow_log.PROFILE)
+        self.assertEqual(profile['error'], "ValueError('Profile failed')")
+        self.assertNotIn('operators', profile)
+
+    def test_read_malformed(self):
+        with open(self.path, 'w') as f:
+            f.write(json.dumps({'shape': 'a'}) + '\n{"shape": \n')
+
+        self.assertEqual(slow_log.read([self.path]), [{'shape': 'a'}])
+
+
+class TestReport(unittest.TestCase):
+
+    def entry(self, shape, seconds, endpoint='concepts', rows=10, error=None):
+        return dict(type=slow_log.QUERY, shape=shape, query='MATCH (n)\n RETURN n', endpoint=endpoint, seconds=seconds, rows=rows, error=error)
+
+    def test_summarize(self):
+        entries = [self.entry('a', s) for s in [1, 2, 3, 4]]
+        entries.append(self.entry('a', 10, endpoint='statements', rows=0, error='Timeout'))
+        entries.append(self.entry('b', 1.5))
+        entries.append(dict(type=slow_log.PROFILE, shape='a', db_hits=5, rows=1, operators=[]))
+        entries.append(dict(type=slow_log.PROFILE, shape='c', error='Failed'))
+
+        summaries = {s['shape']: s for s in slow_log.summarize(entries)}
+
+        self.assertEqual(set(summaries), {'a', 'b'})
+        a = summaries['a']
+        self.assertEqual(a['count'], 5)
+        self.assertEqual(a['errors'], 1)
+        self.assertEqual(a['endpoints'], ['concepts', 'statements'])
+        self.assertEqual(a['total'], 20)
+        self.assertEqual(a['p50'], 3)
+        self.assertEqual(a['p95'], 10)
+        self.assertEqual(a['max'], 10)
+        self.assertEqual(a['rows'], 8)
+        self.assertEqual(a['profile']['db_hits'], 5)
+        self.assertIsNone(summaries['b']['profile'])
+
+    def test_report(self):
+        profile = dict(type=slow_log.PROFILE, shape='a', db_hits=111, rows=1, operators=[
+            dict(operator='ProduceResults', depth=0, db_hits=1, rows=1, details='n'),
+            dict(operator='AllNodesScan', depth=1, db_hits=110, rows=50, details=None),
+        ])
+        entries = [self.entry('a', 1), self.entry('b', 5), self.entry('b', 1), profile]
+
+        text = slow_log.report(slow_log.summarize(entries), sort='max', top=1, operators=1)
+
+        self.assertTrue(text.startswith('b  concepts  count=2 errors=0 total=6.00s'))
+        self.assertNotIn('profile', text)
+
+        text = slow_log.report(slow_log.summarize(entries), sort='count', top=2, operators=1)
+        lines = text.splitlines()
+
+        self.assertTrue(lines[0].startswith('b '))
+        self.assertEqual(lines[1], '    MATCH (n) RETURN n')
+        self.assertIn('    profile: 111 db hits, 1 rows', lines)
+        self.assertIn('AllNodesScan', text)
+        self.assertNotIn('ProduceResults', text)
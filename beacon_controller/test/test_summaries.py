@@ -0,0 +1,294 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from beacon_controller import summaries
+from beacon_controller.biolink_model import DEFAULT_CATEGORY
+from beacon_controller.summaries import Summarizer, MemorySource, Batch, NODE, EDGE, NAMESPACE, PREFIX
+
+NODES = [
+    dict(id='HGNC:1', category=['gene'], xrefs=['NCBIGene:1']),
+    dict(id='HGNC:2', category=['gene'], xrefs=['NCBIGene:2', 'ENSEMBL:2']),
+    dict(id='MONDO:1', category=['disease']),
+    dict(id='X:1'),
+]
+
+EDGES = [
+    dict(subject='HGNC:1', object='MONDO:1', edge_label='causes', relation='RO:1', negated=False),
+    dict(subject='HGNC:2', object='MONDO:1', edge_label='causes', relation='RO:1', negated=False),
+    dict(subject='HGNC:1', object='HGNC:2', edge_label='interacts_with', relation='RO:2', negated=False),
+]
+
+# A batch loaded after the graph above
+BATCH_NODES = [
+    dict(id='HGNC:3', category=['gene'], provided_by='hgnc'),
+    dict(id='MONDO:2', category=['disease'], provided_by='hgnc'),
+]
+
+BATCH_EDGES = [
+    dict(subject='HGNC:3', object='MONDO:2', edge_label='causes', relation='RO:1', negated=False, provided_by='hgnc'),
+]
+
+
+class CountingSource(MemorySource):
+    """
+    A MemorySource that records which partitions it was asked to summarize
+    """
+    def __init__(self, nodes, edges):
+        super().__init__(nodes, edges)
+        self.calls = []
+
+    def node_summary(self, label, batch=None):
+        self.calls.append((NODE, label))
+        return super().node_summary(label, batch)
+
+    def edge_summary(self, edge_type, batch=None):
+        self.calls.append((EDGE, edge_type))
+        return super().edge_summary(edge_type, batch)
+
+
+def frequencies(path, *columns) -> dict:
+    return {tuple(row[c] for c in columns): row['frequency'] for row in summaries.read_summary(path)}
+
+
+class TestSummarizer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = CountingSource(NODES, EDGES)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, summary):
+        return os.path.join(self.directory, summaries.FILENAMES[summary])
+
+    def test_partitions(self):
+        partitions = Summarizer(self.source, self.directory).partitions([NODE, EDGE])
+
+        self.assertEqual([key for key, summary, argument in partitions], [
+            'node:disease', 'node:gene', 'node:None', 'edge:causes', 'edge:interacts_with'
+        ])
+
+    def test_run(self):
+        Summarizer(self.source, self.directory, workers=2).run()
+
+        self.assertEqual(frequencies(self.path(NODE), 'category', 'prefix'), {
+            ('gene', 'HGNC'): 2, ('disease', 'MONDO'): 1, (DEFAULT_CATEGORY, 'X'): 1
+        })
+        self.assertEqual(frequencies(self.path(EDGE), 'subject_category', 'edge_type', 'object_category'), {
+            ('gene', 'causes', 'disease'): 2, ('gene', 'interacts_with', 'gene'): 1
+        })
+        self.assertEqual(frequencies(self.path(NAMESPACE), 'local_prefix', 'clique_prefix'), {
+            ('HGNC', 'NCBIGene'): 2, ('HGNC', 'ENSEMBL'): 1
+        })
+        self.assertEqual(frequencies(self.path(PREFIX), 'prefix'), {('HGNC',): 2, ('MONDO',): 1, ('X',): 1})
+        self.assertFalse(os.path.exists(os.path.join(self.directory, summaries.CHECKPOINT_FILENAME)))
+
+    def test_resume_from_checkpoint(self):
+        checkpoint = {
+            'node:gene': [dict(category='gene', prefix='CHECKPOINTED', frequency=5)],
+            'edge:causes': [],
+        }
+        with open(os.path.join(self.directory, summaries.CHECKPOINT_FILENAME), 'w') as f:
+            json.dump(checkpoint, f)
+
+        Summarizer(self.source, self.directory).run([NODE, EDGE])
+
+        self.assertNotIn((NODE, 'gene'), self.source.calls)
+        self.assertNotIn((EDGE, 'causes'), self.source.calls)
+        self.assertIn((NODE, 'disease'), self.source.calls)
+        self.assertEqual(frequencies(self.path(NODE), 'category', 'prefix')[('gene', 'CHECKPOINTED')], 5)
+        self.assertEqual(list(frequencies(self.path(EDGE), 'edge_type')), [('interacts_with',)])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, summaries.CHECKPOINT_FILENAME)))
+
+    def test_restart_ignores_checkpoint(self):
+        with open(os.path.join(self.directory, summaries.CHECKPOINT_FILENAME), 'w') as f:
+            json.dump({'node:gene': []}, f)
+
+        Summarizer(self.source, self.directory).run([NODE], restart=True)
+
+        self.assertIn((NODE, 'gene'), self.source.calls)
+
+    def test_background_summarizer_leaves_checkpoint(self):
+        checkpoint_path = os.path.join(self.directory, summaries.CHECKPOINT_FILENAME)
+        with open(checkpoint_path, 'w') as f:
+            json.dump({'node:gene': []}, f)
+
+        Summarizer(self.source, self.directory, checkpoint=False).run([NODE])
+
+        self.assertIn((NODE, 'gene'), self.source.calls)
+        with open(checkpoint_path) as f:
+            self.assertEqual(json.load(f), {'node:gene': []})
+
+    def test_batch_delta(self):
+        Summarizer(self.source, self.directory).run([NODE, EDGE])
+
+        source = MemorySource(NODES + BATCH_NODES, EDGES + BATCH_EDGES)
+        batch = Batch(provided_by='hgnc')
+        Summarizer(source, self.directory, batch=batch).run([NODE, EDGE])
+
+        self.assertEqual(frequencies(self.path(NODE), 'category', 'prefix'), {
+            ('gene', 'HGNC'): 3, ('disease', 'MONDO'): 2, (DEFAULT_CATEGORY, 'X'): 1
+        })
+        self.assertEqual(frequencies(self.path(EDGE), 'subject_category', 'edge_type', 'object_category'), {
+            ('gene', 'causes', 'disease'): 3, ('gene', 'interacts_with', 'gene'): 1
+        })
+
+        # A batch is never applied twice
+        Summarizer(source, self.directory, batch=batch).run([NODE, EDGE])
+
+        self.assertEqual(frequencies(self.path(NODE), 'category', 'prefix')[('gene', 'HGNC')], 3)
+        batches = Summarizer(source, self.directory, batch=batch).load_batches()
+        self.assertEqual(sorted(batches[batch.id]['summaries']), [EDGE, NODE])
+
+    def test_pending_batch_that_was_applied(self):
+        # The run stopped after the new file replaced the old one, but before
+        # the batch was recorded as applied
+        Summarizer(self.source, self.directory).run([NODE])
+        source = MemorySource(NODES + BATCH_NODES, EDGES)
+        batch = Batch(provided_by='hgnc')
+        summarizer = Summarizer(source, self.directory, batch=batch)
+        summarizer.run([NODE])
+        summarizer.save_batches({batch.id: {'summaries': [], 'pending': {NODE: summaries.file_digest(self.path(NODE))}}})
+
+        Summarizer(source, self.directory, batch=batch).run([NODE])
+
+        self.assertEqual(frequencies(self.path(NODE), 'category', 'prefix')[('gene', 'HGNC')], 3)
+        self.assertEqual(summarizer.load_batches()[batch.id]['summaries'], [NODE])
+        self.assertNotIn('pending', summarizer.load_batches()[batch.id])
+
+    def test_pending_batch_that_was_not_applied(self):
+        # The run stopped before the new file replaced the old one
+        Summarizer(self.source, self.directory).run([NODE])
+        source = MemorySource(NODES + BATCH_NODES, EDGES)
+        batch = Batch(provided_by='hgnc')
+        summarizer = Summarizer(source, self.directory, batch=batch)
+        summarizer.save_batches({batch.id: {'summaries': [], 'pending': {NODE: 'digest of a file never written'}}})
+
+        summarizer.run([NODE])
+
+        self.assertEqual(frequencies(self.path(NODE), 'category', 'prefix')[('gene', 'HGNC')], 3)
+        self.assertEqual(summarizer.load_batches()[batch.id]['summaries'], [NODE])
+
+
+class TestEstimate(unittest.TestCase):
+
+    COLUMNS = ['category', 'prefix', 'frequency']
+
+    def test_wilson_interval(self):
+        lower, upper = summaries.wilson_interval(50, 100)
+
+        self.assertAlmostEqual(lower, 0.4038, places=4)
+        self.assertAlmostEqual(upper, 0.5962, places=4)
+        self.assertEqual(summaries.wilson_interval(0, 0), (0.0, 1.0))
+        self.assertEqual(summaries.wilson_interval(0, 10)[0], 0.0)
+        self.assertEqual(summaries.wilson_interval(10, 10)[1], 1.0)
+
+    def test_z_score(self):
+        self.assertAlmostEqual(summaries.z_score(0.95), 1.96, places=2)
+        self.assertAlmostEqual(summaries.z_score(0.99), 2.576, places=3)
+
+    def test_exact(self):
+        sample = [
+            [dict(category='gene', prefix='HGNC')],
+            [dict(category='gene', prefix='HGNC'), dict(category='protein', prefix='HGNC')],
+            [dict(category='disease', prefix='MONDO')],
+        ]
+
+        for total in [3, 2]:
+            rows = {(row['category'], row['prefix']): row for row in summaries.estimate_rows(sample, total, self.COLUMNS)}
+
+            self.assertEqual(rows[('gene', 'HGNC')], dict(
+                category='gene', prefix='HGNC', frequency=2, estimated=False, frequency_lower=2, frequency_upper=2
+            ))
+            self.assertEqual(rows[('protein', 'HGNC')]['frequency'], 1)
+            self.assertEqual(rows[('disease', 'MONDO')]['frequency'], 1)
+
+    def test_estimated(self):
+        sample = [[dict(category='gene', prefix='HGNC')]] * 25 + [[dict(category='disease', prefix='MONDO')]] * 75
+
+        rows = {row['category']: row for row in summaries.estimate_rows(sample, 1000, self.COLUMNS)}
+
+        gene = rows['gene']
+        self.assertTrue(gene['estimated'])
+        self.assertEqual(gene['frequency'], 250)
+        self.assertLess(gene['frequency_lower'], 250)
+        self.assertGreater(gene['frequency_upper'], 250)
+        lower, upper = summaries.wilson_interval(25, 100)
+        self.assertEqual(gene['frequency_lower'], int(lower * 1000))
+        self.assertEqual(gene['frequency_upper'], int(upper * 1000) + 1)
+        self.assertEqual(rows['disease']['frequency'], 750)
+
+    def test_duplicate_rows(self):
+        sample = [[dict(category='gene', prefix='HGNC'), dict(category='gene', prefix='HGNC')]]
+
+        rows = summaries.estimate_rows(sample, 1, self.COLUMNS)
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['frequency'], 1)
+
+    def test_empty_sample(self):
+        self.assertEqual(summaries.estimate_rows([], 1000, self.COLUMNS), [])
+        self.assertEqual(summaries.estimate_rows([], 0, self.COLUMNS), [])
+
+
+class TestGenerateInBackground(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.calls = 0
+        self.fail = True
+
+    def clock(self):
+        return self.now
+
+    def generator(self):
+        self.calls += 1
+        if self.fail:
+            raise IOError('Database is down')
+
+    def generate(self) -> bool:
+        started = summaries.generate_in_background(self.generator, clock=self.clock)
+        lock = getattr(summaries, '__generator_locks')[self.generator]
+        # Wait for the generator to finish
+        with lock:
+            pass
+        return started
+
+    def failures(self):
+        return getattr(summaries, '__generator_failures').get(self.generator, (0, None))
+
+    def test_backoff(self):
+        self.assertTrue(self.generate())
+        self.assertEqual(self.failures(), (1, summaries.GENERATOR_RETRY_BACKOFF))
+
+        self.now = summaries.GENERATOR_RETRY_BACKOFF - 1
+        self.assertFalse(self.generate())
+        self.assertEqual(self.calls, 1)
+
+        self.now = summaries.GENERATOR_RETRY_BACKOFF
+        self.assertTrue(self.generate())
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.failures(), (2, self.now + 2 * summaries.GENERATOR_RETRY_BACKOFF))
+
+    def test_max_backoff(self):
+        for i in range(12):
+            self.now = self.failures()[1] or 0
+            self.generate()
+
+        failures, retry_at = self.failures()
+        self.assertEqual(failures, 12)
+        self.assertEqual(retry_at - self.now, summaries.MAX_GENERATOR_RETRY_BACKOFF)
+
+    def test_success_clears_failures(self):
+        self.generate()
+        self.now = self.failures()[1]
+        self.fail = False
+        self.generate()
+
+        self.assertEqual(self.failures(), (0, None))
+        self.assertTrue(self.generate())
+        self.assertEqual(self.calls, 3)
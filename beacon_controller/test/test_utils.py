@@ -0,0 +1,54 @@
+import unittest
+from unittest import mock
+
+from beacon_controller import utils
+
+
+class TestStandardize(unittest.TestCase):
+
+    def setUp(self):
+        self.table = getattr(utils, '__category_table')
+        self.saved = dict(self.table)
+        self.table.clear()
+
+    def tearDown(self):
+        self.table.clear()
+        self.table.update(self.saved)
+
+    def test_normalize(self):
+        self.assertEqual(utils.standardize(['named_thing', 'gene']), ['named thing', 'gene'])
+        self.assertEqual(utils.standardize(('gene',)), ['gene'])
+        self.assertEqual(utils.standardize('chemical_substance'), ['chemical substance'])
+        self.assertEqual(utils.standardize(None), [])
+
+    def test_memoized(self):
+        utils.standardize(['named_thing', 'gene'])
+
+        with mock.patch.object(utils, 'normalize_categories') as normalize:
+            categories = utils.standardize(('named_thing', 'gene'))
+
+        normalize.assert_not_called()
+        self.assertEqual(categories, ['named thing', 'gene'])
+        self.assertIn(('named_thing', 'gene'), self.table)
+
+    def test_copies(self):
+        first = utils.standardize(['gene'])
+        first.append('protein')
+
+        self.assertEqual(utils.standardize(['gene']), ['gene'])
+        self.assertIsNot(utils.standardize(['gene']), utils.standardize(['gene']))
+        self.assertEqual(self.table[('gene',)], ('gene',))
+
+    def test_size_bound(self):
+        with mock.patch.object(utils, 'CATEGORY_TABLE_SIZE', 2):
+            for category in ['a_1', 'b_2', 'c_3', 'd_4']:
+                self.assertEqual(utils.standardize(category), [category.replace('_', ' ')])
+
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(utils.standardize('c_3'), ['c 3'])
+
+    def test_unhashable(self):
+        categories = utils.standardize([['gene'], 'named_thing'])
+
+        self.assertEqual(categories, ["['gene']", 'named thing'])
+        self.assertEqual(self.table, {})
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from beacon_controller.watcher import FileWatcher
+
+
+class TestFileWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'node_summary.txt')
+        self.write('first')
+        self.calls = 0
+        self.failures = 0
+        self.watcher = FileWatcher(interval=0)
+        self.watcher.watch([self.path], self.callback)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def callback(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise IOError('Half written')
+        self.calls += 1
+
+    def test_unchanged(self):
+        self.watcher.check()
+        self.watcher.check()
+
+        self.assertEqual(self.calls, 0)
+
+    def test_waits_until_stable(self):
+        self.write('second')
+        self.watcher.check()
+        self.assertEqual(self.calls, 0)
+
+        self.watcher.check()
+        self.assertEqual(self.calls, 1)
+
+        self.watcher.check()
+        self.assertEqual(self.calls, 1)
+
+    def test_still_changing(self):
+        self.write('second')
+        self.watcher.check()
+        self.write('second, still being copied')
+        self.watcher.check()
+        self.assertEqual(self.calls, 0)
+
+        self.watcher.check()
+        self.assertEqual(self.calls, 1)
+
+    def test_changed_back(self):
+        stat = os.stat(self.path)
+        self.write('other')
+        self.watcher.check()
+        self.write('first')
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.watcher.check()
+        self.watcher.check()
+
+        self.assertEqual(self.calls, 0)
+
+    def test_retry_failed_callback(self):
+        self.failures = 1
+        self.write('second')
+        self.watcher.check()
+        self.watcher.check()
+        self.assertEqual(self.calls, 0)
+
+        self.watcher.check()
+        self.assertEqual(self.calls, 1)
+        self.watcher.check()
+        self.assertEqual(self.calls, 1)
+
+    def test_created_and_removed(self):
+        os.remove(self.path)
+        self.watcher.check()
+        self.watcher.check()
+        self.assertEqual(self.calls, 1)
+
+        self.write('again')
+        self.watcher.check()
+        self.watcher.check()
+        self.assertEqual(self.calls, 2)
+
+    def test_not_started_without_interval(self):
+        self.watcher.start()
+
+        self.assertIsNone(self.watcher._thread)
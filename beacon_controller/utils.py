@@ -1,37 +1,95 @@
-from functools import lru_cache
-from beacon_controller import config
+from beacon_controller import config, summaries
+from beacon_controller import biolink_model as blm
+from beacon_controller.watcher import watcher
+from beacon_controller.singleflight import initializers
 
+import os
+import time
 import logging
+import threading
 
 logger = logging.getLogger(__file__)
 
+__prefix_map = None
 
-@lru_cache()
-def prefix_map():
-    """
-    Returns a dictionary that maps lowercase prefixs to the case of prefixes
-    as they appear in the database. Can be used to correct the case of an
-    identifier.
-    """
-    from beacon_controller import database as db
-    q="MATCH (x) RETURN  DISTINCT split(x.id, ':')[0] AS prefix"
-    results = db.query(q)
+# Upper bound on the number of distinct category lists that are memoized
+CATEGORY_TABLE_SIZE = 100000
 
-    d = {}
-    for result in results:
-        prefix = result['prefix']
+__category_table = {}
 
-        if prefix in d:
-            logger.warn('Identifier prefix {} appears in the database with multiple cases'.format(prefix))
 
+def build_prefix_map(prefixes) -> dict:
+    d = {}
+    for prefix in prefixes:
         if isinstance(prefix, str):
+            if prefix.lower() in d and d[prefix.lower()] != prefix:
+                logger.warn('Identifier prefix {} appears in the database with multiple cases'.format(prefix))
             d[prefix.lower()] = prefix
         else:
             d[prefix] = prefix
-
     return d
 
 
+def load_prefix_map():
+    """
+    Loads the prefix registry from `prefixes.txt`, falling back on the prefixes
+    of the node summary. If neither exists then the registry is generated from
+    the database in the background, and in the meantime the map is empty.
+    """
+    global __prefix_map
+
+    if os.path.isfile(summaries.prefix_path):
+        rows = summaries.read_summary(summaries.prefix_path)
+    elif os.path.isfile(summaries.node_path):
+        rows = summaries.read_summary(summaries.node_path)
+    else:
+        rows = []
+        summaries.generate_in_background(generate_prefix_map)
+
+    __prefix_map = build_prefix_map(row['prefix'] for row in rows)
+
+
+def initialize_prefix_map():
+    # Another request may have loaded the map while this one was waiting
+    if __prefix_map is None:
+        load_prefix_map()
+
+
+def generate_prefix_map():
+    summaries.generate_prefix_summary()
+    load_prefix_map()
+
+
+def refresh_prefix_map(interval:float):
+    """
+    Regenerates the prefix registry from the database every `interval`
+    seconds, in a background thread.
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            if not summaries.generate_in_background(generate_prefix_map):
+                logger.info('Skipped refreshing the prefix registry, it is still being generated or recently failed')
+
+    if interval > 0:
+        threading.Thread(target=run, name='prefix-refresh', daemon=True).start()
+
+
+def prefix_map() -> dict:
+    """
+    Returns a dictionary that maps lowercase prefixs to the case of prefixes
+    as they appear in the database. Can be used to correct the case of an
+    identifier. The map is loaded from the prefix registry, never from the
+    database, and is reloaded whenever the registry changes.
+    """
+    if __prefix_map is None:
+        initializers.do('prefix_map', initialize_prefix_map, label='prefix_map')
+    return __prefix_map
+
+
+watcher.watch([summaries.prefix_path, summaries.node_path], load_prefix_map)
+
+
 def fix_curie(curie: str) -> str:
     """
     The exact matches query is case sensitive. This method can be used to ensure
@@ -78,28 +136,21 @@ def remove_all(original_list:list, object_to_be_removed):
 def removeNonBiolinkCategories(old_categories: list):
     """
     Removes all non-Biolink compliant categories and returns the remaining list.
-    If all items are removed, then returns a list containing the default, " named thing"
+    If all items are removed, then returns a list containing the default, "named thing"
     """
-    # categories = list(filter(isBiolinkCategory, old_categories))
-    categories = [c for c in old_categories if isBiolinkCategory(c)]
+    categories = [c for c in old_categories if blm.is_class(c)]
     if not categories:
         #categories is empty
-        categories.append(" named thing")
+        categories.append(blm.DEFAULT_CATEGORY)
 
     return categories
 
 
-def standardize(categories):
+def normalize_categories(categories: tuple) -> list:
     """
-    Converts categories into a list if not already
-    Also removes all non-Biolink categories if filter_biolink setting is set to True
+    Removes underscores from categories, and also removes all non-Biolink
+    categories if filter_biolink setting is set to True
     """
-    if categories is None:
-        categories = []
-    if not isinstance(categories, (list, set, tuple)):
-        categories = [categories]
-
-    # categories should not have underscores in their strings
     categories = [str(c).replace("_"," ") for c in categories]
 
     filter_biolink = config['filter_biolink']
@@ -108,6 +159,53 @@ def standardize(categories):
     return categories
 
 
+def standardize(categories):
+    """
+    Converts categories into a list if not already
+    Also removes all non-Biolink categories if filter_biolink setting is set to True
+
+    Normalized categories are memoized, so after the first time that a given
+    list of categories has been seen this is a dictionary lookup and a copy.
+    The table holds tuples, and each caller gets its own list, since the
+    lists end up in models that may be modified.
+    """
+    if categories is None:
+        key = ()
+    elif isinstance(categories, (list, set, tuple)):
+        key = tuple(categories)
+    else:
+        key = (categories,)
+
+    try:
+        return list(__category_table[key])
+    except KeyError:
+        normalized = normalize_categories(key)
+        if len(__category_table) < CATEGORY_TABLE_SIZE:
+            __category_table[key] = tuple(normalized)
+        return normalized
+    except TypeError:
+        # Unhashable categories, e.g. nested lists
+        return normalize_categories(key)
+
+
+def build_category_table():
+    """
+    Fills the category table with every category that appears in the node and
+    edge summaries. Nodes with several categories are filled in lazily.
+    """
+    categories = set()
+    if os.path.isfile(summaries.node_path):
+        categories.update(row['category'] for row in summaries.read_summary(summaries.node_path))
+    if os.path.isfile(summaries.edge_path):
+        for row in summaries.read_summary(summaries.edge_path):
+            categories.add(row['subject_category'])
+            categories.add(row['object_category'])
+
+    for category in categories:
+        if isinstance(category, str):
+            standardize(category)
+
+
 def stringify(s):
     """
     Turns s into a semicolon separated string if s is a list
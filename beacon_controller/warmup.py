@@ -0,0 +1,78 @@
+"""
+Populates the beacon's lazily built caches in background threads when the
+server starts, so that the first requests do not have to pay for them (and
+several concurrent first requests do not all pay for them at once).
+"""
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__file__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Task(object):
+    def __init__(self, name:str, function):
+        self.name = name
+        self.function = function
+        self.state = PENDING
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    def run(self):
+        self.started = time.time()
+        self.state = RUNNING
+        try:
+            self.function()
+            self.state = DONE
+            logger.info('Warmed up {} in {:.1f}s'.format(self.name, time.time() - self.started))
+        except Exception as e:
+            self.error = str(e)
+            self.state = FAILED
+            logger.exception('Failed to warm up {}'.format(self.name))
+        finally:
+            self.finished = time.time()
+
+    def status(self) -> dict:
+        d = {'state': self.state}
+        if self.started is not None:
+            d['seconds'] = round((self.finished or time.time()) - self.started, 3)
+        if self.error is not None:
+            d['error'] = self.error
+        return d
+
+
+class WarmUp(object):
+    """
+    A set of warm-up tasks, each run in its own daemon thread. Warm-up has
+    finished once every task has either succeeded or failed, a failed task
+    just means that its cache will be populated by the first request that
+    needs it.
+    """
+    def __init__(self):
+        self.tasks = []
+
+    def add(self, name:str, function):
+        self.tasks.append(Task(name, function))
+
+    def start(self):
+        for task in self.tasks:
+            threading.Thread(target=task.run, name=f'warm-up-{task.name}', daemon=True).start()
+
+    @property
+    def finished(self) -> bool:
+        return all(task.state in (DONE, FAILED) for task in self.tasks)
+
+    def status(self) -> dict:
+        return {
+            'ready': self.finished,
+            'tasks': {task.name: task.status() for task in self.tasks}
+        }
+
+
+warmup = WarmUp()
@@ -0,0 +1,86 @@
+"""
+Polls files for changes in a background thread, so that data files dropped
+into place while the beacon is running are picked up without a restart.
+
+Usage:
+
+    from beacon_controller.watcher import watcher
+    watcher.watch([path], callback)
+    watcher.start()
+"""
+import os
+import time
+import logging
+import threading
+
+from beacon_controller import config
+
+logger = logging.getLogger(__file__)
+
+
+def signature(paths:list) -> tuple:
+    """
+    Modification time and size of each path, or None if it does not exist
+    """
+    result = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            result.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            result.append(None)
+    return tuple(result)
+
+
+class Watch(object):
+    def __init__(self, paths:list, callback):
+        self.paths = paths
+        self.callback = callback
+        self.signature = signature(paths)
+        self.pending = None
+
+
+class FileWatcher(object):
+    """
+    Calls back whenever any of a group of watched files changes. A change is
+    only acted on once the files have stopped changing for one polling
+    interval, so that a summary that is still being copied into place is not
+    read half written. If the callback fails then it is retried on the next
+    poll.
+    """
+    def __init__(self, interval:float):
+        self.interval = interval
+        self.watches = []
+        self._thread = None
+
+    def watch(self, paths:list, callback):
+        self.watches.append(Watch(paths, callback))
+
+    def check(self):
+        for watch in self.watches:
+            current = signature(watch.paths)
+            if current == watch.signature:
+                watch.pending = None
+            elif current != watch.pending:
+                watch.pending = current
+            else:
+                try:
+                    watch.callback()
+                    watch.signature = current
+                    watch.pending = None
+                except Exception:
+                    logger.exception('Failed to reload {}'.format(', '.join(watch.paths)))
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self.run, name='file-watcher', daemon=True)
+            self._thread.start()
+
+
+# Seconds between checks of the data files, or 0 to disable reloading
+watcher = FileWatcher(interval=config.get('reload_interval', 10))
@@ -0,0 +1,113 @@
+"""
+Measures the latency of /concepts queries filtered by keywords, categories
+and prefixes over a synthetic graph of `--nodes` nodes, served from the
+columnar node table of a snapshot:
+
+    python benchmarks/concept_filters.py --nodes 1000000
+
+With `--neo4j`, the same nodes are also loaded into the database configured
+in config/config.yaml (which should be an empty, disposable one) and the same
+queries are timed through the Cypher of the neo4j backend. Neo4j has no
+prefix filter, so queries with one are only run against the snapshot.
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+CATEGORIES = ['gene', 'protein', 'disease', 'phenotypic_feature', 'chemical_substance', 'anatomical_entity', 'cell', 'pathway']
+PREFIXES = ['HGNC', 'NCBIGene', 'UniProtKB', 'MONDO', 'HP', 'CHEBI', 'UBERON', 'CL', 'REACT']
+WORDS = ['alpha', 'beta', 'kinase', 'receptor', 'syndrome', 'acid', 'protein', 'factor', 'domain', 'binding', 'cancer', 'type']
+
+QUERIES = [
+    dict(keywords=['kinase']),
+    dict(keywords=['kinase', 'receptor']),
+    dict(categories=['disease']),
+    dict(keywords=['syndrome'], categories=['disease']),
+    dict(keywords=['acid'], categories=['chemical_substance', 'pathway']),
+    dict(keywords=['beta'], prefixes=['CHEBI']),
+    dict(keywords=['alpha'], categories=['gene'], prefixes=['HGNC']),
+    dict(keywords=['zzz']),
+]
+
+
+def generate(path:str, n:int, seed:int=0):
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('id\tname\tcategory\tsynonym\n')
+        for i in range(n):
+            name = ' '.join(rng.choice(WORDS) for _ in range(3)) + ' {}'.format(i)
+            synonym = '{}{}'.format(rng.choice(WORDS), i) if rng.random() < 0.3 else ''
+            f.write('{}:{}\t{}\t{}\t{}\n'.format(rng.choice(PREFIXES), i, name, rng.choice(CATEGORIES), synonym))
+
+
+def load_neo4j(path:str, batch_size:int=10000):
+    import beacon_controller.database as db
+    from beacon_controller.backends import kgx
+
+    batches = {}
+    for node in kgx.iter_tsv(path):
+        category = node['category'][0]
+        batch = batches.setdefault(category, [])
+        batch.append(node)
+        if len(batch) >= batch_size:
+            db.query('UNWIND $nodes AS node CREATE (n:`{}`) SET n = node'.format(category), nodes=batch)
+            batches[category] = []
+    for category, batch in batches.items():
+        db.query('UNWIND $nodes AS node CREATE (n:`{}`) SET n = node'.format(category), nodes=batch)
+
+
+def measure(backend, query:dict, repeat:int) -> tuple:
+    latencies = []
+    for _ in range(repeat):
+        # Measure the keyword matching of the snapshot, not its cache
+        if hasattr(backend, 'table'):
+            backend.table.keyword_nodes.cache_clear()
+        start = time.perf_counter()
+        rows = list(backend.concepts(size=100, **query))
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000, len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--directory', help='Where to write the synthetic graph and its snapshot (default: a temporary directory)')
+    parser.add_argument('--neo4j', action='store_true', help='Also load the graph into Neo4j and time the Cypher queries')
+    args = parser.parse_args()
+
+    from beacon_controller.backends import snapshot_backend
+
+    directory = args.directory or tempfile.mkdtemp()
+    nodes_path = os.path.join(directory, 'nodes.tsv')
+    snapshot_path = os.path.join(directory, 'snapshot')
+
+    start = time.perf_counter()
+    generate(nodes_path, args.nodes)
+    snapshot_backend.build(snapshot_path, [nodes_path], [])
+    print('generated and built a snapshot of {} nodes in {:.1f}s'.format(args.nodes, time.perf_counter() - start))
+
+    backends = [('snapshot', snapshot_backend.SnapshotBackend(snapshot_path))]
+
+    if args.neo4j:
+        from beacon_controller.backends import Neo4jBackend
+        start = time.perf_counter()
+        load_neo4j(nodes_path)
+        print('loaded Neo4j in {:.1f}s'.format(time.perf_counter() - start))
+        backends.append(('cypher', Neo4jBackend()))
+
+    for query in QUERIES:
+        for name, backend in backends:
+            if name == 'cypher' and 'prefixes' in query:
+                continue
+            # The first run warms the page cache and Neo4j's
+            measure(backend, query, 1)
+            latency, rows = measure(backend, query, args.repeat)
+            print('{:8} {:70} {:8.1f} ms ({} rows)'.format(name, str(query), latency, rows))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Measures the client side CPU time per row of the /concepts query, when each
+node is inflated into a neomodel Node and when only the needed properties are
+projected, against the database configured in config/config.yaml:
+
+    python benchmarks/concept_rows.py --keyword gene --size 1000
+"""
+import time
+import argparse
+
+import beacon_controller.database as db
+from beacon_controller.database import Node
+
+
+def measure(q, inflator, repeat, **kwargs):
+    rows, cpu = 0, 0.0
+    for _ in range(repeat):
+        start = time.process_time()
+        for row in db.stream(q, inflator, endpoint='concepts', **kwargs):
+            if inflator is not None:
+                row = (row.curie, row.name, row.category, row.description)
+            rows += 1
+        cpu += time.process_time() - start
+    return cpu / rows * 1e6 if rows else float('nan'), rows // repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keyword', default='a')
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    match = "UNWIND [x IN $keywords | toLower(x)] AS keyword MATCH (n) WHERE toLower(n.name) CONTAINS keyword"
+    limit = f" LIMIT {args.size}"
+
+    inflated, rows = measure(match + " RETURN n" + limit, Node, args.repeat, keywords=[args.keyword])
+    print(f'inflated Node: {inflated:8.2f} us/row ({rows} rows)')
+
+    projection = " RETURN n.id AS id, n.name AS name, n.category AS category, n.description AS description"
+    projected, rows = measure(match + projection + limit, None, args.repeat, keywords=[args.keyword])
+    print(f'projection:    {projected:8.2f} us/row ({rows} rows)')
+
+
+if __name__ == '__main__':
+    main()
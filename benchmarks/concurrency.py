@@ -0,0 +1,137 @@
+"""
+Measures the throughput of the tornado server of beacon_controller.server for
+a number of threads and worker processes, with a stand-in WSGI app whose
+requests wait `--latency` milliseconds (as if on Neo4j) and then burn `--cpu`
+milliseconds of CPU (as if building the response):
+
+    python benchmarks/concurrency.py --threads 1 4 16 --processes 1 2
+
+Alternatively, with `--url`, only sends the concurrent requests to a beacon
+that is already running, e.g. to compare configurations of config.yaml:
+
+    python benchmarks/concurrency.py --url http://localhost:8080/beacon/x/statements?s=HGNC:1
+"""
+import os
+import time
+import signal
+import socket
+import argparse
+import multiprocessing
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def stand_in_app(latency:float, cpu:float):
+    def app(environ, start_response):
+        time.sleep(latency)
+        end = time.process_time() + cpu
+        while time.process_time() < end:
+            pass
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        return [b'[]']
+    return app
+
+
+def run_server(port:int, threads:int, processes:int, latency:float, cpu:float):
+    # Lead a process group of its own, so that the workers that server.fork
+    # forks can be stopped along with it
+    os.setsid()
+
+    from beacon_controller import server
+    sockets = server.fork(port, processes=processes)
+    server.serve(stand_in_app(latency, cpu), sockets, threads=threads)
+
+
+def stop_server(process:multiprocessing.Process, timeout:float=10):
+    """
+    Stops the server's process group, i.e. the process and every worker it
+    forked, which would otherwise be orphaned and keep serving the port
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    process.join(timeout)
+    if process.is_alive():
+        process.kill()
+
+    end = time.time() + timeout
+    while True:
+        try:
+            os.killpg(process.pid, 0)
+        except ProcessLookupError:
+            return
+        if time.time() > end:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        time.sleep(0.05)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url:str, timeout:float=10):
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            urllib.request.urlopen(url).read()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f'{url} did not respond')
+
+
+def load(url:str, clients:int, requests:int) -> float:
+    """
+    Sends `requests` requests from `clients` concurrent clients, and returns
+    the number of requests completed per second
+    """
+    def get(_):
+        urllib.request.urlopen(url).read()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        list(executor.map(get, range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--latency', type=float, default=50, help='milliseconds')
+    parser.add_argument('--cpu', type=float, default=2, help='milliseconds')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--url')
+    args = parser.parse_args()
+
+    if args.url is not None:
+        rate = load(args.url, args.clients, args.requests)
+        print(f'{args.url}: {rate:8.1f} requests/s')
+        return
+
+    for processes in args.processes:
+        for threads in args.threads:
+            port = free_port()
+            process = multiprocessing.Process(
+                target=run_server,
+                args=(port, threads, processes, args.latency / 1000, args.cpu / 1000),
+                daemon=True
+            )
+            process.start()
+            try:
+                url = f'http://localhost:{port}/'
+                wait_for(url)
+                rate = load(url, args.clients, args.requests)
+                print(f'processes={processes:<3} threads={threads:<4} {rate:8.1f} requests/s')
+            finally:
+                stop_server(process)
+
+
+if __name__ == '__main__':
+    main()
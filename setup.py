@@ -6,19 +6,24 @@ setup(
     version="1.3.1",
     packages=[
         'beacon_controller',
+        'beacon_controller.backends',
         'beacon_controller.controllers',
         'beacon_controller.database',
         'config',
         'data'
     ],
     include_package_data=True,
+    python_requires='>=3.11',
     install_requires=[
         'bmt',
         'biolinkml',
-        'neomodel',
+        # 6.0 and 6.1 depend on neo4j 5.28, and later releases on neo4j 6.1
+        'neomodel >= 6.0, < 8',
+        # Speaks Bolt 4.4 and 5, so requires Neo4j 4.4 or later
+        'neo4j >= 5.0, < 7',
         'pandas',
         'cachetools',
-        'tornado',
+        'tornado >= 6.3',
         'requests >= 2.22',
         'flask',
         'pyyaml',
@@ -26,5 +31,12 @@ setup(
         'python_dateutil == 2.6.1',
         'setuptools >= 21.0.0',
         'prefixcommons',
-    ]
+    ],
+    extras_require={
+        'aiohttp': ['aiohttp'],
+        'snapshot': ['numpy'],
+    },
+    entry_points={
+        'console_scripts': ['tkg-beacon=beacon_controller.cli:main']
+    }
 )